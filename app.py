@@ -1,41 +1,256 @@
+from datetime import datetime
 from os import environ
-from flask import Flask, jsonify, make_response, request
-from models import Exercise, User, Workout, WorkoutExercise, db
-
-app = Flask(__name__)
-DATABASE_URL = (
-    f"postgresql+psycopg2://{environ.get('POSTGRES_USER')}:"
-    f"{environ.get('POSTGRES_PASSWORD')}@{environ.get('POSTGRES_HOST')}:"
-    f"{environ.get('POSTGRES_PORT')}/{environ.get('POSTGRES_DB')}"
+from uuid import uuid4
+import click
+from flask import (
+    Blueprint,
+    Flask,
+    current_app,
+    jsonify,
+    make_response,
+    request,
+    send_from_directory,
 )
-print(DATABASE_URL)
-app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URL
-db.init_app(app)
+from flask.cli import with_appcontext
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.orm import joinedload, selectinload
+from archive import archive_cli, archived_exercises_of, full_workout_json
+from batch import (
+    BatchRejected,
+    apply_operations,
+    insert_workout_exercises,
+    parse_uuid,
+    prepare_workout_exercises,
+)
+from cache import exercise_cache, query_key
+from changes import changes_cli, changes_since, parse_since
+from clone import (
+    InvalidClone,
+    clone_workout,
+    parse_clone_request,
+    start_template,
+    template_from_workout,
+)
+from conditional import (
+    exercise_versions,
+    not_modified,
+    not_modified_response,
+    user_versions,
+    validators,
+    with_validators,
+    workout_exercise_versions,
+    workout_versions,
+)
+from filters import (
+    EXERCISE_SORTS,
+    WORKOUT_SORTS,
+    InvalidFilter,
+    exercise_filters,
+    parse_sort,
+    parse_uuid_arg,
+    workout_exercise_filters,
+    workout_filters,
+)
+from idempotency import idempotency_cli, idempotent
+from instrumentation import instrumentation
+from jobs import DEFAULT_INLINE_ROWS, export_dir, jobs_cli, submit
+from models import (
+    Exercise,
+    Job,
+    TemplateExercise,
+    User,
+    Workout,
+    WorkoutExercise,
+    WorkoutTemplate,
+    db,
+)
+from pagination import InvalidPageRequest, decode_cursor, encode_cursor, parse_limit
+from partitions import partitions_cli
+from ratelimit import rate_limiter
+from replicas import replica_router
+from search import find_exercises
+from serialization import (
+    FastJSONProvider,
+    exercise_json,
+    exercise_select,
+    user_json,
+    user_select,
+    workout_exercise_json,
+    workout_exercise_select,
+    workout_exercises_of,
+    workout_select,
+    workouts_json,
+)
+from stats import user_stats
+from summary import amounts, summary_cli
+from streaming import NDJSON_MIMETYPE, ndjson_response, wants_stream
+
+api = Blueprint("api", __name__)
+
+
+def database_url(host=None, port=None):
+    return (
+        f"postgresql+psycopg2://{environ.get('POSTGRES_USER')}:"
+        f"{environ.get('POSTGRES_PASSWORD')}@{host or environ.get('POSTGRES_HOST')}:"
+        f"{port or environ.get('POSTGRES_PORT')}/{environ.get('POSTGRES_DB')}"
+    )
+
+
+def replica_binds():
+    """
+    Binds of the read replicas in POSTGRES_REPLICA_HOSTS, a comma-separated list of
+    `host` or `host:port`, with the primary's credentials and pool settings.
+    """
+    hosts = environ.get("POSTGRES_REPLICA_HOSTS", "").split(",")
+    binds = {}
+    for i, host in enumerate(filter(None, map(str.strip, hosts)), 1):
+        host, _, port = host.partition(":")
+        binds[f"replica_{i}"] = {"url": database_url(host, port), **engine_options()}
+    return binds
+
+
+def engine_options():
+    """
+    Connection pool settings, read from `DB_POOL_*` environment variables.
 
-with app.app_context():
+    Every server process holds its own pool, so the database has to accept
+    processes x (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections.
+    """
+    return {
+        "pool_size": int(environ.get("DB_POOL_SIZE", 5)),
+        "max_overflow": int(environ.get("DB_MAX_OVERFLOW", 10)),
+        "pool_pre_ping": environ.get("DB_POOL_PRE_PING", "1") == "1",
+        "pool_recycle": int(environ.get("DB_POOL_RECYCLE", 1800)),
+    }
+
+
+def create_app(config=None):
+    """
+    Creates the Flask application without touching the database.
+
+    Connections are opened on the first request; the schema is created with
+    `flask init-db`.
+
+    The defaults above can be overridden with `FITAPP_`-prefixed environment
+    variables (e.g. `FITAPP_SQLALCHEMY_ENGINE_OPTIONS='{"pool_size": 20}'`) and
+    then with the `config` mapping. Binds named `replica*` serve the reads of GET
+    requests, see replicas.py.
+    """
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = database_url()
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options()
+    app.config["SQLALCHEMY_BINDS"] = replica_binds()
+    app.config.from_prefixed_env("FITAPP")
+    if config:
+        app.config.update(config)
+    app.json = FastJSONProvider(app)
+    db.init_app(app)
+    exercise_cache.init_app(app)
+    instrumentation.init_app(app)
+    rate_limiter.init_app(app)
+    replica_router.init_app(app)
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(summary_cli)
+    app.cli.add_command(idempotency_cli)
+    app.cli.add_command(changes_cli)
+    app.cli.add_command(partitions_cli)
+    app.cli.add_command(archive_cli)
+    app.cli.add_command(jobs_cli)
+    app.register_blueprint(api)
+    return app
+
+
+@click.command("init-db")
+@with_appcontext
+def init_db_command():
+    """Create the tables and indexes that do not exist yet."""
     db.create_all()
+    # create_all skips the indexes of tables that already exist
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+    click.echo("database initialized")
 
 
-@app.route("/")
+@api.route("/")
 def hello_world():
     return "Im here!"
 
 
+@api.route("/cache/stats")
+def get_cache_stats():
+    return make_response(jsonify({"exercises": exercise_cache.stats()}), 200)
+
+
 # Exercises' endpoints
-@app.route("/exercises", methods=["GET"])
+@api.route("/exercises", methods=["GET"])
 def get_exercises():
     try:
-        exercises = Exercise.query.all()
-        return make_response(
-            jsonify([exercise.make_json() for exercise in exercises]), 200
+        column, descending = parse_sort(request.args, EXERCISE_SORTS, "name")
+        criteria = exercise_filters(request.args)
+        order = [column.desc() if descending else column, Exercise.id]
+        query = (
+            Exercise.query.options(joinedload(Exercise.creator))
+            .filter(*criteria)
+            .order_by(*order)
         )
+        if wants_stream():
+            return ndjson_response(query)
+        # Writes invalidate the cache, so a hit needs no database round trip and
+        # the version query only runs on a miss
+        key = query_key(request.args)
+        entry = exercise_cache.lookup(key)
+        if entry is None:
+            etag, _ = validators(
+                db.session.execute(exercise_versions(criteria)), dated=False
+            )
+            if not_modified(etag, None):
+                return not_modified_response(etag, None)
+            statement = exercise_select().where(*criteria).order_by(*order)
+            rows = db.session.execute(statement)
+            payload = jsonify([exercise_json(row) for row in rows]).get_data()
+            entry = exercise_cache.store(key, payload, etag)
+        payload, etag = entry
+        if not_modified(etag, None):
+            return not_modified_response(etag, None)
+        response = make_response(payload, 200)
+        response.mimetype = "application/json"
+        return with_validators(response, etag, None)
+    except InvalidFilter as e:
+        return make_response(jsonify({"message": str(e)}), 400)
     except Exception as e:
         return make_response(
             jsonify({"message": "error getting exercises", "error": str(e)}), 500
         )
 
 
-@app.route("/exercises", methods=["POST"])
+@api.route("/exercises/search", methods=["GET"])
+def search_exercises():
+    try:
+        criteria = exercise_filters(request.args)
+        limit = parse_limit(request.args.get("limit"))
+        rows, next_cursor = find_exercises(
+            request.args.get("q", ""), criteria, limit, request.args.get("after")
+        )
+        return make_response(
+            jsonify(
+                {
+                    "exercises": [exercise_json(row) for row in rows],
+                    "next_cursor": next_cursor,
+                }
+            ),
+            200,
+        )
+    except (InvalidFilter, InvalidPageRequest) as e:
+        return make_response(jsonify({"message": str(e)}), 400)
+    except Exception as e:
+        return make_response(
+            jsonify({"message": "error searching exercises", "error": str(e)}), 500
+        )
+
+
+@api.route("/exercises", methods=["POST"])
+@idempotent
 def create_exercise():
     try:
         data = request.get_json()
@@ -61,6 +276,7 @@ def create_exercise():
         )
         db.session.add(exercise)
         db.session.commit()
+        exercise_cache.invalidate()
         return make_response(jsonify({"message": "exercise created successfully"}), 201)
     except Exception as e:
         return make_response(
@@ -68,7 +284,7 @@ def create_exercise():
         )
 
 
-@app.route("/exercises/<uuid:id>", methods=["PUT", "DELETE"])
+@api.route("/exercises/<uuid:id>", methods=["PUT", "DELETE"])
 def modify_exercise(id):
     try:
         exercise = Exercise.query.get(id)
@@ -76,6 +292,7 @@ def modify_exercise(id):
             if request.method == "DELETE":
                 db.session.delete(exercise)
                 db.session.commit()
+                exercise_cache.invalidate()
                 return make_response(
                     jsonify({"message": f"exercise {id} deleted"}), 200
                 )
@@ -90,6 +307,7 @@ def modify_exercise(id):
                 if "custom_made" in data:
                     exercise.custom_made = data["custom_made"]
                 db.session.commit()
+                exercise_cache.invalidate()
                 return make_response(
                     jsonify({"message": f"exercise {id} updated"}), 200
                 )
@@ -101,18 +319,30 @@ def modify_exercise(id):
 
 
 # Users' endpoints
-@app.route("/users", methods=["GET"])
+@api.route("/users", methods=["GET"])
 def get_users():
     try:
-        users = User.query.all()
-        return make_response(jsonify([user.make_json() for user in users]), 200)
+        if wants_stream():
+            return ndjson_response(User.query)
+        etag, last_modified = validators(
+            db.session.execute(user_versions()), dated=False
+        )
+        if not_modified(etag, last_modified):
+            return not_modified_response(etag, last_modified)
+        users = db.session.execute(user_select())
+        return with_validators(
+            make_response(jsonify([user_json(row) for row in users]), 200),
+            etag,
+            last_modified,
+        )
     except Exception as e:
         return make_response(
             jsonify({"message": "error getting users", "error": str(e)}), 500
         )
 
 
-@app.route("/users", methods=["POST"])
+@api.route("/users", methods=["POST"])
+@idempotent
 def create_user():
     try:
         data = request.get_json()
@@ -132,15 +362,14 @@ def create_user():
         )
 
 
-@app.route("/users/<uuid:id>", methods=["PUT", "DELETE"])
+@api.route("/users/<uuid:id>", methods=["PUT", "DELETE"])
 def modify_user(id):
     try:
         user = User.query.get(id)
         if user:
             if request.method == "DELETE":
-                db.session.delete(user)
-                db.session.commit()
-                return make_response(jsonify({"message": f"user {id} deleted"}), 200)
+                job = submit("delete_user", {"user_id": str(id)}, f"delete_user:{id}")
+                return job_response(job)
             if request.method == "PUT":
                 data = request.get_json()
                 if "username" in data:
@@ -150,6 +379,8 @@ def modify_user(id):
                 if "email" in data:
                     user.email = data["email"]
                 db.session.commit()
+                # Exercises show their creator's username
+                exercise_cache.invalidate()
                 return make_response(jsonify({"message": f"user {id} updated"}), 200)
         return make_response(jsonify({"message": "user not found"}), 404)
     except Exception as e:
@@ -158,40 +389,112 @@ def modify_user(id):
         )
 
 
+@api.route("/users/<uuid:id>/stats", methods=["GET"])
+def get_user_stats(id):
+    try:
+        if not User.query.get(id):
+            return make_response(jsonify({"message": "user not found"}), 404)
+        return make_response(jsonify(user_stats(db.session, id, request.args)), 200)
+    except InvalidFilter as e:
+        return make_response(jsonify({"message": str(e)}), 400)
+    except Exception as e:
+        return make_response(
+            jsonify({"message": f"error getting stats of user {id}", "error": str(e)}),
+            500,
+        )
+
+
 # Workouts' endpoints
-@app.route("/workouts", methods=["GET"])
+@api.route("/workouts", methods=["GET"])
 def get_workouts():
     try:
-        workouts = Workout.query.all()
-        return make_response(
-            jsonify([workout.make_json() for workout in workouts]), 200
+        _, descending = parse_sort(request.args, WORKOUT_SORTS, "created_at")
+        key = tuple_(Workout.created_at, Workout.id)
+        order = [Workout.created_at, Workout.id]
+        if descending:
+            order = [column.desc() for column in order]
+        criteria = workout_filters(request.args)
+        if "after" in request.args:
+            cursor = decode_cursor(request.args["after"])
+            criteria.append(key < cursor if descending else key > cursor)
+        query = (
+            Workout.query.options(
+                joinedload(Workout.user), selectinload(Workout.workout_exercises)
+            )
+            .filter(*criteria)
+            .order_by(*order)
+        )
+        if wants_stream():
+            return ndjson_response(query, serialize=full_workout_json)
+        limit = parse_limit(request.args.get("limit"))
+        # One extra row tells us whether another page follows
+        page = select(Workout.id).where(*criteria).order_by(*order).limit(limit + 1)
+        etag, last_modified = validators(
+            db.session.execute(workout_versions(page)), dated=False
         )
+        if not_modified(etag, last_modified):
+            return not_modified_response(etag, last_modified)
+        statement = workout_select().where(*criteria).order_by(*order)
+        workouts = db.session.execute(statement.limit(limit + 1)).all()
+        next_cursor = None
+        if len(workouts) > limit:
+            workouts = workouts[:limit]
+            next_cursor = encode_cursor(workouts[-1].created_at, workouts[-1].id)
+        exercises = db.session.execute(workout_exercises_of(workouts)).all()
+        exercises += archived_exercises_of(workouts)
+        response = make_response(
+            jsonify(
+                {
+                    "workouts": workouts_json(workouts, exercises),
+                    "next_cursor": next_cursor,
+                }
+            ),
+            200,
+        )
+        return with_validators(response, etag, last_modified)
+    except (InvalidFilter, InvalidPageRequest) as e:
+        return make_response(jsonify({"message": str(e)}), 400)
     except Exception as e:
         return make_response(
             jsonify({"message": "error getting workouts", "error": str(e)}), 500
         )
 
 
-@app.route("/workouts", methods=["POST"])
+@api.route("/workouts", methods=["POST"])
+@idempotent
 def create_workout():
     try:
         data = request.get_json()
         if "user_workout_id" not in data:
             return make_response(jsonify({"message": "user_workout_id required"}), 400)
-        user = User.query.get(data["user_workout_id"])
+        user_id = parse_uuid(data["user_workout_id"])
+        user = User.query.get(user_id) if user_id else None
         if not user:
             return make_response(jsonify({"message": "specified user not found"}), 404)
-        workout = Workout(user_workout_id=data["user_workout_id"])
+        workout = Workout(
+            id=uuid4(), user_workout_id=user_id, created_at=datetime.utcnow()
+        )
+        # A full workout may be sent together with its exercise list
+        rows = []
+        if "exercises" in data:
+            rows = prepare_workout_exercises(
+                data["exercises"], workout=(workout.id, workout.created_at)
+            )
         db.session.add(workout)
+        db.session.flush()
+        results = insert_workout_exercises(rows) if rows else []
         db.session.commit()
+        body = {
+            "message": "workout created successfully",
+            "workout": workout.make_json(),
+        }
+        if "exercises" in data:
+            body["results"] = results
+        return make_response(jsonify(body), 201)
+    except BatchRejected as e:
+        db.session.rollback()
         return make_response(
-            jsonify(
-                {
-                    "message": "workout created successfully",
-                    "workout": workout.make_json(),
-                }
-            ),
-            201,
+            jsonify({"message": "workout not created", "results": e.results}), e.status
         )
     except Exception as e:
         return make_response(
@@ -199,14 +502,40 @@ def create_workout():
         )
 
 
-@app.route("/workouts/<uuid:id>", methods=["GET", "PUT", "DELETE"])
+@api.route("/workouts/<uuid:id>", methods=["GET", "PUT", "DELETE"])
 def modify_workout(id):
     try:
         workout = Workout.query.get(id)
         if workout:
             if request.method == "GET":
-                return make_response(jsonify(workout.make_json()), 200)
+                versions = workout_versions(select(Workout.id).where(Workout.id == id))
+                etag, last_modified = validators(db.session.execute(versions))
+                if not_modified(etag, last_modified):
+                    return not_modified_response(etag, last_modified)
+                return with_validators(
+                    make_response(jsonify(full_workout_json(workout)), 200),
+                    etag,
+                    last_modified,
+                )
             if request.method == "DELETE":
+                if workout.archived:
+                    return make_response(
+                        jsonify({"message": "workout is archived"}), 409
+                    )
+                inline = current_app.config.get("JOBS_INLINE_ROWS", DEFAULT_INLINE_ROWS)
+                exercises = db.session.scalar(
+                    select(func.count()).where(
+                        WorkoutExercise.workout_id == id,
+                        WorkoutExercise.workout_created_at == workout.created_at,
+                    )
+                )
+                if exercises > inline:
+                    job = submit(
+                        "delete_workout",
+                        {"workout_id": str(id)},
+                        f"delete_workout:{id}",
+                    )
+                    return job_response(job)
                 db.session.delete(workout)
                 db.session.commit()
                 return make_response(jsonify({"message": f"workout {id} deleted"}), 200)
@@ -221,17 +550,238 @@ def modify_workout(id):
         )
 
 
-@app.route("/workouts_exercises", methods=["POST"])
+def created_workout_response(workout):
+    """Answers a clone request like create_workout, with the workout as GET shows it."""
+    data = full_workout_json(Workout.query.get(workout["id"]))
+    return make_response(
+        jsonify({"message": "workout created successfully", "workout": data}), 201
+    )
+
+
+@api.route("/workouts/<uuid:id>/clone", methods=["POST"])
+@idempotent
+def copy_workout(id):
+    try:
+        source = db.session.execute(
+            workout_select().where(Workout.id == id)
+        ).one_or_none()
+        if not source:
+            return make_response(jsonify({"message": "workout not found"}), 404)
+        if source.archived:
+            return make_response(jsonify({"message": "workout is archived"}), 409)
+        overload, created_at = parse_clone_request(request.get_json(silent=True))
+        workout, _ = clone_workout(db.session, source, overload, created_at)
+        db.session.commit()
+        return created_workout_response(workout)
+    except InvalidClone as e:
+        return make_response(jsonify({"message": str(e)}), 400)
+    except Exception as e:
+        return make_response(
+            jsonify({"message": f"error cloning workout {id}", "error": str(e)}), 500
+        )
+
+
+@api.route("/users/<uuid:id>/workouts/repeat", methods=["POST"])
+@idempotent
+def repeat_last_workout(id):
+    try:
+        source = db.session.execute(
+            workout_select()
+            .where(Workout.user_workout_id == id)
+            .order_by(Workout.created_at.desc())
+            .limit(1)
+        ).one_or_none()
+        if not source:
+            return make_response(jsonify({"message": "no workout to repeat"}), 404)
+        if source.archived:
+            return make_response(jsonify({"message": "workout is archived"}), 409)
+        overload, created_at = parse_clone_request(request.get_json(silent=True))
+        workout, _ = clone_workout(db.session, source, overload, created_at)
+        db.session.commit()
+        return created_workout_response(workout)
+    except InvalidClone as e:
+        return make_response(jsonify({"message": str(e)}), 400)
+    except Exception as e:
+        return make_response(
+            jsonify({"message": f"error repeating workout of {id}", "error": str(e)}),
+            500,
+        )
+
+
+# Templates' endpoints
+@api.route("/templates", methods=["GET"])
+def get_templates():
+    try:
+        user_id = parse_uuid_arg(request.args, "user")
+        if user_id is None:
+            return make_response(jsonify({"message": "user required"}), 400)
+        templates = (
+            WorkoutTemplate.query.options(selectinload(WorkoutTemplate.exercises))
+            .filter_by(user_id=user_id)
+            .order_by(WorkoutTemplate.name, WorkoutTemplate.id)
+        )
+        return make_response(jsonify([t.make_json() for t in templates]), 200)
+    except InvalidFilter as e:
+        return make_response(jsonify({"message": str(e)}), 400)
+    except Exception as e:
+        return make_response(
+            jsonify({"message": "error getting templates", "error": str(e)}), 500
+        )
+
+
+@api.route("/templates", methods=["POST"])
+@idempotent
+def create_template():
+    try:
+        data = request.get_json()
+        if not all(field in data for field in ["user_id", "name"]):
+            return make_response(jsonify({"message": "required fields missing"}), 400)
+        if ("exercises" in data) == ("workout_id" in data):
+            return make_response(
+                jsonify({"message": "either exercises or workout_id required"}), 400
+            )
+        user_id = parse_uuid(data["user_id"])
+        if not (user_id and db.session.get(User, user_id)):
+            return make_response(jsonify({"message": "specified user not found"}), 404)
+        template = WorkoutTemplate(id=uuid4(), user_id=user_id, name=data["name"])
+        if "workout_id" in data:
+            workout_id = parse_uuid(data["workout_id"])
+            workout = db.session.get(Workout, workout_id) if workout_id else None
+            if not workout:
+                return make_response(
+                    jsonify({"message": "specified workout not found"}), 404
+                )
+            if workout.archived:
+                return make_response(jsonify({"message": "workout is archived"}), 409)
+            db.session.add(template)
+            db.session.flush()
+            template_from_workout(db.session, template.id, workout)
+        else:
+            # Validated like the exercises of a new workout
+            rows = prepare_workout_exercises(
+                data["exercises"], workout=(template.id, None)
+            )
+            template.exercises = [
+                TemplateExercise(
+                    id=row["id"],
+                    exercise_id=row["exercise_id"],
+                    sets=row["sets"],
+                    repetitions=row["repetitions"],
+                    weights=row["weights"],
+                    duration=row["duration"],
+                )
+                for row in rows
+            ]
+            db.session.add(template)
+        db.session.commit()
+        return make_response(
+            jsonify(
+                {
+                    "message": "template created successfully",
+                    "template": template.make_json(),
+                }
+            ),
+            201,
+        )
+    except BatchRejected as e:
+        db.session.rollback()
+        return make_response(
+            jsonify({"message": "template not created", "results": e.results}),
+            e.status,
+        )
+    except Exception as e:
+        return make_response(
+            jsonify({"message": "error creating template", "error": str(e)}), 500
+        )
+
+
+@api.route("/templates/<uuid:id>", methods=["GET", "DELETE"])
+def modify_template(id):
+    try:
+        template = db.session.get(WorkoutTemplate, id)
+        if not template:
+            return make_response(jsonify({"message": "template not found"}), 404)
+        if request.method == "DELETE":
+            db.session.delete(template)
+            db.session.commit()
+            return make_response(jsonify({"message": f"template {id} deleted"}), 200)
+        return make_response(jsonify(template.make_json()), 200)
+    except Exception as e:
+        return make_response(
+            jsonify({"message": f"error modifying template {id}", "error": str(e)}),
+            500,
+        )
+
+
+@api.route("/templates/<uuid:id>/workouts", methods=["POST"])
+@idempotent
+def start_workout_from_template(id):
+    try:
+        template = db.session.get(WorkoutTemplate, id)
+        if not template:
+            return make_response(jsonify({"message": "template not found"}), 404)
+        overload, created_at = parse_clone_request(request.get_json(silent=True))
+        workout, _ = start_template(db.session, template, overload, created_at)
+        db.session.commit()
+        return created_workout_response(workout)
+    except InvalidClone as e:
+        return make_response(jsonify({"message": str(e)}), 400)
+    except Exception as e:
+        return make_response(
+            jsonify({"message": f"error starting template {id}", "error": str(e)}),
+            500,
+        )
+
+
+@api.route("/workouts_exercises", methods=["GET"])
+def get_workout_exercises():
+    try:
+        criteria = workout_exercise_filters(request.args)
+        query = WorkoutExercise.query.filter(*criteria).order_by(WorkoutExercise.id)
+        if wants_stream():
+            return ndjson_response(query)
+        etag, last_modified = validators(
+            db.session.execute(workout_exercise_versions(criteria)), dated=False
+        )
+        if not_modified(etag, last_modified):
+            return not_modified_response(etag, last_modified)
+        statement = workout_exercise_select().where(*criteria)
+        workout_exercises = db.session.execute(statement.order_by(WorkoutExercise.id))
+        return with_validators(
+            make_response(
+                jsonify([workout_exercise_json(row) for row in workout_exercises]),
+                200,
+            ),
+            etag,
+            last_modified,
+        )
+    except InvalidFilter as e:
+        return make_response(jsonify({"message": str(e)}), 400)
+    except Exception as e:
+        return make_response(
+            jsonify({"message": "error getting workout exercises", "error": str(e)}),
+            500,
+        )
+
+
+@api.route("/workouts_exercises", methods=["POST"])
+@idempotent
 def add_exercise_to_workout():
     try:
         data = request.get_json()
         if not all(field in data for field in ["workout_id", "exercise_id", "sets"]):
             return make_response(jsonify({"message": "required fields missing"}), 400)
+        try:
+            values = amounts(data)
+        except ValueError as e:
+            return make_response(jsonify({"message": str(e)}), 400)
         workout = Workout.query.get(data["workout_id"])
         if not workout:
             return make_response(
                 jsonify({"message": "specified workout not found"}), 404
             )
+        if workout.archived:
+            return make_response(jsonify({"message": "workout is archived"}), 409)
 
         exercise = Exercise.query.get(data["exercise_id"])
         if not exercise:
@@ -240,11 +790,9 @@ def add_exercise_to_workout():
             )
         workout_exercise = WorkoutExercise(
             workout_id=data["workout_id"],
+            workout_created_at=workout.created_at,
             exercise_id=data["exercise_id"],
-            sets=data["sets"],
-            repetitions=data.get("repetitions"),
-            weights=data.get("weights"),
-            duration=data.get("duration"),
+            **values,
         )
         db.session.add(workout_exercise)
         db.session.commit()
@@ -264,5 +812,133 @@ def add_exercise_to_workout():
         )
 
 
+@api.route("/workouts_exercises/batch", methods=["POST"])
+@idempotent
+def add_exercises_to_workouts():
+    try:
+        data = request.get_json()
+        if "workout_exercises" not in data:
+            return make_response(
+                jsonify({"message": "workout_exercises required"}), 400
+            )
+        rows = prepare_workout_exercises(data["workout_exercises"])
+        results = insert_workout_exercises(rows)
+        db.session.commit()
+        return make_response(
+            jsonify({"message": "exercises added to workouts", "results": results}), 201
+        )
+    except BatchRejected as e:
+        db.session.rollback()
+        return make_response(
+            jsonify({"message": "no exercises added", "results": e.results}), e.status
+        )
+    except Exception as e:
+        db.session.rollback()
+        return make_response(
+            jsonify({"message": "error adding exercises to workouts", "error": str(e)}),
+            500,
+        )
+
+
+@api.route("/changes", methods=["GET"])
+def get_changes():
+    try:
+        since = parse_since(request.args.get("since"))
+        limit = parse_limit(request.args.get("limit"))
+        changes, next_since, has_more = changes_since(since, limit)
+        return make_response(
+            jsonify({"changes": changes, "since": next_since, "has_more": has_more}),
+            200,
+        )
+    except InvalidPageRequest as e:
+        return make_response(jsonify({"message": str(e)}), 400)
+    except Exception as e:
+        return make_response(
+            jsonify({"message": "error getting changes", "error": str(e)}), 500
+        )
+
+
+# Jobs' endpoints
+def job_response(job):
+    """Answers a request whose work was queued: 202 pointing at the job."""
+    response = make_response(jsonify(job.make_json()), 202)
+    response.headers["Location"] = f"/jobs/{job.id}"
+    return response
+
+
+@api.route("/users/<uuid:id>/export", methods=["POST"])
+@idempotent
+def export_user(id):
+    try:
+        if not User.query.get(id):
+            return make_response(jsonify({"message": "user not found"}), 404)
+        return job_response(submit("export_user", {"user_id": str(id)}))
+    except Exception as e:
+        return make_response(
+            jsonify({"message": f"error exporting user {id}", "error": str(e)}), 500
+        )
+
+
+@api.route("/jobs/<uuid:id>", methods=["GET"])
+def get_job(id):
+    try:
+        job = db.session.get(Job, id)
+        if not job:
+            return make_response(jsonify({"message": "job not found"}), 404)
+        return make_response(jsonify(job.make_json()), 200)
+    except Exception as e:
+        return make_response(
+            jsonify({"message": f"error getting job {id}", "error": str(e)}), 500
+        )
+
+
+@api.route("/jobs/<uuid:id>/download", methods=["GET"])
+def download_job(id):
+    try:
+        job = db.session.get(Job, id)
+        if not job:
+            return make_response(jsonify({"message": "job not found"}), 404)
+        if job.status != "succeeded" or "file" not in (job.result or {}):
+            return make_response(jsonify({"message": "no file to download"}), 409)
+        return send_from_directory(
+            export_dir(),
+            job.result["file"],
+            mimetype=NDJSON_MIMETYPE,
+            as_attachment=True,
+        )
+    except Exception as e:
+        return make_response(
+            jsonify({"message": f"error downloading job {id}", "error": str(e)}), 500
+        )
+
+
+@api.route("/sync", methods=["POST"])
+@idempotent
+def sync():
+    try:
+        # Retries of a sync are only safe when they can be recognized
+        if "Idempotency-Key" not in request.headers:
+            return make_response(
+                jsonify({"message": "Idempotency-Key header required"}), 400
+            )
+        data = request.get_json()
+        results = apply_operations(data.get("operations"))
+        db.session.commit()
+        return make_response(
+            jsonify({"message": "operations applied", "results": results}), 201
+        )
+    except BatchRejected as e:
+        db.session.rollback()
+        return make_response(
+            jsonify({"message": "no operations applied", "results": e.results}),
+            e.status,
+        )
+    except Exception as e:
+        db.session.rollback()
+        return make_response(
+            jsonify({"message": "error applying operations", "error": str(e)}), 500
+        )
+
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    create_app().run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,397 @@
+import operator
+import os
+from collections import namedtuple
+from datetime import datetime, timedelta
+from functools import lru_cache
+from pathlib import Path
+from uuid import UUID
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import delete, select, tuple_, update
+
+from filters import date_bounds
+from models import ArchivedMonth, Workout, WorkoutExercise, db
+from partitions import add_months, first_of_month
+from serialization import workout_exercise_json
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    from pyarrow import ipc
+except ImportError:  # the archive can then be neither written nor read
+    pa = None
+
+DEFAULT_AFTER_DAYS = 365
+DEFAULT_COMPRESSION = "zstd"
+# Memory-mapped files kept open for repeated reads
+CACHED_FILES = 128
+UUID_COLUMNS = ["workout_id", "id", "exercise_id"]
+# Archived exercises are returned with the fields of workout_exercise_select
+ArchivedExercise = namedtuple(
+    "ArchivedExercise",
+    ["id", "workout_id", "exercise_id", "sets", "repetitions", "weights", "duration"],
+)
+
+archive_cli = AppGroup("archive", help="Move old workout exercises to columnar files.")
+
+
+def require_pyarrow():
+    if pa is None:
+        raise RuntimeError("the workout archive needs pyarrow installed")
+
+
+def file_schema():
+    """Columns of an archive file, one row per workout exercise."""
+    return pa.schema(
+        [
+            ("workout_id", pa.binary(16)),
+            ("created_at", pa.timestamp("us")),
+            ("id", pa.binary(16)),
+            ("exercise_id", pa.binary(16)),
+            ("sets", pa.int32()),
+            ("repetitions", pa.int32()),
+            ("weights", pa.float64()),
+            ("duration", pa.float64()),
+        ]
+    )
+
+
+def archive_dir():
+    """Returns ARCHIVE_DIR, by default the `archive` folder of the instance path."""
+    directory = current_app.config.get("ARCHIVE_DIR")
+    return Path(directory or Path(current_app.instance_path) / "archive")
+
+
+def archive_path(directory, user_id, month, version):
+    return Path(directory) / str(user_id) / f"{month:%Y-%m}.{version}.arrow"
+
+
+@lru_cache(maxsize=CACHED_FILES)
+def read_file(path):
+    """
+    Returns the table stored at `path`, memory-mapped.
+
+    Columns of uncompressed files point into the mapping and are scanned without
+    being copied; compressed ones are decompressed on read. A file never changes
+    once written, so tables are cached by path.
+    """
+    return ipc.open_file(pa.memory_map(path)).read_all()
+
+
+def read_months(directory, entries):
+    """Returns the rows of the archived months `entries` as one table, or None."""
+    require_pyarrow()
+    tables = [
+        read_file(str(archive_path(directory, e.user_id, e.month, e.version)))
+        for e in entries
+    ]
+    return pa.concat_tables(tables) if tables else None
+
+
+def write_file(path, table, compression):
+    """Writes `table` to `path` in the Arrow IPC file format, replacing it at once."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_suffix(".partial")
+    codec = None if compression == "none" else compression
+    options = ipc.IpcWriteOptions(compression=codec)
+    with pa.OSFile(str(partial), "wb") as sink:
+        with ipc.new_file(sink, table.schema, options=options) as writer:
+            writer.write_table(table)
+    os.replace(partial, path)
+
+
+def rows_table(rows):
+    columns = {
+        name: [getattr(row, name) for row in rows] for name in file_schema().names
+    }
+    for name in UUID_COLUMNS:
+        columns[name] = [value.bytes for value in columns[name]]
+    return pa.table(columns, schema=file_schema())
+
+
+def archive_month(session, directory, user_id, month, compression):
+    """
+    Moves the exercises of a user's workouts in `month` to an archive file.
+
+    The workouts stay in place, marked as archived, and are locked meanwhile so no
+    exercise is added to them. The new file version only becomes visible to
+    readers when the transaction deleting the rows commits; the version before it
+    is kept for readers that looked it up just before. Returns how many rows were
+    archived.
+    """
+    start = datetime(month.year, month.month, 1)
+    end = datetime.combine(add_months(month, 1), datetime.min.time())
+    workout_ids = session.scalars(
+        select(Workout.id)
+        .where(
+            Workout.user_workout_id == user_id,
+            Workout.created_at >= start,
+            Workout.created_at < end,
+            Workout.archived.is_(False),
+        )
+        .with_for_update()
+    ).all()
+    if not workout_ids:
+        return 0
+    in_month = [
+        WorkoutExercise.workout_id.in_(workout_ids),
+        WorkoutExercise.workout_created_at >= start,
+        WorkoutExercise.workout_created_at < end,
+    ]
+    rows = session.execute(
+        select(
+            WorkoutExercise.workout_id,
+            WorkoutExercise.workout_created_at.label("created_at"),
+            WorkoutExercise.id,
+            WorkoutExercise.exercise_id,
+            WorkoutExercise.sets,
+            WorkoutExercise.repetitions,
+            WorkoutExercise.weights,
+            WorkoutExercise.duration,
+        ).where(*in_month)
+    ).all()
+    path = None
+    if rows:
+        entry = session.get(ArchivedMonth, (user_id, month))
+        table = rows_table(rows)
+        if entry is None:
+            entry = ArchivedMonth(user_id=user_id, month=month, version=0)
+            session.add(entry)
+        else:
+            table = pa.concat_tables([read_months(directory, [entry]), table])
+        table = table.sort_by(
+            [("created_at", "ascending"), ("workout_id", "ascending")]
+        )
+        entry.version += 1
+        entry.rows = table.num_rows
+        entry.archived_at = datetime.utcnow()
+        path = archive_path(directory, user_id, month, entry.version)
+        write_file(path, table, compression)
+    # Unlike other Core writes these skip summary.record_core_writes: the volume
+    # tables and the change log keep the archived rows
+    session.execute(delete(WorkoutExercise).where(*in_month))
+    session.execute(
+        update(Workout)
+        .where(Workout.id.in_(workout_ids), Workout.created_at >= start)
+        .values(archived=True)
+    )
+    try:
+        session.commit()
+    except Exception:
+        session.rollback()
+        if path is not None:
+            path.unlink(missing_ok=True)
+        raise
+    if path is not None:
+        for old in path.parent.glob(f"{month:%Y-%m}.*.arrow"):
+            if int(old.suffixes[0][1:]) < entry.version - 1:
+                old.unlink(missing_ok=True)
+    return len(rows)
+
+
+def pending_months(session, before):
+    """Returns the `(user_id, month)` pairs of the workouts to archive, oldest first."""
+    statement = select(Workout.user_workout_id, Workout.created_at).where(
+        Workout.created_at < before, Workout.archived.is_(False)
+    )
+    months = set()
+    for user_id, created_at in session.execute(
+        statement.execution_options(yield_per=10000)
+    ):
+        months.add((user_id, first_of_month(created_at)))
+    return sorted(months, key=lambda pair: (pair[1], str(pair[0])))
+
+
+def month_versions(workouts):
+    """
+    Selects the archive files holding the exercises of the archived `workouts`.
+
+    Returns None when none of them is archived, so hot pages need no query.
+    """
+    months = {
+        (row.user_workout_id, first_of_month(row.created_at))
+        for row in workouts
+        if row.archived
+    }
+    if not months:
+        return None
+    return select(
+        ArchivedMonth.user_id, ArchivedMonth.month, ArchivedMonth.version
+    ).where(tuple_(ArchivedMonth.user_id, ArchivedMonth.month).in_(months))
+
+
+def archived_exercises(directory, entries, workouts):
+    """Returns the exercises of the archived `workouts` from the files `entries`."""
+    table = read_months(directory, entries)
+    if table is None:
+        return []
+    ids = pa.array([row.id.bytes for row in workouts if row.archived], pa.binary(16))
+    table = table.filter(pc.is_in(table["workout_id"], value_set=ids))
+    # Only the matching rows, without created_at, become Python objects
+    table = table.select(ArchivedExercise._fields)
+    return [
+        ArchivedExercise(
+            id=UUID(bytes=row["id"]),
+            workout_id=UUID(bytes=row["workout_id"]),
+            exercise_id=UUID(bytes=row["exercise_id"]),
+            sets=row["sets"],
+            repetitions=row["repetitions"],
+            weights=row["weights"],
+            duration=row["duration"],
+        )
+        for row in table.to_pylist()
+    ]
+
+
+def archived_exercises_of(workouts):
+    """archived_exercises of `workouts` for requests of the Flask app."""
+    statement = month_versions(workouts)
+    if statement is None:
+        return []
+    entries = db.session.execute(statement).all()
+    return archived_exercises(archive_dir(), entries, workouts)
+
+
+def full_workout_json(workout):
+    """Workout.make_json, reading the exercises of an archived workout back."""
+    data = workout.make_json()
+    if workout.archived:
+        exercises = archived_exercises_of([workout])
+        data["exercises"] = [workout_exercise_json(row) for row in exercises]
+    return data
+
+
+def archived_history(session, user_id, args, exercise_id=None):
+    """
+    Returns the archived exercises of a user within the `from`/`to` of `args`,
+    optionally of one exercise, or None when none of the user's months is archived.
+    """
+    bounds = date_bounds(args)
+    criteria = [ArchivedMonth.user_id == user_id]
+    for compare, value in bounds:
+        if compare is operator.ge:
+            criteria.append(ArchivedMonth.month >= first_of_month(value))
+        else:
+            criteria.append(ArchivedMonth.month <= value.date())
+    entries = session.execute(
+        select(ArchivedMonth.user_id, ArchivedMonth.month, ArchivedMonth.version)
+        .where(*criteria)
+        .order_by(ArchivedMonth.month)
+    ).all()
+    if not entries:
+        return None
+    table = read_months(archive_dir(), entries)
+    for compare, value in bounds:
+        table = table.filter(compare(pc.field("created_at"), value))
+    if exercise_id:
+        exercise = pa.scalar(exercise_id.bytes, pa.binary(16))
+        table = table.filter(pc.field("exercise_id") == exercise)
+    return table
+
+
+def with_period(table, bucket):
+    """Adds the first day of each row's day, week (Monday) or month as `period`."""
+    period = pc.floor_temporal(
+        table["created_at"], unit=bucket, week_starts_monday=True
+    )
+    return table.append_column("period", period.cast(pa.date32()))
+
+
+def grouped_volumes(table, keys):
+    """
+    Sums the volume of the rows of `table` grouped by the `keys` columns, the way
+    stats.volume_columns does in SQL.
+
+    Returns `{key values: {"sets": ..., "workouts": ...}}` with UUIDs as UUIDs.
+    """
+    if table.num_rows == 0:
+        return {}
+    sets = table["sets"].cast(pa.int64())
+    repetitions = pc.multiply(sets, table["repetitions"].cast(pa.int64()))
+    volumes = pa.table(
+        {
+            **{key: table[key] for key in keys},
+            "sets": sets,
+            "repetitions": repetitions,
+            "tonnage": pc.multiply(repetitions.cast(pa.float64()), table["weights"]),
+            "duration": table["duration"],
+            "workout_id": table["workout_id"],
+        }
+    )
+    aggregates = [
+        (name, "sum") for name in ("sets", "repetitions", "tonnage", "duration")
+    ] + [("workout_id", "count_distinct")]
+    grouped = {}
+    for row in volumes.group_by(keys).aggregate(aggregates).to_pylist():
+        key = tuple(
+            UUID(bytes=row[name]) if name in UUID_COLUMNS else row[name]
+            for name in keys
+        )
+        grouped[key] = {
+            "sets": row["sets_sum"] or 0,
+            "repetitions": row["repetitions_sum"] or 0,
+            "tonnage": row["tonnage_sum"] or 0,
+            "duration": row["duration_sum"] or 0,
+            "workouts": row["workout_id_count_distinct"],
+        }
+    return grouped
+
+
+def archived_records(table):
+    """Returns the heaviest archived set of each exercise, the earliest on ties."""
+    table = table.filter(pc.is_valid(table["weights"]))
+    if table.num_rows == 0:
+        return {}
+    ordered = table.sort_by(
+        [
+            ("exercise_id", "ascending"),
+            ("weights", "descending"),
+            ("created_at", "ascending"),
+        ]
+    )
+    # The first row of each exercise is its record, the only one converted
+    exercises = ordered["exercise_id"].combine_chunks()
+    first = pa.concat_arrays(
+        [
+            pa.array([True]),
+            pc.not_equal(exercises[1:], exercises[:-1]),
+        ]
+    )
+    best = ordered.filter(first).select(
+        ["exercise_id", "weights", "repetitions", "workout_id", "created_at"]
+    )
+    return {
+        UUID(bytes=row["exercise_id"]): {
+            "weights": row["weights"],
+            "repetitions": row["repetitions"],
+            "workout_id": UUID(bytes=row["workout_id"]),
+            "created_at": row["created_at"],
+        }
+        for row in best.to_pylist()
+    }
+
+
+@archive_cli.command("run")
+@click.option(
+    "--before",
+    type=click.DateTime(["%Y-%m"]),
+    help="Archive the months before this one; by default those older than "
+    "ARCHIVE_AFTER_DAYS.",
+)
+def run_command(before):
+    """Move the exercises of old workouts to the archive, one user month at a time."""
+    require_pyarrow()
+    if before is None:
+        days = current_app.config.get("ARCHIVE_AFTER_DAYS", DEFAULT_AFTER_DAYS)
+        before = datetime.utcnow() - timedelta(days=days)
+    before = datetime.combine(first_of_month(before), datetime.min.time())
+    directory = archive_dir()
+    compression = current_app.config.get("ARCHIVE_COMPRESSION", DEFAULT_COMPRESSION)
+    months = pending_months(db.session, before)
+    archived = sum(
+        archive_month(db.session, directory, user_id, month, compression)
+        for user_id, month in months
+    )
+    click.echo(f"{archived} workout exercises of {len(months)} user months archived")
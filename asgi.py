@@ -0,0 +1,304 @@
+"""
+ASGI entry point serving the busiest read endpoints on SQLAlchemy's asyncio engine:
+
+    uvicorn --factory asgi:create_asgi_app --host 0.0.0.0 --port 8001 --workers 4
+
+GET /exercises, /users, /workouts and /workouts_exercises run as coroutines over
+an asyncpg pool, so clients waiting on the network hold neither a thread nor a
+database connection. They share the models, filters, version queries and
+serializers of the Flask app and answer with the same bytes. Every other request,
+including NDJSON streams, is handed to the Flask app in a thread pool.
+Rate limits and the concurrency cap (ratelimit.py) apply to both paths alike.
+"""
+
+import asyncio
+from os import environ
+from urllib.parse import parse_qsl
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from uvicorn.middleware.wsgi import WSGIMiddleware
+from werkzeug.datastructures import Headers, MIMEAccept, MultiDict
+from werkzeug.http import http_date, parse_accept_header, quote_etag
+
+from app import create_app
+from archive import archive_dir, archived_exercises, month_versions
+from cache import exercise_cache, query_key
+from conditional import (
+    exercise_versions,
+    not_modified,
+    user_versions,
+    validators,
+    workout_exercise_versions,
+    workout_versions,
+)
+from filters import (
+    EXERCISE_SORTS,
+    WORKOUT_SORTS,
+    InvalidFilter,
+    exercise_filters,
+    parse_sort,
+    workout_exercise_filters,
+    workout_filters,
+)
+from models import Exercise, Workout, WorkoutExercise
+from pagination import InvalidPageRequest, decode_cursor, encode_cursor, parse_limit
+from serialization import (
+    COMPACT,
+    exercise_json,
+    exercise_select,
+    user_json,
+    user_select,
+    workout_exercise_json,
+    workout_exercise_select,
+    workout_exercises_of,
+    workout_select,
+    workouts_json,
+)
+from streaming import wants_stream
+
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+class Request:
+    """The parts of an ASGI HTTP request the shared helpers read from Flask's."""
+
+    def __init__(self, scope):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        query = scope["query_string"].decode("latin-1")
+        self.full_path = f"{self.path}?{query}"
+        self.args = MultiDict(parse_qsl(query, keep_blank_values=True))
+        self.headers = Headers(
+            [
+                (name.decode("latin-1"), value.decode("latin-1"))
+                for name, value in scope["headers"]
+            ]
+        )
+        client = scope.get("client")
+        self.remote_addr = client[0] if client else None
+        self.accept_mimetypes = parse_accept_header(
+            self.headers.get("Accept"), MIMEAccept
+        )
+        # Enough of a WSGI environ for werkzeug's conditional request checks
+        self.environ = {"REQUEST_METHOD": self.method}
+        for name in ("If-None-Match", "If-Modified-Since", "If-Range", "Range"):
+            if name in self.headers:
+                key = "HTTP_" + name.upper().replace("-", "_")
+                self.environ[key] = self.headers[name]
+
+
+class Response:
+    def __init__(self, body=b"", status=200, mimetype="application/json"):
+        self.body = body
+        self.status = status
+        self.headers = [("Content-Type", mimetype)] if body else []
+
+    def with_validators(self, etag, last_modified):
+        """Sets the ETag and Last-Modified headers, like conditional.with_validators."""
+        self.headers.append(("ETag", quote_etag(etag)))
+        if last_modified:
+            self.headers.append(("Last-Modified", http_date(last_modified)))
+        return self
+
+    def asgi_headers(self):
+        headers = [*self.headers, ("Content-Length", str(len(self.body)))]
+        return [(name.encode("latin-1"), value.encode()) for name, value in headers]
+
+
+class AsyncApp:
+    """
+    ASGI application answering the hot read endpoints itself and delegating the rest.
+
+    Attributes:
+        flask_app (Flask): The WSGI app serving every other request.
+        engine (AsyncEngine): Pool used by the async handlers, configured from
+            ASYNC_SQLALCHEMY_DATABASE_URI and ASYNC_SQLALCHEMY_ENGINE_OPTIONS, which
+            default to the Flask app's database with its async driver and pool options.
+    """
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        config = flask_app.config
+        url = config.get("ASYNC_SQLALCHEMY_DATABASE_URI")
+        if url is None:
+            url = make_url(config["SQLALCHEMY_DATABASE_URI"])
+            url = url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+        options = config.get(
+            "ASYNC_SQLALCHEMY_ENGINE_OPTIONS", config["SQLALCHEMY_ENGINE_OPTIONS"]
+        )
+        self.engine = create_async_engine(url, **options)
+        self.json = flask_app.json
+        with flask_app.app_context():
+            self.archive_dir = archive_dir()
+        self.wsgi = WSGIMiddleware(
+            flask_app, workers=int(environ.get("WSGI_THREADS", 10))
+        )
+        self.limits = flask_app.extensions.get("rate_limiter")
+        self.routes = {
+            "/exercises": (
+                "api.get_exercises",
+                get_exercises,
+                "error getting exercises",
+            ),
+            "/users": ("api.get_users", get_users, "error getting users"),
+            "/workouts": ("api.get_workouts", get_workouts, "error getting workouts"),
+            "/workouts_exercises": (
+                "api.get_workout_exercises",
+                get_workout_exercises,
+                "error getting workout exercises",
+            ),
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        route = self.routes.get(scope["path"]) if scope["type"] == "http" else None
+        if route is None or scope["method"] != "GET":
+            return await self.wsgi(scope, receive, send)
+        req = Request(scope)
+        if wants_stream(req):
+            return await self.wsgi(scope, receive, send)
+
+        endpoint, handler, error_message = route
+        if self.limits is None:
+            response = await self.handle(req, handler, error_message)
+        else:
+            # Same buckets and concurrency slots as the requests Flask serves
+            key = self.limits.key(req.headers, req.remote_addr)
+            rejection = self.limits.admit(key, endpoint)
+            if rejection:
+                status, message, retry_after = rejection
+                response = self.json_response({"message": message}, status)
+                response.headers.append(("Retry-After", str(retry_after)))
+            else:
+                try:
+                    response = await self.handle(req, handler, error_message)
+                finally:
+                    self.limits.release()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": response.status,
+                "headers": response.asgi_headers(),
+            }
+        )
+        await send({"type": "http.response.body", "body": response.body})
+
+    async def handle(self, req, handler, error_message):
+        try:
+            # The connection goes back to the pool before the body is sent
+            async with self.engine.connect() as conn:
+                return await handler(self, req, conn)
+        except (InvalidFilter, InvalidPageRequest) as e:
+            return self.json_response({"message": str(e)}, 400)
+        except Exception as e:
+            return self.json_response({"message": error_message, "error": str(e)}, 500)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.engine.dispose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def json_response(self, obj, status=200):
+        """Encodes `obj` exactly like jsonify does in the Flask app."""
+        return Response((self.json.dumps(obj, **COMPACT) + "\n").encode(), status)
+
+
+def not_modified_response(etag, last_modified):
+    return Response(status=304).with_validators(etag, last_modified)
+
+
+async def get_exercises(app, req, conn):
+    column, descending = parse_sort(req.args, EXERCISE_SORTS, "name")
+    criteria = exercise_filters(req.args)
+    order = [column.desc() if descending else column, Exercise.id]
+    # Shares the cache, and its invalidation on writes, with the Flask views
+    key = query_key(req.args)
+    entry = exercise_cache.lookup(key)
+    if entry is None:
+        etag, _ = validators(
+            await conn.execute(exercise_versions(criteria)), req, dated=False
+        )
+        if not_modified(etag, None, req):
+            return not_modified_response(etag, None)
+        statement = exercise_select().where(*criteria).order_by(*order)
+        rows = await conn.execute(statement)
+        response = app.json_response([exercise_json(row) for row in rows])
+        entry = exercise_cache.store(key, response.body, etag)
+    payload, etag = entry
+    if not_modified(etag, None, req):
+        return not_modified_response(etag, None)
+    return Response(payload).with_validators(etag, None)
+
+
+async def get_users(app, req, conn):
+    etag, last_modified = validators(
+        await conn.execute(user_versions()), req, dated=False
+    )
+    if not_modified(etag, last_modified, req):
+        return not_modified_response(etag, last_modified)
+    users = await conn.execute(user_select())
+    response = app.json_response([user_json(row) for row in users])
+    return response.with_validators(etag, last_modified)
+
+
+async def get_workouts(app, req, conn):
+    _, descending = parse_sort(req.args, WORKOUT_SORTS, "created_at")
+    key = tuple_(Workout.created_at, Workout.id)
+    order = [Workout.created_at, Workout.id]
+    if descending:
+        order = [column.desc() for column in order]
+    criteria = workout_filters(req.args)
+    if "after" in req.args:
+        cursor = decode_cursor(req.args["after"])
+        criteria.append(key < cursor if descending else key > cursor)
+    limit = parse_limit(req.args.get("limit"))
+    page = select(Workout.id).where(*criteria).order_by(*order).limit(limit + 1)
+    etag, last_modified = validators(
+        await conn.execute(workout_versions(page)), req, dated=False
+    )
+    if not_modified(etag, last_modified, req):
+        return not_modified_response(etag, last_modified)
+    statement = workout_select().where(*criteria).order_by(*order)
+    workouts = (await conn.execute(statement.limit(limit + 1))).all()
+    next_cursor = None
+    if len(workouts) > limit:
+        workouts = workouts[:limit]
+        next_cursor = encode_cursor(workouts[-1].created_at, workouts[-1].id)
+    exercises = (await conn.execute(workout_exercises_of(workouts))).all()
+    versions = month_versions(workouts)
+    if versions is not None:
+        entries = (await conn.execute(versions)).all()
+        # Reading and decompressing files would block the event loop
+        exercises += await asyncio.to_thread(
+            archived_exercises, app.archive_dir, entries, workouts
+        )
+    response = app.json_response(
+        {"workouts": workouts_json(workouts, exercises), "next_cursor": next_cursor}
+    )
+    return response.with_validators(etag, last_modified)
+
+
+async def get_workout_exercises(app, req, conn):
+    criteria = workout_exercise_filters(req.args)
+    etag, last_modified = validators(
+        await conn.execute(workout_exercise_versions(criteria)), req, dated=False
+    )
+    if not_modified(etag, last_modified, req):
+        return not_modified_response(etag, last_modified)
+    statement = workout_exercise_select().where(*criteria)
+    rows = await conn.execute(statement.order_by(WorkoutExercise.id))
+    response = app.json_response([workout_exercise_json(row) for row in rows])
+    return response.with_validators(etag, last_modified)
+
+
+def create_asgi_app(config=None):
+    """Creates the ASGI app around `create_app(config)`; opens no connections."""
+    return AsyncApp(create_app(config))
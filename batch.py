@@ -0,0 +1,306 @@
+from datetime import datetime, timezone
+from uuid import UUID, uuid4
+
+from sqlalchemy import select, text
+
+from changes import record
+from models import Exercise, User, Workout, WorkoutExercise, db
+from summary import amounts, record_core_writes
+
+MAX_BATCH_SIZE = 1000
+# First key of the PostgreSQL advisory locks on the IDs of new workouts
+WORKOUT_ID_LOCK = 0x776B6964
+LOCK_WORKOUT_IDS = text(
+    "SELECT pg_advisory_xact_lock(:lock, key) "
+    "FROM (SELECT DISTINCT unnest(CAST(:keys AS integer[])) AS key ORDER BY key) keys"
+)
+
+
+class BatchRejected(Exception):
+    """
+    Raised when at least one item of a batch is invalid.
+
+    Attributes:
+        status (int): HTTP status describing the batch as a whole.
+        results (list): Per-item results; items that were valid but not applied get status 424.
+    """
+
+    def __init__(self, status, results):
+        super().__init__(f"batch rejected with status {status}")
+        self.status = status
+        self.results = results
+
+
+def parse_uuid(value):
+    """Returns `value` as a UUID, or None when it is not a valid identifier."""
+    try:
+        return value if isinstance(value, UUID) else UUID(str(value))
+    except ValueError:
+        return None
+
+
+def prepare_workout_exercises(items, workout=None):
+    """
+    Validates workout-exercise payloads and returns the rows to insert.
+
+    When the `(id, created_at)` of a `workout` is given every item is attached to
+    that workout, otherwise each item has to name its own `workout_id`. All
+    referenced workouts and exercises are checked with one IN query each. Raises
+    BatchRejected when any item is invalid.
+    """
+    if not isinstance(items, list) or not items:
+        raise BatchRejected(
+            400, [{"message": "a non-empty list of exercises is required"}]
+        )
+    if len(items) > MAX_BATCH_SIZE:
+        raise BatchRejected(
+            400, [{"message": f"at most {MAX_BATCH_SIZE} items per batch"}]
+        )
+
+    workout_id = workout[0] if workout else None
+    required = (
+        ["exercise_id", "sets"] if workout_id else ["workout_id", "exercise_id", "sets"]
+    )
+    errors = {}
+    rows = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not all(field in item for field in required):
+            errors[index] = (400, "required fields missing")
+            continue
+        row = {
+            "id": uuid4(),
+            "workout_id": workout_id or parse_uuid(item["workout_id"]),
+            "exercise_id": parse_uuid(item["exercise_id"]),
+        }
+        if row["workout_id"] is None or row["exercise_id"] is None:
+            errors[index] = (400, "invalid identifier")
+            continue
+        try:
+            row.update(amounts(item))
+        except ValueError as e:
+            errors[index] = (400, str(e))
+            continue
+        rows.append((index, row))
+
+    exercise_ids = {row["exercise_id"] for _, row in rows}
+    known_exercises = set(
+        db.session.execute(
+            select(Exercise.id).where(Exercise.id.in_(exercise_ids))
+        ).scalars()
+    )
+    # The creation time of each workout is copied into its rows
+    known_workouts = dict([workout]) if workout else {}
+    archived = set()
+    if not workout:
+        workout_ids = {row["workout_id"] for _, row in rows}
+        statement = select(Workout.id, Workout.created_at, Workout.archived).where(
+            Workout.id.in_(workout_ids)
+        )
+        for id, created_at, is_archived in db.session.execute(statement):
+            known_workouts[id] = created_at
+            if is_archived:
+                archived.add(id)
+    for index, row in rows:
+        if row["workout_id"] not in known_workouts:
+            errors[index] = (404, "specified workout not found")
+        elif row["workout_id"] in archived:
+            errors[index] = (409, "workout is archived")
+        elif row["exercise_id"] not in known_exercises:
+            errors[index] = (404, "specified exercise not found")
+        else:
+            row["workout_created_at"] = known_workouts[row["workout_id"]]
+
+    if errors:
+        results = []
+        for index in range(len(items)):
+            status, message = errors.get(index, (424, "not applied"))
+            results.append({"index": index, "status": status, "message": message})
+        statuses = {status for status, _ in errors.values()}
+        raise BatchRejected(400 if 400 in statuses else min(statuses), results)
+    return [row for _, row in rows]
+
+
+def insert_workout_exercises(rows):
+    """
+    Inserts the prepared rows with a single executemany and returns per-item results.
+
+    The caller owns the transaction and commits once for the whole batch.
+    """
+    db.session.execute(WorkoutExercise.__table__.insert(), rows)
+    record_core_writes(db.session, rows, 1)
+    return [
+        {
+            "index": index,
+            "status": 201,
+            "workout_exercise": WorkoutExercise(**row).make_json(),
+        }
+        for index, row in enumerate(rows)
+    ]
+
+
+def parse_created_at(value):
+    """Returns an ISO 8601 timestamp as naive UTC, or None when it is invalid."""
+    try:
+        created_at = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    if created_at.tzinfo is not None:
+        created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return created_at
+
+
+def lock_workout_ids(session, ids):
+    """
+    Makes concurrent transactions inserting workouts with the same `ids` take turns.
+
+    The primary key of partitioned workouts includes `created_at`, so PostgreSQL no
+    longer keeps IDs unique. The locks are held until the transaction ends, so an ID
+    found free afterwards stays free until the workout is inserted. Keys are taken
+    in order and may be shared by several IDs, which then merely wait for each
+    other.
+    """
+    if session.get_bind().dialect.name != "postgresql" or not ids:
+        return
+    keys = [int.from_bytes(id.bytes[:4], "big", signed=True) for id in ids]
+    session.execute(LOCK_WORKOUT_IDS, {"lock": WORKOUT_ID_LOCK, "keys": keys})
+
+
+def prepare_workouts(operations, errors):
+    """
+    Returns the `(index, row)` workout rows of the `create_workout` operations.
+
+    Workouts may bring the ID and creation time assigned while offline; IDs already
+    in use are rejected with 409, under locks that last until the caller commits.
+    Problems are recorded in `errors` by index.
+    """
+    now = datetime.utcnow()
+    rows = []
+    for index, data in operations:
+        row = {
+            "id": parse_uuid(data["id"]) if "id" in data else uuid4(),
+            "user_workout_id": parse_uuid(data.get("user_workout_id")),
+            "created_at": (
+                parse_created_at(data["created_at"]) if "created_at" in data else now
+            ),
+            "updated_at": now,
+        }
+        if row["id"] is None or row["user_workout_id"] is None:
+            errors[index] = (400, "invalid identifier")
+        elif row["created_at"] is None:
+            errors[index] = (400, "invalid created_at")
+        else:
+            rows.append((index, row))
+
+    user_ids = {row["user_workout_id"] for _, row in rows}
+    known_users = set(
+        db.session.execute(select(User.id).where(User.id.in_(user_ids))).scalars()
+    )
+    workout_ids = [row["id"] for _, row in rows]
+    lock_workout_ids(db.session, workout_ids)
+    taken = set(
+        db.session.execute(
+            select(Workout.id).where(Workout.id.in_(workout_ids))
+        ).scalars()
+    )
+    seen = set()
+    for index, row in rows:
+        if row["user_workout_id"] not in known_users:
+            errors[index] = (404, "specified user not found")
+        elif row["id"] in taken or row["id"] in seen:
+            errors[index] = (409, "workout already exists")
+        seen.add(row["id"])
+    return [(index, row) for index, row in rows if index not in errors]
+
+
+def apply_operations(operations):
+    """
+    Applies operations queued by an offline client and returns per-operation results.
+
+    Supported are `create_workout`, with optional `id`, `created_at` and `exercises`,
+    and `add_workout_exercise`, which may refer to workouts created earlier in the
+    same list. Each table is written with a single executemany. Raises BatchRejected
+    when any operation is invalid. The caller owns the transaction, so nothing is
+    kept in that case.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise BatchRejected(
+            400, [{"message": "a non-empty list of operations is required"}]
+        )
+    if len(operations) > MAX_BATCH_SIZE:
+        raise BatchRejected(
+            400, [{"message": f"at most {MAX_BATCH_SIZE} operations per batch"}]
+        )
+
+    errors = {}
+    creates, additions = [], []
+    for index, operation in enumerate(operations):
+        data = operation.get("data") if isinstance(operation, dict) else None
+        if not isinstance(data, dict):
+            errors[index] = (400, "operation data missing")
+        elif operation.get("op") == "create_workout":
+            if not isinstance(data.get("exercises", []), list):
+                errors[index] = (400, "exercises must be a list")
+            else:
+                creates.append((index, data))
+        elif operation.get("op") == "add_workout_exercise":
+            additions.append((index, data))
+        else:
+            errors[index] = (400, "unknown operation")
+    workouts = prepare_workouts(creates, errors)
+
+    # Exercises of new workouts are validated and inserted with the additions
+    items = []
+    payloads = dict(creates)
+    for index, row in workouts:
+        for item in payloads[index].get("exercises", []):
+            item = {**item, "workout_id": row["id"]} if isinstance(item, dict) else item
+            items.append((index, item))
+    items += additions
+    rows = []
+    if workouts and not errors:
+        db.session.execute(Workout.__table__.insert(), [row for _, row in workouts])
+        record(db.session, "workout", [row["id"] for _, row in workouts])
+    if items and not errors:
+        try:
+            rows = prepare_workout_exercises([item for _, item in items])
+        except BatchRejected as e:
+            for result in e.results:
+                if "index" not in result:
+                    raise
+                if result["status"] != 424:
+                    index = items[result["index"]][0]
+                    errors.setdefault(index, (result["status"], result["message"]))
+
+    if errors:
+        results = []
+        for index in range(len(operations)):
+            status, message = errors.get(index, (424, "not applied"))
+            results.append({"index": index, "status": status, "message": message})
+        statuses = {status for status, _ in errors.values()}
+        raise BatchRejected(400 if 400 in statuses else min(statuses), results)
+
+    results = {
+        index: {"index": index, "status": 201, "workout": created_workout_json(row)}
+        for index, row in workouts
+    }
+    for (index, _), result in zip(
+        items, insert_workout_exercises(rows) if rows else []
+    ):
+        if index in results:
+            results[index]["workout"]["exercises"].append(result["workout_exercise"])
+        else:
+            results[index] = {
+                "index": index,
+                "status": 201,
+                "workout_exercise": result["workout_exercise"],
+            }
+    return [results[index] for index in range(len(operations))]
+
+
+def created_workout_json(row):
+    return {
+        "id": str(row["id"]),
+        "user_workout_id": str(row["user_workout_id"]),
+        "created_at": row["created_at"].isoformat(),
+        "exercises": [],
+    }
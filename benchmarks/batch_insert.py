@@ -0,0 +1,102 @@
+"""
+Compares syncing a workout one exercise at a time with the batch endpoint.
+
+Runs against the database configured for the app, e.g.:
+
+    python -m benchmarks.batch_insert --exercises 20 --rounds 50
+"""
+
+import argparse
+from statistics import mean
+from time import perf_counter
+
+from app import create_app
+from models import Exercise, User, Workout, db
+
+
+def setup(exercise_count):
+    """Creates a user, a workout and `exercise_count` exercises, returning their IDs"""
+    user = User(username="bench-batch", name="Bench", email="bench-batch@example.com")
+    exercises = [
+        Exercise(name=f"Exercise {i}", category="Strength")
+        for i in range(exercise_count)
+    ]
+    workout = Workout(user=user)
+    db.session.add_all([user, workout, *exercises])
+    db.session.commit()
+    return str(workout.id), [str(exercise.id) for exercise in exercises]
+
+
+def teardown():
+    db.session.rollback()
+    user = User.query.filter_by(username="bench-batch").one()
+    for workout in user.workouts:
+        for workout_exercise in workout.workout_exercises:
+            db.session.delete(workout_exercise)
+        db.session.delete(workout)
+    for exercise in Exercise.query.filter(Exercise.name.like("Exercise %")):
+        db.session.delete(exercise)
+    db.session.delete(user)
+    db.session.commit()
+
+
+def items_for(workout_id, exercise_ids):
+    return [
+        {
+            "workout_id": workout_id,
+            "exercise_id": exercise_id,
+            "sets": 3,
+            "repetitions": 10,
+            "weights": 60.0,
+        }
+        for exercise_id in exercise_ids
+    ]
+
+
+def single_path(client, items):
+    for item in items:
+        assert client.post("/workouts_exercises", json=item).status_code == 201
+
+
+def batch_path(client, items):
+    response = client.post(
+        "/workouts_exercises/batch", json={"workout_exercises": items}
+    )
+    assert response.status_code == 201
+
+
+def measure(path, client, items, rounds):
+    timings = []
+    for _ in range(rounds):
+        start = perf_counter()
+        path(client, items)
+        timings.append(perf_counter() - start)
+    return mean(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--exercises", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    app = create_app({"RATELIMIT_ENABLED": False})
+    with app.app_context():
+        db.create_all()
+        workout_id, exercise_ids = setup(args.exercises)
+        client = app.test_client()
+        items = items_for(workout_id, exercise_ids)
+        try:
+            single = measure(single_path, client, items, args.rounds)
+            batch = measure(batch_path, client, items, args.rounds)
+        finally:
+            teardown()
+
+    print(f"{args.exercises} exercises per workout, {args.rounds} rounds")
+    print(f"single-item requests: {single:8.2f} ms per workout")
+    print(f"batch request:        {batch:8.2f} ms per workout")
+    print(f"speedup:              {single / batch:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Holds many concurrent keep-alive connections against a running server.
+
+Each connection sends a request, waits `--think` seconds like a slow mobile client
+and repeats. Compare the WSGI and ASGI servers on the same database, e.g.:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+    uvicorn --factory asgi:create_asgi_app --port 8001
+    python -m benchmarks.concurrency --url http://127.0.0.1:8000/users
+    python -m benchmarks.concurrency --url http://127.0.0.1:8001/users
+"""
+
+import argparse
+import asyncio
+from statistics import quantiles
+from time import perf_counter
+from urllib.parse import urlsplit
+
+
+async def read_response(reader):
+    """Reads one HTTP/1.1 response and returns its status code."""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("connection closed")
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return int(status_line.split()[1])
+
+
+async def client(url, deadline, think, latencies, errors):
+    parts = urlsplit(url)
+    path = parts.path + (f"?{parts.query}" if parts.query else "")
+    request = f"GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\n\r\n".encode()
+    writer = None
+    while perf_counter() < deadline:
+        start = perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(
+                    parts.hostname, parts.port
+                )
+            writer.write(request)
+            status = await asyncio.wait_for(read_response(reader), 60)
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            errors.append(1)
+            if writer is not None:
+                writer.close()
+            writer = None
+            await asyncio.sleep(0.1)
+            continue
+        if status >= 400:
+            errors.append(status)
+        latencies.append(perf_counter() - start)
+        await asyncio.sleep(think)
+    if writer is not None:
+        writer.close()
+
+
+async def run(args):
+    latencies, errors = [], []
+    deadline = perf_counter() + args.duration
+    start = perf_counter()
+    await asyncio.gather(
+        *[
+            client(args.url, deadline, args.think, latencies, errors)
+            for _ in range(args.connections)
+        ]
+    )
+    return latencies, errors, perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default="http://127.0.0.1:8000/users")
+    parser.add_argument("--connections", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--think", type=float, default=0.5)
+    args = parser.parse_args()
+
+    latencies, errors, elapsed = asyncio.run(run(args))
+    print(f"{args.url}, {args.connections} connections, {elapsed:.1f} s")
+    print(f"requests:     {len(latencies):10d}")
+    print(f"errors:       {len(errors):10d}")
+    print(f"requests/sec: {len(latencies) / elapsed:10.1f}")
+    if len(latencies) > 1:
+        cuts = quantiles(latencies, n=100)
+        for label, index in (("p50", 49), ("p95", 94), ("p99", 98)):
+            print(f"{label} latency:  {cuts[index] * 1000:10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Measures throughput and latency of a running server with concurrent clients.
+
+Start the server in one of the two modes and point the script at it, e.g.:
+
+    flask --app app run --port 5000
+    gunicorn -c gunicorn.conf.py wsgi:app
+    python -m benchmarks.load_test --url http://127.0.0.1:5000/exercises
+    python -m benchmarks.load_test --url http://127.0.0.1:8000/exercises
+"""
+
+import argparse
+import http.client
+from statistics import quantiles
+from threading import Thread
+from time import perf_counter
+from urllib.parse import urlsplit
+
+
+def client(url, deadline, latencies, errors):
+    """Sends requests over one keep-alive connection until `deadline`."""
+    parts = urlsplit(url)
+    path = parts.path + (f"?{parts.query}" if parts.query else "")
+    connection = http.client.HTTPConnection(parts.netloc, timeout=30)
+    while perf_counter() < deadline:
+        start = perf_counter()
+        try:
+            connection.request("GET", path)
+            response = connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            errors.append(1)
+            connection.close()
+            connection = http.client.HTTPConnection(parts.netloc, timeout=30)
+            continue
+        if response.status >= 400:
+            errors.append(response.status)
+        latencies.append(perf_counter() - start)
+    connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default="http://127.0.0.1:8000/exercises")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    latencies, errors = [], []
+    deadline = perf_counter() + args.duration
+    threads = [
+        Thread(target=client, args=(args.url, deadline, latencies, errors))
+        for _ in range(args.concurrency)
+    ]
+    start = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = perf_counter() - start
+
+    print(f"{args.url}, {args.concurrency} clients, {elapsed:.1f} s")
+    print(f"requests:     {len(latencies):10d}")
+    print(f"errors:       {len(errors):10d}")
+    print(f"requests/sec: {len(latencies) / elapsed:10.1f}")
+    if len(latencies) > 1:
+        cuts = quantiles(latencies, n=100)
+        for label, index in (("p50", 49), ("p95", 94), ("p99", 98)):
+            print(f"{label} latency:  {cuts[index] * 1000:10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
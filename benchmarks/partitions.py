@@ -0,0 +1,166 @@
+"""
+Measures partition pruning on date-bounded reads of the seeded history.
+
+Splits the seeded workouts into monthly partitions, copies both tables into
+unpartitioned tables of a `bench_flat` schema and runs the statements of the API
+against both, reporting the median time and the partitions each one touched.
+Needs PostgreSQL:
+
+    python -m benchmarks.seed --users 2000 --workouts 100
+    python -m benchmarks.partitions --repeat 20
+    python -m benchmarks.partitions --drop
+"""
+
+import argparse
+import sys
+from datetime import timedelta
+from statistics import median
+from time import perf_counter
+from uuid import UUID
+
+from sqlalchemy import func, select, text
+
+from app import create_app
+from benchmarks.suite import Dataset
+from filters import date_range, workout_filters
+from models import Workout, WorkoutExercise, db
+from partitions import (
+    TABLES,
+    add_months,
+    create_partitions,
+    is_partitioned,
+    monthly_partitions,
+)
+from serialization import workout_exercises_of, workout_select
+from stats import personal_records, stats_criteria, volume_totals
+
+FLAT = "bench_flat"
+
+
+def split_history():
+    """Moves the seeded rows out of the default partitions into monthly ones."""
+    with db.engine.begin() as connection:
+        oldest, newest = connection.execute(
+            select(func.min(Workout.created_at), func.max(Workout.created_at))
+        ).one()
+        created = create_partitions(connection, oldest, add_months(newest, 1))
+        connection.execute(text("ANALYZE workouts, workout_exercises"))
+    return created
+
+
+def copy_flat():
+    """Copies the workout tables, with their indexes, into unpartitioned tables."""
+    with db.engine.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA IF EXISTS {FLAT} CASCADE"))
+        connection.execute(text(f"CREATE SCHEMA {FLAT}"))
+        for table, _ in TABLES:
+            connection.execute(
+                text(
+                    f"CREATE TABLE {FLAT}.{table} "
+                    f"(LIKE public.{table} INCLUDING ALL)"
+                )
+            )
+            connection.execute(
+                text(f"INSERT INTO {FLAT}.{table} SELECT * FROM public.{table}")
+            )
+            connection.execute(text(f"ANALYZE {FLAT}.{table}"))
+        # The other tables are shared through views
+        for table in ("users", "exercises"):
+            connection.execute(
+                text(f"CREATE VIEW {FLAT}.{table} AS SELECT * FROM public.{table}")
+            )
+
+
+def scenarios(data, days):
+    """Returns `{name: [statements]}` reading `days` of history, newest first."""
+    end = data.newest
+    args = {"from": (end - timedelta(days=days)).isoformat(), "to": end.isoformat()}
+    page = (
+        workout_select()
+        .where(*workout_filters(args))
+        .order_by(Workout.created_at.desc(), Workout.id.desc())
+        .limit(50)
+    )
+    workouts = db.session.execute(page).all()
+    criteria = stats_criteria(UUID(data.heaviest_user), args)
+    year_ago = {
+        "from": (end - timedelta(days=365 + days)).isoformat(),
+        "to": (end - timedelta(days=365)).isoformat(),
+    }
+    return {
+        f"workouts page, {days} days": [page, workout_exercises_of(workouts)],
+        f"user totals, {days} days": [volume_totals(criteria)],
+        f"user records, {days} days": [personal_records(criteria)],
+        f"all exercises, {days} days a year ago": [
+            select(func.count(), func.sum(WorkoutExercise.sets)).where(
+                *date_range(WorkoutExercise.workout_created_at, year_ago)
+            )
+        ],
+        "workout by id, no date": [
+            workout_select().where(Workout.id == workouts[0].id)
+        ],
+    }
+
+
+def timed(statements, repeat, schema):
+    options = {"schema_translate_map": {None: schema}}
+    elapsed = []
+    for _ in range(repeat):
+        start = perf_counter()
+        for statement in statements:
+            db.session.execute(statement, execution_options=options).all()
+        elapsed.append((perf_counter() - start) * 1000)
+    return median(elapsed)
+
+
+def scanned(plan):
+    """Returns the names of the relations a plan from EXPLAIN ANALYZE has read."""
+    names = set()
+    if "Relation Name" in plan and plan.get("Actual Loops", 0) > 0:
+        names.add(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        names |= scanned(child)
+    return names
+
+
+def partitions_read(statements):
+    names = set()
+    for statement in statements:
+        sql = statement.compile(db.engine, compile_kwargs={"literal_binds": True})
+        explain = f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}"
+        names |= scanned(db.session.scalar(text(explain))[0]["Plan"])
+    prefixes = tuple(f"{table}_" for table, _ in TABLES)
+    return len([name for name in names if name.startswith(prefixes)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--drop", action="store_true")
+    args = parser.parse_args()
+
+    app = create_app({"RATELIMIT_ENABLED": False})
+    with app.app_context():
+        if not is_partitioned(db.session.connection()):
+            sys.exit("workouts is not partitioned, run `flask init-db` on PostgreSQL")
+        if args.drop:
+            db.session.execute(text(f"DROP SCHEMA IF EXISTS {FLAT} CASCADE"))
+            db.session.commit()
+            return
+        db.session.commit()
+        print(f"{len(split_history())} monthly partitions created")
+        copy_flat()
+        data = Dataset()
+        months = len(monthly_partitions(db.session.connection(), "workouts"))
+        print(f"{months} monthly partitions per table\n")
+        print(f"{'':40}{'flat':>10}{'partitioned':>13}{'partitions':>12}")
+        for name, statements in scenarios(data, args.days).items():
+            flat = timed(statements, args.repeat, FLAT)
+            partitioned = timed(statements, args.repeat, None)
+            read = partitions_read(statements)
+            print(f"{name:40}{flat:8.2f} ms{partitioned:10.2f} ms{read:12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Generates a reproducible synthetic training history with bulk inserts.
+
+Activity is skewed the way real usage is: a few users log most of the workouts
+and a few exercises appear in most of them (Zipf-like weights). Rows are
+marked with a "seed-" prefix so they can be told apart and removed:
+
+    python -m benchmarks.seed --users 1000 --workouts 50 --exercises 200
+    python -m benchmarks.seed --drop
+"""
+
+import argparse
+import random
+from datetime import datetime, timedelta
+from itertools import accumulate
+from time import perf_counter
+from uuid import uuid4
+
+from sqlalchemy import delete, func, select
+
+from app import create_app
+from models import (
+    Exercise,
+    ExerciseVolume,
+    User,
+    UserVolume,
+    Workout,
+    WorkoutExercise,
+    category_ids,
+    db,
+)
+from summary import rebuild
+
+PREFIX = "seed-"
+CATEGORIES = ["Strength", "Strength", "Strength", "Cardio", "Mobility", "Plyometrics"]
+EQUIPMENT = ["barbell", "dumbbell", "kettlebell", "cable", "bodyweight"]
+MOVEMENTS = ["squat", "press", "row", "deadlift", "lunge", "curl", "raise", "pull"]
+MUSCLES = ["legs", "chest", "back", "shoulders", "arms", "core"]
+CHUNK = 10000
+HISTORY_DAYS = 2 * 365
+
+
+def zipf_weights(count, skew):
+    """Returns cumulative weights making item i about (i + 1) ** skew times rarer."""
+    return list(accumulate(1 / (rank + 1) ** skew for rank in range(count)))
+
+
+def description(i):
+    """Returns searchable text for exercise `i`, without drawing random numbers."""
+    equipment = EQUIPMENT[i % len(EQUIPMENT)]
+    movement = MOVEMENTS[i // len(EQUIPMENT) % len(MOVEMENTS)]
+    muscle = MUSCLES[i // (len(EQUIPMENT) * len(MOVEMENTS)) % len(MUSCLES)]
+    return f"{equipment} {movement} for the {muscle}"
+
+
+def exercise_row(rng, workout, exercise, category):
+    row = {
+        "id": uuid4(),
+        "workout_id": workout["id"],
+        "workout_created_at": workout["created_at"],
+        "exercise_id": exercise["id"],
+        "sets": 1,
+        "repetitions": None,
+        "weights": None,
+        "duration": None,
+    }
+    if category == "Cardio":
+        row["duration"] = float(rng.randrange(10, 61, 5))
+    else:
+        row["sets"] = rng.randint(2, 5)
+        row["repetitions"] = rng.choice([3, 5, 6, 8, 10, 12, 15])
+        if category == "Strength":
+            row["weights"] = rng.randrange(8, 73) * 2.5
+    return row
+
+
+def seed(users, workouts, exercises, skew=1.1, seed_value=0):
+    """
+    Inserts `users` users with `workouts` workouts each on average, drawn from a
+    catalogue of `exercises` exercises, and rebuilds the volume tables.
+
+    Returns the number of rows inserted per table.
+    """
+    rng = random.Random(seed_value)
+    user_rows = [
+        {
+            "id": uuid4(),
+            "username": f"{PREFIX}user-{i}",
+            "name": f"Seed User {i}",
+            "email": f"{PREFIX}{i}@example.com",
+        }
+        for i in range(users)
+    ]
+    categories = category_ids(db.session, CATEGORIES)
+    names = {id: name for name, id in categories.items()}
+    exercise_rows = []
+    for i in range(exercises):
+        custom = rng.random() < 0.1
+        exercise_rows.append(
+            {
+                "id": uuid4(),
+                "name": f"{PREFIX}exercise-{i}",
+                "description": description(i),
+                "category_id": categories[rng.choice(CATEGORIES)],
+                "custom_made": custom,
+                "created_by": rng.choice(user_rows)["id"] if custom else None,
+            }
+        )
+    db.session.execute(User.__table__.insert(), user_rows)
+    db.session.execute(Exercise.__table__.insert(), exercise_rows)
+
+    user_weights = zipf_weights(users, skew)
+    exercise_weights = zipf_weights(exercises, skew)
+    end = datetime.utcnow().replace(microsecond=0)
+    counts = {"users": users, "exercises": exercises, "workouts": 0, "rows": 0}
+    workout_batch, row_batch = [], []
+    for _ in range(users * workouts):
+        user = rng.choices(user_rows, cum_weights=user_weights)[0]
+        workout = {
+            "id": uuid4(),
+            "user_workout_id": user["id"],
+            "created_at": end - timedelta(minutes=rng.randrange(HISTORY_DAYS * 1440)),
+        }
+        workout_batch.append(workout)
+        picked = rng.choices(exercise_rows, cum_weights=exercise_weights, k=6)
+        # Duplicates collapse, so workouts hold between one and six exercises
+        for exercise in {e["id"]: e for e in picked}.values():
+            category = names[exercise["category_id"]]
+            row_batch.append(exercise_row(rng, workout, exercise, category))
+        if len(row_batch) >= CHUNK:
+            counts["workouts"] += len(workout_batch)
+            counts["rows"] += len(row_batch)
+            flush(workout_batch, row_batch)
+    counts["workouts"] += len(workout_batch)
+    counts["rows"] += len(row_batch)
+    flush(workout_batch, row_batch)
+    # Recomputed at once rather than per chunk with summary.record_core_writes
+    rebuild(db.session)
+    db.session.commit()
+    return counts
+
+
+def flush(workouts, workout_exercises):
+    if workouts:
+        db.session.execute(Workout.__table__.insert(), workouts)
+    if workout_exercises:
+        db.session.execute(WorkoutExercise.__table__.insert(), workout_exercises)
+    workouts.clear()
+    workout_exercises.clear()
+
+
+def is_seeded():
+    statement = select(func.count()).where(User.username.like(f"{PREFIX}%"))
+    return db.session.scalar(statement) > 0
+
+
+def drop():
+    users = select(User.id).where(User.username.like(f"{PREFIX}%"))
+    workouts = select(Workout.id).where(Workout.user_workout_id.in_(users))
+    db.session.execute(
+        delete(WorkoutExercise).where(WorkoutExercise.workout_id.in_(workouts))
+    )
+    db.session.execute(delete(Workout).where(Workout.user_workout_id.in_(users)))
+    db.session.execute(delete(UserVolume).where(UserVolume.user_id.in_(users)))
+    db.session.execute(delete(ExerciseVolume).where(ExerciseVolume.user_id.in_(users)))
+    db.session.execute(delete(Exercise).where(Exercise.name.like(f"{PREFIX}%")))
+    db.session.execute(delete(User).where(User.username.like(f"{PREFIX}%")))
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--workouts", type=int, default=50, help="per user, average")
+    parser.add_argument("--exercises", type=int, default=200)
+    parser.add_argument("--skew", type=float, default=1.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--drop", action="store_true")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        if args.drop or is_seeded():
+            drop()
+        if args.drop:
+            return
+        start = perf_counter()
+        counts = seed(args.users, args.workouts, args.exercises, args.skew, args.seed)
+        print(
+            f"seeded {counts['users']} users, {counts['exercises']} exercises, "
+            f"{counts['workouts']} workouts and {counts['rows']} workout exercises "
+            f"in {perf_counter() - start:.1f} s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Compares make_json + Flask's encoder with the column-level path per model.
+
+Runs on an in-memory SQLite database, so it measures serialization rather than
+the network, e.g.:
+
+    python -m benchmarks.serialization --rows 10000 --rounds 5
+"""
+
+import argparse
+from datetime import datetime, timedelta
+from time import perf_counter
+from uuid import uuid4
+
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy.orm import joinedload, selectinload
+
+import serialization
+from app import create_app
+from models import Exercise, User, Workout, WorkoutExercise, category_ids, db
+from serialization import (
+    FastJSONProvider,
+    exercise_json,
+    exercise_select,
+    user_json,
+    user_select,
+    workout_exercise_json,
+    workout_exercise_select,
+    workout_exercises_of,
+    workout_select,
+    workouts_json,
+)
+
+
+def seed(rows):
+    """Inserts `rows` users, exercises and workouts, each workout with three exercises"""
+    start = datetime(2024, 1, 1)
+    strength = category_ids(db.session, ["Strength"])["Strength"]
+    users = [
+        {
+            "id": uuid4(),
+            "username": f"user{i}",
+            "name": f"User {i}",
+            "email": f"user{i}@example.com",
+            "created_at": start,
+            "updated_at": start,
+        }
+        for i in range(rows)
+    ]
+    exercises = [
+        {
+            "id": uuid4(),
+            "name": f"Exercise {i}",
+            "category_id": strength,
+            "custom_made": True,
+            "created_by": users[i]["id"],
+            "updated_at": start,
+        }
+        for i in range(rows)
+    ]
+    workouts = [
+        {
+            "id": uuid4(),
+            "user_workout_id": users[i]["id"],
+            "created_at": start + timedelta(minutes=i),
+            "updated_at": start,
+        }
+        for i in range(rows)
+    ]
+    workout_exercises = [
+        {
+            "id": uuid4(),
+            "workout_id": workout["id"],
+            "workout_created_at": workout["created_at"],
+            "exercise_id": exercises[(i + j) % rows]["id"],
+            "sets": 3,
+            "repetitions": 10,
+            "weights": 62.5,
+            "updated_at": start,
+        }
+        for i, workout in enumerate(workouts)
+        for j in range(3)
+    ]
+    for model, values in (
+        (User, users),
+        (Exercise, exercises),
+        (Workout, workouts),
+        (WorkoutExercise, workout_exercises),
+    ):
+        db.session.execute(model.__table__.insert(), values)
+    db.session.commit()
+
+
+def orm_path(query):
+    return lambda: [obj.make_json() for obj in query()]
+
+
+def column_path(statement, to_json):
+    return lambda: [to_json(row) for row in db.session.execute(statement)]
+
+
+def workouts_path():
+    workouts = db.session.execute(workout_select().order_by(Workout.created_at)).all()
+    return workouts_json(workouts, db.session.execute(workout_exercises_of(workouts)))
+
+
+def measure(build, provider, rounds):
+    """Returns the best time in ms of building and encoding a response, and its body"""
+    best = float("inf")
+    for _ in range(rounds):
+        db.session.expunge_all()
+        start = perf_counter()
+        body = provider.response(build()).get_data()
+        best = min(best, perf_counter() - start)
+    return best * 1000, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    app = create_app(
+        {"SQLALCHEMY_DATABASE_URI": "sqlite://", "SQLALCHEMY_ENGINE_OPTIONS": {}}
+    )
+    models = {
+        "exercises": (
+            orm_path(lambda: Exercise.query.options(joinedload(Exercise.creator))),
+            column_path(exercise_select(), exercise_json),
+        ),
+        "users": (
+            orm_path(lambda: User.query),
+            column_path(user_select(), user_json),
+        ),
+        "workouts": (
+            orm_path(
+                lambda: Workout.query.options(
+                    joinedload(Workout.user), selectinload(Workout.workout_exercises)
+                ).order_by(Workout.created_at)
+            ),
+            workouts_path,
+        ),
+        "workout exercises": (
+            orm_path(lambda: WorkoutExercise.query),
+            column_path(workout_exercise_select(), workout_exercise_json),
+        ),
+    }
+    with app.app_context():
+        db.create_all()
+        seed(args.rows)
+        stdlib = DefaultJSONProvider(app)
+        fast = FastJSONProvider(app)
+        print(f"{args.rows} rows per model, best of {args.rounds} rounds")
+        if serialization.orjson is None:
+            print("orjson is not installed; both column timings use the stdlib")
+        print(f"{'':20}{'make_json':>12}{'columns':>12}{'+ orjson':>12}")
+        for name, (orm, columns) in models.items():
+            before, expected = measure(orm, stdlib, args.rounds)
+            after, body = measure(columns, fast, args.rounds)
+            # The same provider falls back to the stdlib encoder without orjson
+            encoder_module, serialization.orjson = serialization.orjson, None
+            rows, rows_body = measure(columns, fast, args.rounds)
+            serialization.orjson = encoder_module
+            assert rows_body == body == expected, f"{name}: output differs"
+            print(
+                f"{name:20}{before:10.1f}ms{rows:10.1f}ms{after:10.1f}ms"
+                f"{before / after:8.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
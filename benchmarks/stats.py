@@ -0,0 +1,161 @@
+"""
+Compares the SQL statistics queries with aggregating make_json output in Python.
+
+Seeds `--rows` workout exercises (one million by default) spread over a few users
+on first run and keeps them for later runs; pass --drop to remove them:
+
+    python -m benchmarks.stats --rows 1000000
+"""
+
+import argparse
+import random
+from datetime import datetime, timedelta
+from time import perf_counter
+from uuid import uuid4
+
+from sqlalchemy import delete, select
+
+from app import create_app
+from models import Exercise, User, Workout, WorkoutExercise, category_ids, db
+from stats import user_stats
+
+USERS = 10
+EXERCISES = 50
+EXERCISES_PER_WORKOUT = 5
+CHUNK = 10000
+
+
+def seed(rows):
+    """Bulk inserts users, exercises, workouts and `rows` workout exercises"""
+    rng = random.Random(0)
+    users = [
+        {
+            "id": uuid4(),
+            "username": f"bench-stats-{i}",
+            "name": "Bench",
+            "email": f"bench-stats-{i}@example.com",
+        }
+        for i in range(USERS)
+    ]
+    strength = category_ids(db.session, ["Strength"])["Strength"]
+    exercises = [
+        {"id": uuid4(), "name": f"bench-stats-{i}", "category_id": strength}
+        for i in range(EXERCISES)
+    ]
+    db.session.execute(User.__table__.insert(), users)
+    db.session.execute(Exercise.__table__.insert(), exercises)
+    start = datetime(2020, 1, 1)
+    workouts, workout_exercises = [], []
+    for i in range(rows // EXERCISES_PER_WORKOUT):
+        workout = {
+            "id": uuid4(),
+            "user_workout_id": users[i % USERS]["id"],
+            "created_at": start + timedelta(minutes=rng.randrange(5 * 365 * 24 * 60)),
+        }
+        workouts.append(workout)
+        for exercise in rng.sample(exercises, EXERCISES_PER_WORKOUT):
+            workout_exercises.append(
+                {
+                    "id": uuid4(),
+                    "workout_id": workout["id"],
+                    "workout_created_at": workout["created_at"],
+                    "exercise_id": exercise["id"],
+                    "sets": rng.randint(1, 6),
+                    "repetitions": rng.randint(1, 15),
+                    "weights": rng.choice([None, rng.uniform(5, 200)]),
+                    "duration": rng.choice([None, rng.uniform(1, 60)]),
+                }
+            )
+        if len(workout_exercises) >= CHUNK:
+            flush(workouts, workout_exercises)
+    flush(workouts, workout_exercises)
+    db.session.commit()
+
+
+def flush(workouts, workout_exercises):
+    if workouts:
+        db.session.execute(Workout.__table__.insert(), workouts)
+    if workout_exercises:
+        db.session.execute(WorkoutExercise.__table__.insert(), workout_exercises)
+    workouts.clear()
+    workout_exercises.clear()
+
+
+def drop():
+    users = select(User.id).where(User.username.like("bench-stats-%"))
+    workouts = select(Workout.id).where(Workout.user_workout_id.in_(users))
+    db.session.execute(
+        delete(WorkoutExercise).where(WorkoutExercise.workout_id.in_(workouts))
+    )
+    db.session.execute(delete(Workout).where(Workout.user_workout_id.in_(users)))
+    db.session.execute(delete(Exercise).where(Exercise.name.like("bench-stats-%")))
+    db.session.execute(delete(User).where(User.username.like("bench-stats-%")))
+    db.session.commit()
+
+
+def python_stats(user):
+    """What clients do today: pull every workout through make_json and aggregate"""
+    totals = {}
+    for workout in Workout.query.filter_by(user_workout_id=user.id):
+        for exercise in workout.make_json()["exercises"]:
+            entry = totals.setdefault(
+                exercise["exercise_id"], {"sets": 0, "tonnage": 0.0, "best": None}
+            )
+            entry["sets"] += exercise["sets"]
+            if exercise["weights"] is not None:
+                entry["tonnage"] += (
+                    exercise["sets"] * exercise["repetitions"] * exercise["weights"]
+                )
+                entry["best"] = max(entry["best"] or 0, exercise["weights"])
+    return totals
+
+
+def timed(function, *args):
+    start = perf_counter()
+    function(*args)
+    return (perf_counter() - start) * 1000
+
+
+def report(label, elapsed):
+    print(f"{label + ':':28}{elapsed:10.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--drop", action="store_true")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        if args.drop:
+            drop()
+            return
+        user = User.query.filter_by(username="bench-stats-0").first()
+        if not user:
+            start = perf_counter()
+            seed(args.rows)
+            print(f"seeded {args.rows} rows in {perf_counter() - start:.1f} s")
+            user = User.query.filter_by(username="bench-stats-0").one()
+        rows = (
+            WorkoutExercise.query.join(Workout)
+            .filter(Workout.user_workout_id == user.id)
+            .count()
+        )
+
+        print(f"user with {rows} workout exercises")
+        for bucket in ("day", "week", "month"):
+            elapsed = timed(user_stats, db.session, user.id, {"bucket": bucket})
+            report(f"SQL stats, {bucket} buckets", elapsed)
+        elapsed = timed(
+            user_stats, db.session, user.id, {"from": "2024-01-01", "bucket": "week"}
+        )
+        report("SQL stats, one year only", elapsed)
+        db.session.expunge_all()
+        elapsed = timed(python_stats, user)
+        report("make_json + Python", elapsed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+Runs latency scenarios against every hot endpoint on the seeded dataset.
+
+Requests go through the Flask test client against the configured database, so
+the numbers exclude the HTTP server but include every SQL statement, which is
+counted per request. Results are saved as JSON for comparison between commits:
+
+    python -m benchmarks.seed
+    python -m benchmarks.suite --requests 200
+    python -m benchmarks.suite --compare benchmarks/results/<earlier run>.json
+"""
+
+import argparse
+import json
+import random
+import subprocess
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from statistics import mean, quantiles
+from time import perf_counter
+
+from sqlalchemy import event, func, select
+
+from app import create_app
+from benchmarks.seed import EQUIPMENT, MOVEMENTS, PREFIX
+from cache import exercise_cache
+from models import Exercise, User, Workout, WorkoutExercise, db
+
+RESULTS = Path(__file__).parent / "results"
+
+
+class Dataset:
+    """IDs and values of the seeded rows that scenarios draw their requests from"""
+
+    def __init__(self):
+        seeded = User.username.like(f"{PREFIX}%")
+        self.users = [str(i) for i in db.session.scalars(select(User.id).where(seeded))]
+        if not self.users:
+            sys.exit("no seeded data found, run `python -m benchmarks.seed` first")
+        heaviest = (
+            select(Workout.user_workout_id)
+            .join(User)
+            .where(seeded)
+            .group_by(Workout.user_workout_id)
+            .order_by(func.count().desc())
+            .limit(1)
+        )
+        self.heaviest_user = str(db.session.scalar(heaviest))
+        exercises = db.session.execute(
+            select(Exercise.id, Exercise.category).where(
+                Exercise.name.like(f"{PREFIX}%")
+            )
+        ).all()
+        self.exercises = [str(row.id) for row in exercises]
+        self.categories = sorted({row.category for row in exercises})
+        self.workouts = [
+            str(i)
+            for i in db.session.scalars(
+                select(Workout.id).join(User).where(seeded).limit(1000)
+            )
+        ]
+        self.newest = db.session.scalar(select(func.max(Workout.created_at)))
+
+
+def scenarios(rng, data):
+    """Returns `{name: request factory}`; each factory gives `(method, path, json)`."""
+
+    def day_range():
+        day = data.newest - timedelta(days=rng.randrange(365))
+        return f"from={(day - timedelta(days=30)).date()}&to={day.date()}"
+
+    def workout_exercise():
+        return {
+            "workout_id": rng.choice(data.workouts),
+            "exercise_id": rng.choice(data.exercises),
+            "sets": 3,
+            "repetitions": 10,
+            "weights": 60.0,
+        }
+
+    def uncached_exercises():
+        exercise_cache.invalidate()
+        return "GET", f"/exercises?category={rng.choice(data.categories)}", None
+
+    return {
+        "GET /workouts": lambda: ("GET", "/workouts?limit=50", None),
+        "GET /workouts?user": lambda: (
+            "GET",
+            f"/workouts?user={rng.choice(data.users)}&limit=50",
+            None,
+        ),
+        "GET /workouts?from&to": lambda: (
+            "GET",
+            f"/workouts?{day_range()}&limit=50",
+            None,
+        ),
+        "GET /exercises": lambda: ("GET", "/exercises", None),
+        "GET /exercises uncached": uncached_exercises,
+        "GET /exercises/search": lambda: (
+            "GET",
+            f"/exercises/search?q={rng.choice(EQUIPMENT)}+{rng.choice(MOVEMENTS)[:3]}"
+            "&limit=20",
+            None,
+        ),
+        "GET /users/<id>/stats": lambda: (
+            "GET",
+            f"/users/{rng.choice(data.users)}/stats",
+            None,
+        ),
+        "GET /users/<id>/stats heaviest": lambda: (
+            "GET",
+            f"/users/{data.heaviest_user}/stats?bucket=month",
+            None,
+        ),
+        "POST /workouts_exercises": lambda: (
+            "POST",
+            "/workouts_exercises",
+            workout_exercise(),
+        ),
+        "POST /workouts_exercises/batch": lambda: (
+            "POST",
+            "/workouts_exercises/batch",
+            {"workout_exercises": [workout_exercise() for _ in range(10)]},
+        ),
+    }
+
+
+def run(client, make_request, requests, warmup):
+    """Sends `warmup` + `requests` requests and returns the measured statistics"""
+    statements = []
+
+    def count(*args):
+        statements.append(1)
+
+    latencies, queries = [], []
+    event.listen(db.engine, "before_cursor_execute", count)
+    try:
+        for i in range(warmup + requests):
+            method, path, body = make_request()
+            statements.clear()
+            start = perf_counter()
+            response = client.open(path, method=method, json=body)
+            elapsed = perf_counter() - start
+            if response.status_code >= 400:
+                raise RuntimeError(f"{method} {path}: {response.status_code}")
+            if i >= warmup:
+                latencies.append(elapsed)
+                queries.append(len(statements))
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count)
+    cuts = quantiles(latencies, n=100)
+    return {
+        "requests": requests,
+        "throughput": requests / sum(latencies),
+        "p50_ms": cuts[49] * 1000,
+        "p95_ms": cuts[94] * 1000,
+        "p99_ms": cuts[98] * 1000,
+        "queries": mean(queries),
+    }
+
+
+def cleanup(since):
+    """Deletes the rows added by the write scenarios, updating the volume tables"""
+    for row in WorkoutExercise.query.filter(WorkoutExercise.updated_at >= since):
+        db.session.delete(row)
+    db.session.commit()
+
+
+def git_revision():
+    try:
+        revision = subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = "unknown"
+    return revision
+
+
+def compare(results, baseline, tolerance):
+    """Prints the change against `baseline` and returns the regressed scenarios"""
+    regressions = []
+    print(f"\ncompared with {baseline['revision']} ({baseline['started_at']}):")
+    for name, current in results["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if before is None:
+            continue
+        change = current["p95_ms"] / before["p95_ms"] - 1
+        extra_queries = current["queries"] - before["queries"]
+        regressed = change > tolerance or extra_queries > 0
+        if regressed:
+            regressions.append(name)
+        print(
+            f"{name:34}p95 {change:+7.1%}  queries {extra_queries:+6.1f}"
+            f"{'  REGRESSION' if regressed else ''}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--only", help="run the scenarios whose name contains this")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--results", type=Path, default=RESULTS)
+    parser.add_argument("--compare", type=Path, help="earlier results file")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="p95 slowdown reported as a regression (default 0.1 = 10%%)",
+    )
+    args = parser.parse_args()
+
+    app = create_app({"RATELIMIT_ENABLED": False})
+    results = {
+        "revision": git_revision(),
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "scenarios": {},
+    }
+    with app.app_context():
+        results["database"] = db.engine.dialect.name
+        data = Dataset()
+        results["dataset"] = {
+            "users": len(data.users),
+            "exercises": len(data.exercises),
+            "workouts": db.session.scalar(select(func.count(Workout.id))),
+            "workout_exercises": db.session.scalar(
+                select(func.count(WorkoutExercise.id))
+            ),
+        }
+        client = app.test_client()
+        rng = random.Random(args.seed)
+        since = datetime.utcnow()
+        print(f"{'':34}{'req/s':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'queries':>9}")
+        try:
+            for name, make_request in scenarios(rng, data).items():
+                if args.only and args.only not in name:
+                    continue
+                stats = run(client, make_request, args.requests, args.warmup)
+                results["scenarios"][name] = stats
+                print(
+                    f"{name:34}{stats['throughput']:8.1f}{stats['p50_ms']:7.1f}ms"
+                    f"{stats['p95_ms']:7.1f}ms{stats['p99_ms']:7.1f}ms"
+                    f"{stats['queries']:9.1f}"
+                )
+        finally:
+            cleanup(since)
+
+    args.results.mkdir(parents=True, exist_ok=True)
+    stamp = results["started_at"][:19].replace(":", "")
+    path = args.results / f"{stamp}-{results['revision']}.json"
+    path.write_text(json.dumps(results, indent=2))
+    print(f"\nsaved {path}")
+    if args.compare:
+        regressions = compare(
+            results, json.loads(args.compare.read_text()), args.tolerance
+        )
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from urllib.parse import urlencode
+
+from werkzeug.http import generate_etag
+
+
+class MemoryBackend:
+    """
+    In-process LRU store whose entries expire after a fixed TTL.
+
+    Any object providing the same `get`, `set` and `clear` methods can be used as a
+    cache backend instead, e.g. a thin wrapper around a shared Redis instance.
+    """
+
+    def __init__(self, maxsize=256, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ResponseCache:
+    """
+    Read-through cache of serialized response payloads, each stored with its ETag.
+
+    Attributes:
+        backend: Store holding `(payload, etag)` pairs, a MemoryBackend by default.
+        hits (int): Lookups answered from the cache since the process started.
+        misses (int): Lookups that had to build the payload.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.backend = MemoryBackend()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        """Configures the backend from `<NAME>_CACHE_*` settings of the app."""
+        prefix = f"{self.name.upper()}_CACHE"
+        backend = app.config.setdefault(f"{prefix}_BACKEND", None)
+        self.backend = backend or MemoryBackend(
+            maxsize=app.config.setdefault(f"{prefix}_SIZE", 256),
+            ttl=app.config.setdefault(f"{prefix}_TTL", 300),
+        )
+
+    def get_or_build(self, key, build, etag=None):
+        """
+        Returns the cached `(payload, etag)` pair for `key`.
+
+        On a miss `build` is called to produce the payload bytes, which are stored
+        together with `etag`, or with a hash of the payload when no ETag is given.
+        """
+        entry = self.lookup(key)
+        if entry is None:
+            entry = self.store(key, build(), etag)
+        return entry
+
+    def lookup(self, key):
+        """Returns the cached `(payload, etag)` pair for `key`, or None on a miss."""
+        entry = self.backend.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def store(self, key, payload, etag=None):
+        """Caches `payload` under `key` and returns the `(payload, etag)` pair."""
+        entry = (payload, etag or generate_etag(payload))
+        self.backend.set(key, entry)
+        return entry
+
+    def invalidate(self):
+        """Drops every cached payload; called after writes that change the data."""
+        self.backend.clear()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+def query_key(args):
+    """Cache key for a request's query arguments, independent of their order."""
+    return urlencode(sorted(args.items(multi=True)))
+
+
+# Serialized GET /exercises responses, keyed by query string
+exercise_cache = ResponseCache("exercise")
@@ -0,0 +1,193 @@
+from collections import defaultdict
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+from flask_sqlalchemy.session import Session
+from sqlalchemy import delete, event, exists, func, literal, select
+from sqlalchemy.orm import aliased
+
+from models import Change, Exercise, User, Workout, WorkoutExercise, db
+from pagination import InvalidPageRequest
+from serialization import (
+    exercise_json,
+    exercise_select,
+    user_json,
+    user_select,
+    workout_exercise_json,
+    workout_exercise_select,
+    workout_json,
+    workout_select,
+)
+
+ENTITIES = {
+    Exercise: "exercise",
+    User: "user",
+    Workout: "workout",
+    WorkoutExercise: "workout_exercise",
+}
+# `(model, select, to_json)` reading the current state of each entity
+CURRENT = {
+    "exercise": (Exercise, exercise_select, exercise_json),
+    "user": (User, user_select, user_json),
+    "workout": (Workout, workout_select, workout_json),
+    "workout_exercise": (
+        WorkoutExercise,
+        workout_exercise_select,
+        workout_exercise_json,
+    ),
+}
+# Key of the PostgreSQL advisory lock that orders sequence numbers by commit
+LOCK_KEY = 0x66697463
+
+
+def record(session, entity, ids, deleted=False):
+    """
+    Queues changes to be logged when `session` commits.
+
+    ORM writes are picked up by the session events below; rows written with Core
+    statements have to be passed here explicitly.
+    """
+    pending = session.info.setdefault("changes", {})
+    for id in ids:
+        pending[(entity, id)] = deleted
+
+
+@event.listens_for(Session, "after_flush")
+def track_changes(session, flush_context):
+    for obj in session.new:
+        if type(obj) in ENTITIES:
+            record(session, ENTITIES[type(obj)], [obj.id])
+    for obj in session.dirty:
+        if type(obj) in ENTITIES and session.is_modified(obj):
+            record(session, ENTITIES[type(obj)], [obj.id])
+    for obj in session.deleted:
+        if type(obj) in ENTITIES:
+            record(session, ENTITIES[type(obj)], [obj.id], deleted=True)
+
+
+@event.listens_for(Session, "before_commit")
+def write_changes(session):
+    """
+    Appends the queued changes to the log right before the transaction commits.
+
+    On PostgreSQL an advisory lock held until the commit serializes this last step
+    of concurrent writers, so sequence numbers become visible in increasing order.
+    """
+    session.flush()
+    pending = session.info.pop("changes", None)
+    if not pending:
+        return
+    if session.get_bind().dialect.name == "postgresql":
+        session.execute(select(func.pg_advisory_xact_lock(LOCK_KEY)))
+    now = datetime.utcnow()
+    session.execute(
+        Change.__table__.insert(),
+        [
+            {"entity": entity, "entity_id": id, "deleted": deleted, "changed_at": now}
+            for (entity, id), deleted in pending.items()
+        ],
+    )
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_changes(session):
+    session.info.pop("changes", None)
+
+
+def parse_since(value):
+    """Returns the sequence number given in `?since=`, 0 when it is absent."""
+    if value is None:
+        return 0
+    try:
+        since = int(value)
+    except ValueError as e:
+        raise InvalidPageRequest(f"invalid since: {value}") from e
+    if since < 0:
+        raise InvalidPageRequest("since must not be negative")
+    return since
+
+
+def changes_since(since, limit):
+    """
+    Returns the next `limit` log entries after `since` as the current state of the
+    entities they name, plus the `since` to ask for next and whether there is more.
+
+    Entities written several times within the page are returned once. Their state
+    is read with one query per entity type.
+    """
+    entries = db.session.scalars(
+        select(Change).where(Change.seq > since).order_by(Change.seq).limit(limit + 1)
+    ).all()
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    latest = {}
+    for entry in entries:
+        key = (entry.entity, entry.entity_id)
+        latest.pop(key, None)
+        latest[key] = entry
+
+    live = defaultdict(list)
+    for (entity, id), entry in latest.items():
+        if not entry.deleted:
+            live[entity].append(id)
+    current = {}
+    for entity, ids in live.items():
+        model, statement, to_json = CURRENT[entity]
+        for row in db.session.execute(statement().where(model.id.in_(ids))):
+            current[(entity, row.id)] = to_json(row)
+
+    changes = []
+    for key, entry in latest.items():
+        data = current.get(key)
+        changes.append(
+            {
+                "seq": entry.seq,
+                "entity": entry.entity,
+                "id": entry.entity_id,
+                # Rows deleted after this page are reported as deleted right away
+                "deleted": data is None,
+                "data": data,
+            }
+        )
+    next_since = entries[-1].seq if entries else since
+    return changes, next_since, has_more
+
+
+def compact(session):
+    """Deletes the entries superseded by a newer one for the same entity."""
+    newer = aliased(Change)
+    superseded = exists().where(
+        newer.entity == Change.entity,
+        newer.entity_id == Change.entity_id,
+        newer.seq > Change.seq,
+    )
+    return session.execute(delete(Change).where(superseded)).rowcount
+
+
+def backfill(session):
+    """Logs every existing row once, so that clients starting at 0 get everything."""
+    columns = ["entity", "entity_id", "deleted", "changed_at"]
+    now = datetime.utcnow()
+    for model, entity in ENTITIES.items():
+        rows = select(literal(entity), model.id, literal(False), literal(now))
+        session.execute(Change.__table__.insert().from_select(columns, rows))
+
+
+changes_cli = AppGroup("changes", help="Maintain the change log.")
+
+
+@changes_cli.command("compact")
+def compact_command():
+    """Delete the log entries superseded by newer ones."""
+    deleted = compact(db.session)
+    db.session.commit()
+    click.echo(f"{deleted} superseded entries deleted")
+
+
+@changes_cli.command("backfill")
+def backfill_command():
+    """Log every existing row, e.g. after enabling the change log on old data."""
+    backfill(db.session)
+    db.session.commit()
+    click.echo("existing rows logged")
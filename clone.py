@@ -0,0 +1,204 @@
+"""
+Creating workouts as copies of an earlier workout or of a template.
+
+The exercises are copied with a single INSERT ... SELECT, so a workout of any size
+takes the same few statements. A progressive overload can be applied on the way,
+computed by the database:
+
+    {"overload": {"weights_percent": 2.5, "weights_round": 1.25, "repetitions": 1}}
+
+`weights_percent` and `duration_percent` scale weights and durations, `sets` and
+`repetitions` are added, down to at least one set and no repetitions, and
+`weights_round` rounds the new weights to a multiple, e.g. of the smallest plates
+at hand.
+"""
+
+from datetime import datetime
+from uuid import uuid4
+
+from sqlalchemy import DateTime, Numeric, case, cast, func, insert, literal, select
+
+from batch import parse_created_at
+from changes import record
+from models import GUID, TemplateExercise, Workout, WorkoutExercise, random_uuid
+from summary import record_core_writes
+
+SCALED = {"weights_percent": "weights", "duration_percent": "duration"}
+# The least value an added overload leaves
+ADDED = {"sets": 1, "repetitions": 0}
+
+
+class InvalidClone(ValueError):
+    """Raised when the body of a clone request cannot be applied."""
+
+
+def parse_clone_request(data):
+    """Returns the overload and the `created_at` of a clone request body."""
+    data = data or {}
+    created_at = None
+    if "created_at" in data:
+        created_at = parse_created_at(data["created_at"])
+        if created_at is None:
+            raise InvalidClone("invalid created_at")
+    return parse_overload(data.get("overload")), created_at
+
+
+def parse_overload(data):
+    """Returns the validated overload of a request, `{}` when there is none."""
+    if data is None:
+        return {}
+    if not isinstance(data, dict):
+        raise InvalidClone("overload must be an object")
+    for name, value in data.items():
+        if name not in (*SCALED, *ADDED, "weights_round"):
+            raise InvalidClone(f"unknown overload {name}")
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise InvalidClone(f"overload {name} must be a number")
+        if name in ADDED and not isinstance(value, int):
+            raise InvalidClone(f"overload {name} must be an integer")
+        if name in SCALED and value <= -100:
+            raise InvalidClone(f"overload {name} must be above -100")
+    if data.get("weights_round", 1) <= 0:
+        raise InvalidClone("overload weights_round must be positive")
+    return data
+
+
+def progressed_columns(source, overload):
+    """
+    Returns the sets, repetitions, weights and duration of the rows of `source`, a
+    table with these columns, with `overload` applied.
+    """
+    columns = {
+        name: source.c[name] for name in ("sets", "repetitions", "weights", "duration")
+    }
+    for name, least in ADDED.items():
+        if overload.get(name):
+            added = columns[name] + overload[name]
+            columns[name] = case((added < least, least), else_=added)
+    scaled = set()
+    for name, column in SCALED.items():
+        if overload.get(name):
+            columns[column] = columns[column] * (1 + overload[name] / 100)
+            scaled.add(column)
+    if "weights_round" in overload:
+        step = overload["weights_round"]
+        columns["weights"] = func.round(columns["weights"] / step) * step
+        scaled.add("weights")
+    for column in scaled:
+        # To hundredths, so that 60 kg + 2.5% is 61.5 and not 61.49999999999999;
+        # PostgreSQL rounds to decimals only numerics
+        columns[column] = func.round(cast(columns[column], Numeric), 2)
+    return [column.label(name) for name, column in columns.items()]
+
+
+def copy_exercises(session, source, criteria, workout, overload):
+    """
+    Copies the rows of `source` matching `criteria` into `workout`, a row dictionary,
+    with one INSERT ... SELECT, and returns the inserted rows.
+
+    `source` is the workout_exercises or template_exercises table.
+    """
+    table = WorkoutExercise.__table__
+    rows = select(
+        random_uuid(),
+        literal(workout["id"], GUID()),
+        literal(workout["created_at"], DateTime()),
+        source.c.exercise_id,
+        *progressed_columns(source, overload),
+        literal(workout["updated_at"], DateTime()),
+    ).where(*criteria)
+    columns = [
+        "id",
+        "workout_id",
+        "workout_created_at",
+        "exercise_id",
+        "sets",
+        "repetitions",
+        "weights",
+        "duration",
+        "updated_at",
+    ]
+    inserted = session.execute(
+        insert(table)
+        .from_select(columns, rows)
+        .returning(
+            table.c.id,
+            table.c.workout_id,
+            table.c.exercise_id,
+            table.c.sets,
+            table.c.repetitions,
+            table.c.weights,
+            table.c.duration,
+        )
+    ).all()
+    record_core_writes(session, [row._asdict() for row in inserted], 1)
+    return inserted
+
+
+def new_workout(session, user_id, created_at=None):
+    """Inserts an empty workout of `user_id` and returns its row dictionary."""
+    now = datetime.utcnow()
+    workout = {
+        "id": uuid4(),
+        "user_workout_id": user_id,
+        "created_at": created_at or now,
+        "updated_at": now,
+    }
+    session.execute(insert(Workout.__table__), [workout])
+    record(session, "workout", [workout["id"]])
+    return workout
+
+
+def clone_workout(session, source, overload, created_at=None):
+    """
+    Creates a workout of the same user with the exercises of workout `source`, and
+    returns its row dictionary and its exercise rows. The caller commits.
+    """
+    workout = new_workout(session, source.user_workout_id, created_at)
+    table = WorkoutExercise.__table__
+    criteria = [
+        table.c.workout_id == source.id,
+        table.c.workout_created_at == source.created_at,
+    ]
+    return workout, copy_exercises(session, table, criteria, workout, overload)
+
+
+def start_template(session, template, overload, created_at=None):
+    """
+    Creates a workout of the template's user with the template's exercises, and
+    returns its row dictionary and its exercise rows. The caller commits.
+    """
+    workout = new_workout(session, template.user_id, created_at)
+    table = TemplateExercise.__table__
+    criteria = [table.c.template_id == template.id]
+    return workout, copy_exercises(session, table, criteria, workout, overload)
+
+
+def template_from_workout(session, template_id, workout):
+    """Copies the exercises of `workout` into template `template_id` in SQL."""
+    table = WorkoutExercise.__table__
+    session.execute(
+        insert(TemplateExercise.__table__).from_select(
+            [
+                "id",
+                "template_id",
+                "exercise_id",
+                "sets",
+                "repetitions",
+                "weights",
+                "duration",
+            ],
+            select(
+                random_uuid(),
+                literal(template_id, GUID()),
+                table.c.exercise_id,
+                table.c.sets,
+                table.c.repetitions,
+                table.c.weights,
+                table.c.duration,
+            ).where(
+                table.c.workout_id == workout.id,
+                table.c.workout_created_at == workout.created_at,
+            ),
+        )
+    )
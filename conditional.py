@@ -0,0 +1,94 @@
+from datetime import datetime, timezone
+from hashlib import sha1
+
+from flask import make_response, request
+from sqlalchemy import func, select
+from werkzeug.http import is_resource_modified
+
+from models import Exercise, User, Workout, WorkoutExercise
+
+
+def validators(rows, req=None, dated=True):
+    """
+    Returns the `(etag, last_modified)` pair for a response built from versioned rows.
+
+    `rows` are the results of a cheap version query (counts, IDs and `updated_at`
+    timestamps) rather than the data itself. The request path and query string are
+    mixed into the ETag so every representation gets its own. `req` defaults to the
+    current Flask request.
+
+    Collections pass `dated=False` and get no Last-Modified: deleting a row leaves
+    the newest `updated_at` of the others unchanged, so only the ETag, which
+    includes the row count, notices.
+    """
+    digest = sha1((req or request).full_path.encode())
+    timestamps = []
+    for row in rows:
+        digest.update(repr(tuple(row)).encode())
+        timestamps += [value for value in row if isinstance(value, datetime)]
+    last_modified = None
+    if timestamps and dated:
+        last_modified = max(timestamps).replace(tzinfo=timezone.utc)
+    return digest.hexdigest(), last_modified
+
+
+def not_modified(etag, last_modified, req=None):
+    """Returns True when the client's If-None-Match/If-Modified-Since still match."""
+    return not is_resource_modified(
+        (req or request).environ, etag=etag, last_modified=last_modified
+    )
+
+
+def with_validators(response, etag, last_modified):
+    """Sets the ETag and Last-Modified headers on `response` and returns it."""
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    return response
+
+
+def not_modified_response(etag, last_modified):
+    return with_validators(make_response("", 304), etag, last_modified)
+
+
+def exercise_versions(criteria):
+    """
+    Version query for the exercise list; creators are included for their usernames.
+
+    Like the other version queries it relies on the `updated_at` indexes, which turn
+    each `max` into a read of the last index entry.
+    """
+    return select(
+        func.count(Exercise.id),
+        func.max(Exercise.updated_at),
+        select(func.max(User.updated_at)).scalar_subquery(),
+    ).where(*criteria)
+
+
+def user_versions():
+    return select(func.count(User.id), func.max(User.updated_at))
+
+
+def workout_versions(ids):
+    """Version query for the workouts whose IDs are selected by `ids`, one row each."""
+    page = ids.subquery()
+    return (
+        select(
+            Workout.id,
+            Workout.updated_at,
+            User.updated_at,
+            func.count(WorkoutExercise.id),
+            func.max(WorkoutExercise.updated_at),
+        )
+        .join(page, page.c.id == Workout.id)
+        .join(Workout.user)
+        .outerjoin(Workout.workout_exercises)
+        .group_by(Workout.id, Workout.updated_at, User.updated_at)
+        .order_by(Workout.id)
+    )
+
+
+def workout_exercise_versions(criteria):
+    return select(
+        func.count(WorkoutExercise.id), func.max(WorkoutExercise.updated_at)
+    ).where(*criteria)
@@ -0,0 +1,5 @@
+#!/bin/sh
+# Run by the postgres image when it initializes the primary's data directory:
+# lets the `db-replica` service stream the WAL with the regular credentials.
+set -e
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
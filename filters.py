@@ -0,0 +1,98 @@
+import operator
+from datetime import datetime, timedelta
+from uuid import UUID
+
+from sqlalchemy import select
+
+from models import Category, Exercise, Workout, WorkoutExercise
+
+EXERCISE_SORTS = {"name": Exercise.name, "category": Exercise.category}
+WORKOUT_SORTS = {"created_at": Workout.created_at}
+
+
+class InvalidFilter(ValueError):
+    """Raised when a filtering or sorting query parameter cannot be used."""
+
+
+def parse_uuid_arg(args, name):
+    """Returns the UUID given in query parameter `name`, or None when it is absent."""
+    if name not in args:
+        return None
+    try:
+        return UUID(args[name])
+    except ValueError as e:
+        raise InvalidFilter(f"invalid {name}: {args[name]}") from e
+
+
+def parse_sort(args, sorts, default):
+    """
+    Returns the `(column, descending)` pair requested with `?sort=`.
+
+    A leading "-" sorts in descending order, e.g. `?sort=-created_at`.
+    """
+    value = args.get("sort", default)
+    descending = value.startswith("-")
+    name = value.lstrip("-")
+    if name not in sorts:
+        raise InvalidFilter(f"cannot sort by {name}, use one of: {', '.join(sorts)}")
+    return sorts[name], descending
+
+
+def date_bounds(args):
+    """
+    Returns the `(operator, datetime)` bounds given by the `from`/`to` parameters.
+
+    Both bounds are inclusive; a `to` given as a plain date covers that whole day.
+    """
+    bounds = []
+    for name in ("from", "to"):
+        if name not in args:
+            continue
+        try:
+            value = datetime.fromisoformat(args[name])
+        except ValueError as e:
+            raise InvalidFilter(f"invalid {name} date: {args[name]}") from e
+        if name == "from":
+            bounds.append((operator.ge, value))
+        elif len(args[name]) == 10:
+            bounds.append((operator.lt, value + timedelta(days=1)))
+        else:
+            bounds.append((operator.le, value))
+    return bounds
+
+
+def date_range(column, args):
+    """Returns the criteria for the `from`/`to` query parameters on a datetime column."""
+    return [compare(column, value) for compare, value in date_bounds(args)]
+
+
+def exercise_filters(args):
+    """Returns the criteria for `?category=` and `?created_by=` on the exercise list."""
+    criteria = []
+    if "category" in args:
+        # The name is looked up once, exercises are compared by integer key
+        category = select(Category.id).where(Category.name == args["category"])
+        criteria.append(Exercise.category_id == category.scalar_subquery())
+    created_by = parse_uuid_arg(args, "created_by")
+    if created_by:
+        criteria.append(Exercise.created_by == created_by)
+    return criteria
+
+
+def workout_filters(args):
+    """Returns the criteria for `?user=` and the `from`/`to` date range on workouts."""
+    criteria = date_range(Workout.created_at, args)
+    user = parse_uuid_arg(args, "user")
+    if user:
+        criteria.append(Workout.user_workout_id == user)
+    return criteria
+
+
+def workout_exercise_filters(args):
+    """Returns the criteria for `?workout_id=` and `?exercise_id=` on workout exercises."""
+    criteria = []
+    for name in ("workout_id", "exercise_id"):
+        value = parse_uuid_arg(args, name)
+        if value:
+            criteria.append(getattr(WorkoutExercise, name) == value)
+    return criteria
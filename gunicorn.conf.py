@@ -0,0 +1,24 @@
+"""
+Gunicorn settings for the production profile, tunable through the environment.
+
+Requests mostly wait on PostgreSQL, so each worker process runs a few threads
+(the gthread worker); keep GUNICORN_THREADS at or below DB_POOL_SIZE +
+DB_MAX_OVERFLOW so threads do not queue for connections.
+"""
+
+from multiprocessing import cpu_count
+from os import environ
+
+bind = environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(environ.get("GUNICORN_WORKERS", cpu_count() * 2 + 1))
+threads = int(environ.get("GUNICORN_THREADS", 4))
+worker_class = "gthread" if threads > 1 else "sync"
+timeout = int(environ.get("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(environ.get("GUNICORN_KEEPALIVE", 5))
+# Restart workers now and then so slow leaks cannot accumulate
+max_requests = int(environ.get("GUNICORN_MAX_REQUESTS", 10000))
+max_requests_jitter = int(environ.get("GUNICORN_MAX_REQUESTS_JITTER", 1000))
+# An empty GUNICORN_ACCESSLOG turns access logging off
+accesslog = environ.get("GUNICORN_ACCESSLOG", "-") or None
+errorlog = "-"
@@ -0,0 +1,157 @@
+from datetime import datetime, timedelta
+from functools import wraps
+from hashlib import sha1
+
+import click
+from flask import current_app, jsonify, make_response, request
+from flask.cli import AppGroup
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+
+from models import IdempotencyKey, db
+from ratelimit import client_key
+
+HEADER = "Idempotency-Key"
+DEFAULT_TTL = 24 * 3600
+
+idempotency_cli = AppGroup("idempotency", help="Manage stored idempotency keys.")
+
+
+def client_of(req):
+    """Hashes the identity of the client sending `req`, so API keys are not stored."""
+    key_header = current_app.config.get("RATELIMIT_KEY_HEADER", "X-API-Key")
+    return sha1(
+        client_key(req.headers, req.remote_addr, key_header).encode()
+    ).hexdigest()
+
+
+def fingerprint(req):
+    digest = sha1(f"{req.method} {req.path}\n".encode())
+    digest.update(req.get_data())
+    return digest.hexdigest()
+
+
+def expired_before():
+    ttl = current_app.config.get("IDEMPOTENCY_TTL", DEFAULT_TTL)
+    return datetime.utcnow() - timedelta(seconds=ttl)
+
+
+def claim(client, key, digest):
+    """
+    Reserves `key` of `client` in the current transaction and returns None, or
+    returns the record of an earlier request with that key.
+
+    A concurrent request holding the same key makes the insert wait until it commits
+    or rolls back, after which its record is returned or the key is free again.
+    """
+    record = db.session.get(IdempotencyKey, (client, key))
+    if record is not None and record.created_at < expired_before():
+        db.session.delete(record)
+        db.session.flush()
+        record = None
+    if record is not None:
+        return record
+    db.session.add(IdempotencyKey(client=client, key=key, fingerprint=digest))
+    try:
+        db.session.flush()
+    except IntegrityError:
+        db.session.rollback()
+        return db.session.get(IdempotencyKey, (client, key)) or IdempotencyKey(
+            client=client, key=key, fingerprint=digest
+        )
+    return None
+
+
+def replay(record, digest):
+    if record.fingerprint != digest:
+        return make_response(
+            jsonify({"message": f"{HEADER} was already used for another request"}),
+            422,
+        )
+    if record.status is None:
+        response = make_response(
+            jsonify({"message": f"a request with this {HEADER} is in progress"}), 409
+        )
+        response.headers["Retry-After"] = "1"
+        return response
+    response = make_response(record.body, record.status)
+    response.mimetype = "application/json"
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def store(client, key, digest, response):
+    """Saves the response of the request that claimed `key` and commits both."""
+    record = db.session.get(IdempotencyKey, (client, key))
+    if record is None:
+        # The view rolled back, taking the claim with it
+        record = IdempotencyKey(client=client, key=key, fingerprint=digest)
+        db.session.add(record)
+    record.status = response.status_code
+    record.body = response.get_data()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent retry stored its own response to the same rejected request
+        db.session.rollback()
+
+
+def release():
+    """Rolls back a failed request together with its claim, so it can be retried."""
+    db.session.rollback()
+
+
+def idempotent(view):
+    """
+    Replays the stored response to requests repeating an earlier Idempotency-Key.
+
+    Requests without the header run as usual. Keys are scoped by client, see
+    ratelimit.client_key. The commits of the view are deferred so that its changes
+    are committed together with its response, which is stored when its status is
+    below 500; after a server error everything is rolled back so the request can be
+    retried. A key reused with another method, path or body gets a 422.
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view(*args, **kwargs)
+        if not 0 < len(key) <= 255:
+            return make_response(
+                jsonify({"message": f"{HEADER} must be 1 to 255 characters"}), 400
+            )
+        client, digest = client_of(request), fingerprint(request)
+        record = claim(client, key, digest)
+        if record is not None:
+            return replay(record, digest)
+        db.session.info["deferred_commit"] = True
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            release()
+            raise
+        finally:
+            db.session.info.pop("deferred_commit", None)
+        if response.status_code >= 500:
+            release()
+        else:
+            store(client, key, digest, response)
+        return response
+
+    return wrapper
+
+
+def purge(before):
+    """Deletes the keys first seen before `before` and returns how many there were."""
+    result = db.session.execute(
+        delete(IdempotencyKey).where(IdempotencyKey.created_at < before)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+@idempotency_cli.command("purge")
+def purge_command():
+    """Delete the idempotency keys older than IDEMPOTENCY_TTL seconds."""
+    click.echo(f"{purge(expired_before())} expired keys deleted")
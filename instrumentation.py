@@ -0,0 +1,210 @@
+import logging
+from bisect import bisect_left
+from collections import defaultdict
+from threading import Lock
+from time import perf_counter
+
+from flask import current_app, g, has_app_context, make_response, request
+from sqlalchemy import event
+
+from models import db
+
+logger = logging.getLogger("fitapp.slow")
+
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+STATEMENT_BUCKETS = [1, 2, 3, 5, 10, 20, 50, 100, 200]
+
+
+class Histogram:
+    """
+    Prometheus-style cumulative histogram, one series per label set.
+
+    Values are kept per process; with several server workers each one reports
+    its own series.
+    """
+
+    def __init__(self, name, description, buckets, labels=("endpoint", "method")):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.labels = labels
+        self._series = defaultdict(lambda: [[0] * (len(buckets) + 1), 0.0])
+        self._lock = Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            counts, _ = series = self._series[labels]
+            counts[bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def expose(self):
+        """Returns the histogram in the Prometheus text exposition format."""
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            series = {labels: (list(c), s) for labels, (c, s) in self._series.items()}
+        for labels, (counts, total) in sorted(series.items()):
+            pairs = [f'{name}="{value}"' for name, value in zip(self.labels, labels)]
+            cumulative = 0
+            for bound, count in zip([*self.buckets, "+Inf"], counts):
+                cumulative += count
+                bucket = ",".join([*pairs, f'le="{bound}"'])
+                lines.append(f"{self.name}_bucket{{{bucket}}} {cumulative}")
+            label_text = ",".join(pairs)
+            lines.append(f"{self.name}_sum{{{label_text}}} {total}")
+            lines.append(f"{self.name}_count{{{label_text}}} {cumulative}")
+        return "\n".join(lines)
+
+
+class Instrumentation:
+    """
+    Opt-in per-request profiling of SQL, serialization and total latency.
+
+    Enabled with the INSTRUMENTATION setting; nothing is hooked into the app or the
+    engine otherwise. When enabled, responses carry a Server-Timing header,
+    `/metrics` exposes histograms per endpoint, and requests slower than
+    SLOW_REQUEST_MS are logged to "fitapp.slow" together with their SQL.
+    """
+
+    def __init__(self):
+        self.latency = Histogram(
+            "fitapp_request_duration_seconds",
+            "Total request latency.",
+            LATENCY_BUCKETS,
+        )
+        self.sql_time = Histogram(
+            "fitapp_request_sql_duration_seconds",
+            "Time spent executing SQL statements per request.",
+            LATENCY_BUCKETS,
+        )
+        self.sql_count = Histogram(
+            "fitapp_request_sql_statements",
+            "Number of SQL statements executed per request.",
+            STATEMENT_BUCKETS,
+        )
+        self.serialization = Histogram(
+            "fitapp_request_serialization_seconds",
+            "Time spent encoding JSON per request.",
+            LATENCY_BUCKETS,
+        )
+
+    def init_app(self, app):
+        app.config.setdefault("INSTRUMENTATION", False)
+        app.config.setdefault("SLOW_REQUEST_MS", 500)
+        if not app.config["INSTRUMENTATION"]:
+            return
+        with app.app_context():
+            # Replica binds included, so routed reads are timed too
+            engines = list(db.engines.values())
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", after_cursor_execute)
+            event.listen(engine, "handle_error", handle_error)
+        app.json.dumps = timed_dumps(app.json.dumps)
+        app.before_request(start_timing)
+        app.after_request(self.finish_timing)
+        app.add_url_rule("/metrics", "metrics", self.metrics)
+
+    def finish_timing(self, response):
+        timing = g.pop("timing", None)
+        if timing is None:
+            return response
+        total = perf_counter() - timing["start"]
+        endpoint = request.endpoint or "unmatched"
+        labels = (endpoint, request.method)
+        self.latency.observe(total, *labels)
+        self.sql_time.observe(timing["sql_time"], *labels)
+        self.sql_count.observe(len(timing["statements"]), *labels)
+        self.serialization.observe(timing["serialization"], *labels)
+
+        response.headers["Server-Timing"] = ", ".join(
+            [
+                f'db;dur={timing["sql_time"] * 1000:.1f};'
+                f'desc="{len(timing["statements"])} statements"',
+                f'serialize;dur={timing["serialization"] * 1000:.1f}',
+                f"total;dur={total * 1000:.1f}",
+            ]
+        )
+        if total * 1000 >= current_app.config["SLOW_REQUEST_MS"]:
+            logger.warning(
+                "slow request %s %s took %.1f ms, %d statements in %.1f ms:\n%s",
+                request.method,
+                request.full_path,
+                total * 1000,
+                len(timing["statements"]),
+                timing["sql_time"] * 1000,
+                "\n".join(
+                    f"  {duration * 1000:8.1f} ms  {statement}"
+                    for statement, duration in timing["statements"]
+                ),
+            )
+        return response
+
+    def metrics(self):
+        histograms = [self.latency, self.sql_time, self.sql_count, self.serialization]
+        response = make_response(
+            "\n".join(histogram.expose() for histogram in histograms) + "\n"
+        )
+        response.mimetype = "text/plain; version=0.0.4"
+        return response
+
+
+def start_timing():
+    g.timing = {
+        "start": perf_counter(),
+        "statements": [],
+        "sql_time": 0.0,
+        "serialization": 0.0,
+    }
+
+
+def current_timing():
+    return g.get("timing") if has_app_context() else None
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the execution context, which is dropped whether the statement
+    # succeeds or fails
+    if context is not None:
+        context.query_start = perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    record_statement(context, statement)
+
+
+def handle_error(exception_context):
+    """Times failed statements too, up to the error."""
+    record_statement(exception_context.execution_context, exception_context.statement)
+
+
+def record_statement(context, statement):
+    start = getattr(context, "query_start", None)
+    if start is None:
+        return
+    del context.query_start
+    duration = perf_counter() - start
+    timing = current_timing()
+    if timing is not None:
+        timing["statements"].append((statement, duration))
+        timing["sql_time"] += duration
+
+
+def timed_dumps(dumps):
+    """Wraps a JSON provider's `dumps` to add its run time to the current request."""
+
+    def wrapper(obj, **kwargs):
+        start = perf_counter()
+        try:
+            return dumps(obj, **kwargs)
+        finally:
+            timing = current_timing()
+            if timing is not None:
+                timing["serialization"] += perf_counter() - start
+
+    return wrapper
+
+
+instrumentation = Instrumentation()
@@ -0,0 +1,440 @@
+"""
+Background jobs for work too heavy for a request: cascading deletes, exports and
+rebuilds of the volume tables.
+
+Jobs are rows of the `jobs` table, so they survive restarts and any number of
+worker processes can share them:
+
+    flask jobs work --concurrency 2
+
+Each worker thread claims the oldest queued job and holds a lease on it, renewed
+as the job makes progress. A job whose worker died is taken over once its lease
+expires, up to MAX_ATTEMPTS attempts, so handlers have to be safe to run again.
+With JOBS_EAGER set, jobs run inside the request that queued them instead.
+"""
+
+import logging
+import os
+import shutil
+from datetime import datetime, timedelta
+from pathlib import Path
+from threading import Event, Thread
+from uuid import UUID
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import and_, delete, or_, select, tuple_, update
+
+from archive import archive_dir, archived_exercises_of
+from cache import exercise_cache
+from changes import record
+from models import (
+    ArchivedMonth,
+    Exercise,
+    ExerciseVolume,
+    Job,
+    TemplateExercise,
+    User,
+    UserVolume,
+    Workout,
+    WorkoutExercise,
+    WorkoutTemplate,
+    db,
+)
+from serialization import workout_exercises_of, workout_select, workouts_json
+from summary import rebuild, record_core_writes
+
+DEFAULT_CONCURRENCY = 2
+# Workouts with more exercises are deleted by a job rather than in the request
+DEFAULT_INLINE_ROWS = 1000
+DEFAULT_LEASE = 300
+DEFAULT_POLL_INTERVAL = 1.0
+DEFAULT_TTL = 7 * 24 * 3600
+MAX_ATTEMPTS = 3
+# Rows deleted or exported per transaction, so no lock is held for long
+CHUNK = 1000
+ACTIVE = ("queued", "running")
+FINISHED = ("succeeded", "failed")
+
+logger = logging.getLogger("fitapp.jobs")
+jobs_cli = AppGroup("jobs", help="Run and manage background jobs.")
+handlers = {}
+
+
+def handler(kind):
+    """Registers the decorated function as the handler of jobs of `kind`."""
+
+    def register(function):
+        handlers[kind] = function
+        return function
+
+    return register
+
+
+def lease():
+    seconds = current_app.config.get("JOBS_LEASE", DEFAULT_LEASE)
+    return datetime.utcnow() + timedelta(seconds=seconds)
+
+
+def export_dir():
+    """Returns JOBS_EXPORT_DIR, by default the `exports` folder of the instance path."""
+    directory = current_app.config.get("JOBS_EXPORT_DIR")
+    return Path(directory or Path(current_app.instance_path) / "exports")
+
+
+def submit(kind, params, key=None):
+    """
+    Queues a job of `kind` and commits, returning it.
+
+    When `key` is given and a job with that key is still queued or running, that
+    job is returned instead. With JOBS_EAGER the job is run before returning.
+    """
+    if key is not None:
+        active = Job.query.filter(Job.key == key, Job.status.in_(ACTIVE)).first()
+        if active is not None:
+            return active
+    job = Job(kind=kind, params=params, key=key)
+    db.session.add(job)
+    db.session.commit()
+    if current_app.config.get("JOBS_EAGER"):
+        if claim(db.session, "eager", job.id) is not None:
+            run(db.session, job.id, retry=False)
+    return job
+
+
+def claim(session, worker, job_id=None):
+    """
+    Marks the oldest claimable job, or job `job_id`, as running for `worker` and
+    returns its ID, or None when there is nothing to do.
+
+    Queued jobs are claimable, as are running ones whose lease expired. The
+    conditional update makes sure only one worker wins a job; on PostgreSQL
+    SKIP LOCKED also keeps workers from waiting on each other.
+    """
+    now = datetime.utcnow()
+    claimable = or_(
+        Job.status == "queued",
+        and_(
+            Job.status == "running",
+            Job.locked_until < now,
+            Job.attempts < MAX_ATTEMPTS,
+        ),
+    )
+    if job_id is None:
+        job_id = session.scalar(
+            select(Job.id)
+            .where(claimable)
+            .order_by(Job.created_at)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )
+    claimed = job_id is not None and (
+        session.execute(
+            update(Job)
+            .where(Job.id == job_id, claimable)
+            .values(
+                status="running",
+                attempts=Job.attempts + 1,
+                progress=0,
+                worker=worker,
+                started_at=now,
+                locked_until=lease(),
+            )
+        ).rowcount
+        > 0
+    )
+    session.commit()
+    return job_id if claimed else None
+
+
+def fail_abandoned(session):
+    """Fails the jobs whose last allowed attempt lost its worker."""
+    session.execute(
+        update(Job)
+        .where(
+            Job.status == "running",
+            Job.locked_until < datetime.utcnow(),
+            Job.attempts >= MAX_ATTEMPTS,
+        )
+        .values(
+            status="failed",
+            error="worker lost",
+            finished_at=datetime.utcnow(),
+            locked_until=None,
+        )
+    )
+    session.commit()
+
+
+def run(session, job_id, retry=True):
+    """
+    Runs a claimed job and records its result.
+
+    A failed attempt is queued again until MAX_ATTEMPTS, unless `retry` is False.
+    """
+    job = session.get(Job, job_id)
+    kind = job.kind
+    try:
+        result = handlers[kind](session, job, **job.params)
+    except Exception as e:
+        session.rollback()
+        logger.exception("job %s (%s) failed", job_id, kind)
+        job = session.get(Job, job_id)
+        job.error = str(e)
+        if retry and job.attempts < MAX_ATTEMPTS:
+            job.status = "queued"
+        else:
+            job.status = "failed"
+            job.finished_at = datetime.utcnow()
+    else:
+        job = session.get(Job, job_id)
+        job.status = "succeeded"
+        job.result = result
+        job.error = None
+        job.finished_at = datetime.utcnow()
+    job.locked_until = None
+    session.commit()
+
+
+def progress(session, job, count):
+    """Commits the work done so far, adding `count` rows to the job's progress."""
+    job.progress += count
+    job.locked_until = lease()
+    session.commit()
+
+
+class Worker:
+    """
+    Runs jobs in `concurrency` threads until stopped.
+
+    Every thread has its own app context, hence its own session and connection, so
+    at most `concurrency` jobs hold a database connection at once.
+    """
+
+    def __init__(self, app, concurrency, poll_interval):
+        self.app = app
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.stopping = Event()
+
+    def loop(self, name):
+        with self.app.app_context():
+            while not self.stopping.is_set():
+                try:
+                    fail_abandoned(db.session)
+                    job_id = claim(db.session, name)
+                    if job_id is not None:
+                        run(db.session, job_id)
+                except Exception:
+                    db.session.rollback()
+                    logger.exception("worker %s failed to claim a job", name)
+                    job_id = None
+                if job_id is None:
+                    self.stopping.wait(self.poll_interval)
+
+    def run(self):
+        prefix = f"{os.uname().nodename}:{os.getpid()}"
+        threads = [
+            Thread(target=self.loop, args=(f"{prefix}:{i}",), daemon=True)
+            for i in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            # Running jobs finish their current chunk; the lease covers the rest
+            self.stopping.set()
+
+
+def delete_exercises(session, workouts):
+    """
+    Deletes up to CHUNK exercises of `workouts`, `(id, created_at)` rows, keeping
+    the volume tables and the change log in step, and returns how many.
+    """
+    table = WorkoutExercise.__table__
+    created = [workout.created_at for workout in workouts]
+    in_workouts = [
+        table.c.workout_id.in_([workout.id for workout in workouts]),
+        table.c.workout_created_at.between(min(created), max(created)),
+    ]
+    ids = session.scalars(select(table.c.id).where(*in_workouts).limit(CHUNK)).all()
+    if not ids:
+        return 0
+    rows = session.execute(
+        delete(table)
+        .where(table.c.id.in_(ids), *in_workouts)
+        .returning(
+            table.c.id,
+            table.c.workout_id,
+            table.c.exercise_id,
+            table.c.sets,
+            table.c.repetitions,
+            table.c.weights,
+            table.c.duration,
+        )
+    ).all()
+    record_core_writes(session, [row._asdict() for row in rows], -1)
+    return len(rows)
+
+
+@handler("delete_workout")
+def delete_workout(session, job, workout_id):
+    """Deletes a workout, its exercises CHUNK at a time."""
+    workout = session.execute(
+        select(Workout.id, Workout.created_at).where(Workout.id == UUID(workout_id))
+    ).one_or_none()
+    if workout is None:
+        return {"workout_exercises": 0}
+    deleted = 0
+    while count := delete_exercises(session, [workout]):
+        deleted += count
+        progress(session, job, count)
+    session.delete(session.get(Workout, workout.id))
+    session.commit()
+    return {"workout_exercises": deleted}
+
+
+@handler("delete_user")
+def delete_user(session, job, user_id):
+    """
+    Deletes a user with all their workouts, CHUNK rows per transaction.
+
+    Their templates and archived months are removed as well, and custom exercises
+    they created stay in the catalogue without a creator.
+    """
+    user_id = UUID(user_id)
+    counts = {"workouts": 0, "workout_exercises": 0}
+    while True:
+        workouts = session.execute(
+            select(Workout.id, Workout.created_at)
+            .where(Workout.user_workout_id == user_id)
+            .order_by(Workout.created_at)
+            .limit(CHUNK)
+        ).all()
+        if not workouts:
+            break
+        while count := delete_exercises(session, workouts):
+            counts["workout_exercises"] += count
+            progress(session, job, count)
+        keys = [(workout.id, workout.created_at) for workout in workouts]
+        session.execute(
+            delete(Workout.__table__).where(
+                tuple_(Workout.id, Workout.created_at).in_(keys)
+            )
+        )
+        record(session, "workout", [workout.id for workout in workouts], deleted=True)
+        counts["workouts"] += len(workouts)
+        progress(session, job, len(workouts))
+
+    exercises = session.scalars(
+        update(Exercise.__table__)
+        .where(Exercise.created_by == user_id)
+        .values(created_by=None, updated_at=datetime.utcnow())
+        .returning(Exercise.id)
+    ).all()
+    record(session, "exercise", exercises)
+    templates = select(WorkoutTemplate.id).where(WorkoutTemplate.user_id == user_id)
+    session.execute(
+        delete(TemplateExercise).where(TemplateExercise.template_id.in_(templates))
+    )
+    # Archived exercises were never subtracted from the volume tables
+    for model in (WorkoutTemplate, ArchivedMonth, UserVolume, ExerciseVolume):
+        session.execute(delete(model).where(model.user_id == user_id))
+    user = session.get(User, user_id)
+    if user is not None:
+        session.delete(user)
+    session.commit()
+    exercise_cache.invalidate()
+    shutil.rmtree(archive_dir() / str(user_id), ignore_errors=True)
+    return counts
+
+
+@handler("export_user")
+def export_user(session, job, user_id):
+    """
+    Writes every workout of a user, with its exercises, to an NDJSON file in the
+    export directory, in the format of GET /workouts.
+    """
+    directory = export_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{job.id}.ndjson"
+    partial = path.with_suffix(".partial")
+    key = tuple_(Workout.created_at, Workout.id)
+    statement = (
+        workout_select()
+        .where(Workout.user_workout_id == UUID(user_id))
+        .order_by(Workout.created_at, Workout.id)
+        .limit(CHUNK)
+    )
+    count = 0
+    with open(partial, "w") as out:
+        workouts = session.execute(statement).all()
+        while workouts:
+            exercises = session.execute(workout_exercises_of(workouts)).all()
+            exercises += archived_exercises_of(workouts)
+            for data in workouts_json(workouts, exercises):
+                out.write(current_app.json.dumps(data) + "\n")
+            count += len(workouts)
+            progress(session, job, len(workouts))
+            last = (workouts[-1].created_at, workouts[-1].id)
+            workouts = session.execute(statement.where(key > last)).all()
+    os.replace(partial, path)
+    return {"file": path.name, "workouts": count}
+
+
+@handler("rebuild_summary")
+def rebuild_summary(session, job):
+    """Recomputes the volume tables, like `flask summary rebuild`."""
+    rebuild(session)
+    session.commit()
+    return {}
+
+
+def purge(before):
+    """Deletes the jobs finished before `before`, with their exports."""
+    jobs = Job.query.filter(Job.status.in_(FINISHED), Job.finished_at < before).all()
+    for job in jobs:
+        if job.result and "file" in job.result:
+            (export_dir() / job.result["file"]).unlink(missing_ok=True)
+    db.session.execute(delete(Job).where(Job.id.in_([job.id for job in jobs])))
+    db.session.commit()
+    return len(jobs)
+
+
+@jobs_cli.command("work")
+@click.option(
+    "--concurrency",
+    type=int,
+    help=f"Jobs run at once; JOBS_CONCURRENCY ({DEFAULT_CONCURRENCY}) by default.",
+)
+def work_command(concurrency):
+    """Run queued jobs until interrupted."""
+    config = current_app.config
+    worker = Worker(
+        current_app._get_current_object(),
+        concurrency or config.get("JOBS_CONCURRENCY", DEFAULT_CONCURRENCY),
+        config.get("JOBS_POLL_INTERVAL", DEFAULT_POLL_INTERVAL),
+    )
+    click.echo(f"running jobs in {worker.concurrency} threads")
+    worker.run()
+
+
+@jobs_cli.command("enqueue")
+@click.argument("kind", type=click.Choice(sorted(handlers)))
+@click.argument("params", nargs=-1)
+def enqueue_command(kind, params):
+    """Queue a job, passing its parameters as NAME=VALUE."""
+    job = submit(kind, dict(param.split("=", 1) for param in params))
+    click.echo(f"job {job.id} {job.status}")
+
+
+@jobs_cli.command("purge")
+def purge_command():
+    """Delete the jobs finished more than JOBS_TTL seconds ago."""
+    ttl = current_app.config.get("JOBS_TTL", DEFAULT_TTL)
+    before = datetime.utcnow() - timedelta(seconds=ttl)
+    click.echo(f"{purge(before)} finished jobs deleted")
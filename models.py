@@ -1,11 +1,142 @@
+import logging
 from datetime import datetime
-from uuid import uuid4
+from uuid import UUID, uuid4
 
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.dialects.postgresql import UUID
+from flask_sqlalchemy.session import Session
+from sqlalchemy import LargeBinary, event, func, literal_column, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import object_session
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.sql.selectable import GenerativeSelect
+from sqlalchemy.types import TypeDecorator
+
+
+class RoutingSession(Session):
+    """
+    Session sending the reads of a read-only request to a replica, see replicas.py.
+
+    While `info["replicas"]` holds the app's Replicas, SELECTs without FOR UPDATE go
+    to the replica it picks, once per session. Flushes and every other statement
+    use the primary.
+
+    While `info["deferred_commit"]` is set, `commit` only flushes, so that
+    idempotency.py can commit the changes of a request together with its response.
+    """
+
+    def commit(self):
+        if self.info.get("deferred_commit"):
+            self.flush()
+        else:
+            super().commit()
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        replicas = self.info.get("replicas")
+        if (
+            replicas is not None
+            and bind is None
+            and not self._flushing
+            and isinstance(clause, GenerativeSelect)
+            and clause._for_update_arg is None
+        ):
+            if "replica" not in self.info:
+                self.info["replica"] = replicas.choose()
+            if self.info["replica"] is not None:
+                return self.info["replica"]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
 
 # Initializing the database's ORM
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+
+class GUID(TypeDecorator):
+    """
+    UUID stored as PostgreSQL's native type, and as 16 raw bytes on other databases.
+
+    Binds UUIDs as well as their string form, so identifiers taken straight from a
+    JSON payload work on any database, and always returns UUIDs.
+    """
+
+    impl = LargeBinary(16)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(postgresql.UUID(as_uuid=True))
+        return dialect.type_descriptor(LargeBinary(16))
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if not isinstance(value, UUID):
+            value = UUID(str(value))
+        return value if dialect.name == "postgresql" else value.bytes
+
+    def process_result_value(self, value, dialect):
+        if value is None or isinstance(value, UUID):
+            return value
+        return UUID(bytes=bytes(value))
+
+
+class random_uuid(FunctionElement):
+    """
+    New random UUID computed by the database, for rows written by INSERT ... SELECT.
+
+    On SQLite these are 16 random bytes without the version bits of a UUID4.
+    """
+
+    type = GUID()
+    inherit_cache = True
+
+
+@compiles(random_uuid, "postgresql")
+def compile_random_uuid_postgresql(element, compiler, **kw):
+    return "gen_random_uuid()"
+
+
+@compiles(random_uuid)
+def compile_random_uuid(element, compiler, **kw):
+    return "randomblob(16)"
+
+
+class Category(db.Model):
+    """
+    Represents an exercise category, e.g. "Strength" or "Cardio".
+
+    Exercises refer to it by a small integer key instead of repeating the name.
+    Categories are created on first use and never renamed.
+
+    Attributes:
+        id (int): Unique identifier for the category.
+        name (str): Unique name of the category.
+    """
+
+    __tablename__ = "categories"
+    id = db.Column(
+        db.SmallInteger().with_variant(db.Integer, "sqlite"), primary_key=True
+    )
+    name = db.Column(db.String(100), nullable=False, unique=True)
+
+
+def category_ids(session, names):
+    """Returns `{name: id}` for the category `names`, creating the missing ones."""
+    names = set(names)
+    statement = select(Category.name, Category.id).where(Category.name.in_(names))
+    ids = dict(session.execute(statement).all())
+    missing = names - set(ids)
+    if missing:
+        dialect = session.get_bind().dialect.name
+        insert = (postgresql if dialect == "postgresql" else sqlite).insert(Category)
+        session.execute(
+            insert.on_conflict_do_nothing(index_elements=["name"]),
+            [{"name": name} for name in missing],
+        )
+        ids = dict(session.execute(statement).all())
+    return ids
 
 
 class Exercise(db.Model):
@@ -16,27 +147,72 @@ class Exercise(db.Model):
         id (UUID): Unique identifier for the exercise.
         name (str): Name of the exercise.
         description (str, optional): Detailed description of the exercise.
-        category (str): Category of the exercise (e.g., "Strength", "Cardio").
+        category_id (int): Foreign key referencing the category.
+        category (str): Name of the category (e.g., "Strength", "Cardio"); assigning
+            a new name creates the category, in the exercise's session or, for an
+            exercise not added to one yet, in the session that flushes it.
         custom_made (bool): Indicates if the exercise is custom-created by a user.
         created_by (UUID, optional): References the user who created the custom exercise.
+        updated_at (datetime): Timestamp of the last modification.
 
     Relationships:
-        creator (User): Links the exercise to the user who created it.
+        category_ref (Category): The category, loaded with the exercise.
+        creator (User): Links the exercise to the user who created it, loaded with it.
         workouts (WorkoutExercise): Many-to-many relationship with workouts through WorkoutExercise.
     """
 
     __tablename__ = "exercises"
-    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    id = db.Column(GUID(), primary_key=True, default=uuid4)
     name = db.Column(db.String(255), nullable=False)
     description = db.Column(db.Text)
-    category = db.Column(db.String(100), nullable=False)
+    category_id = db.Column(
+        db.SmallInteger().with_variant(db.Integer, "sqlite"),
+        db.ForeignKey("categories.id"),
+        nullable=False,
+        index=True,
+    )
     custom_made = db.Column(db.Boolean, default=False, nullable=False)
-    created_by = db.Column(UUID(as_uuid=True), db.ForeignKey("users.id"), nullable=True)
+    created_by = db.Column(GUID(), db.ForeignKey("users.id"), nullable=True, index=True)
+    updated_at = db.Column(
+        db.DateTime,
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow,
+        nullable=False,
+        index=True,
+    )
 
     # Relationships
-    creator = db.relationship("User", back_populates="exercises")
+    category_ref = db.relationship("Category", lazy="joined")
+    creator = db.relationship("User", back_populates="exercises", lazy="joined")
     workouts = db.relationship("WorkoutExercise", back_populates="exercise")
 
+    @hybrid_property
+    def category(self):
+        if "_pending_category" in vars(self):
+            return self._pending_category
+        return self.category_ref.name if self.category_ref else None
+
+    @category.inplace.setter
+    def _category_setter(self, name):
+        session = object_session(self)
+        if session is None:
+            self._pending_category = name
+            return
+        vars(self).pop("_pending_category", None)
+        with session.no_autoflush:
+            id = category_ids(session, [name])[name]
+            self.category_ref = session.get(Category, id)
+
+    @category.inplace.expression
+    @classmethod
+    def _category_expression(cls):
+        return (
+            select(Category.name)
+            .where(Category.id == cls.category_id)
+            .correlate_except(Category)
+            .scalar_subquery()
+        )
+
     def make_json(self):
         """Returns a dictionary representation of the exercise."""
         return {
@@ -49,6 +225,119 @@ class Exercise(db.Model):
         }
 
 
+@event.listens_for(Session, "before_flush")
+def resolve_categories(session, flush_context, instances):
+    """Sets the categories named on exercises before they were added to `session`."""
+    pending = [
+        obj
+        for obj in [*session.new, *session.dirty]
+        if isinstance(obj, Exercise) and "_pending_category" in vars(obj)
+    ]
+    if not pending:
+        return
+    with session.no_autoflush:
+        ids = category_ids(session, {obj._pending_category for obj in pending})
+        for obj in pending:
+            obj.category_ref = session.get(
+                Category, ids[vars(obj).pop("_pending_category")]
+            )
+
+
+def search_document_expression(name, category, description):
+    """
+    Returns the weighted full-text document of an exercise: name (A), category (B)
+    and description (C), with the 'simple' configuration so prefixes are not stemmed.
+    """
+    regconfig = text("'simple'::regconfig")
+
+    def weighted(column, weight):
+        document = func.to_tsvector(regconfig, func.coalesce(column, text("''")))
+        return func.setweight(document, text(f"'{weight}'"))
+
+    return (
+        weighted(name, "A")
+        .op("||")(weighted(category, "B"))
+        .op("||")(weighted(description, "C"))
+    )
+
+
+# Stored on PostgreSQL in a column that the ORM does not map, so ranking reads it
+# instead of parsing every matching row again; see add_search_document
+SEARCH_DOCUMENT = literal_column("exercises.search_document")
+TRIGRAMS_INSTALLED = text("SELECT count(*) FROM pg_extension WHERE extname = 'pg_trgm'")
+
+
+def trigrams_installed(ddl, target, bind, **kw):
+    """Whether the pg_trgm extension, needed for typo-tolerant search, is installed."""
+    return bind.dialect.name == "postgresql" and bind.scalar(TRIGRAMS_INSTALLED) > 0
+
+
+@event.listens_for(db.metadata, "before_create")
+def create_trigram_extension(target, connection, **kw):
+    if connection.dialect.name != "postgresql":
+        return
+    try:
+        with connection.begin_nested():
+            connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    except DBAPIError as e:
+        logging.getLogger(__name__).warning(
+            "pg_trgm unavailable, exercise search will not match typos: %s", e.orig
+        )
+
+
+@event.listens_for(db.metadata, "after_create")
+def add_search_document(target, connection, **kw):
+    """
+    Adds the search document column and its GIN index on PostgreSQL.
+
+    A trigger fills the column, as a generated column cannot look up the name of
+    the category.
+    """
+    if connection.dialect.name != "postgresql":
+        return
+    category = select(Category.name).where(
+        Category.id == literal_column("NEW.category_id")
+    )
+    expression = search_document_expression(
+        literal_column("NEW.name"),
+        category.scalar_subquery(),
+        literal_column("NEW.description"),
+    ).compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True})
+    connection.execute(
+        text("ALTER TABLE exercises ADD COLUMN IF NOT EXISTS search_document tsvector")
+    )
+    connection.execute(
+        text(
+            "CREATE OR REPLACE FUNCTION exercises_search_document() RETURNS trigger "
+            f"AS $$ BEGIN NEW.search_document := {expression}; RETURN NEW; END $$ "
+            "LANGUAGE plpgsql"
+        )
+    )
+    connection.execute(
+        text(
+            "CREATE OR REPLACE TRIGGER exercises_search_document "
+            "BEFORE INSERT OR UPDATE OF name, category_id, description ON exercises "
+            "FOR EACH ROW EXECUTE FUNCTION exercises_search_document()"
+        )
+    )
+    connection.execute(
+        text(
+            "CREATE INDEX IF NOT EXISTS ix_exercises_search_document "
+            "ON exercises USING gin (search_document)"
+        )
+    )
+
+
+# Typo-tolerant name matching behind GET /exercises/search; other databases than
+# PostgreSQL are searched in memory (search.py)
+db.Index(
+    "ix_exercises_name_trgm",
+    Exercise.name,
+    postgresql_using="gin",
+    postgresql_ops={"name": "gin_trgm_ops"},
+).ddl_if(callable_=trigrams_installed)
+
+
 class User(db.Model):
     """
     Represents a user in the system.
@@ -59,6 +348,7 @@ class User(db.Model):
         name (str): Full name of the user.
         email (str): Unique email address.
         created_at (datetime): Timestamp when the user was created.
+        updated_at (datetime): Timestamp of the last modification.
 
     Relationships:
         workouts (Workout): One-to-many relationship with workouts.
@@ -66,11 +356,18 @@ class User(db.Model):
     """
 
     __tablename__ = "users"
-    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    id = db.Column(GUID(), primary_key=True, default=uuid4)
     username = db.Column(db.String(100), nullable=False, unique=True)
     name = db.Column(db.String(255), nullable=False)
     email = db.Column(db.String(50), nullable=False, unique=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(
+        db.DateTime,
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow,
+        nullable=False,
+        index=True,
+    )
 
     # Relationships
     workouts = db.relationship("Workout", back_populates="user")
@@ -91,10 +388,17 @@ class Workout(db.Model):
     """
     Represents a workout session performed by a user.
 
+    On PostgreSQL the table is range partitioned by month of `created_at`, which
+    therefore belongs to the primary key; the ORM still identifies workouts by `id`
+    alone. Partitions are managed by partitions.py.
+
     Attributes:
         id (UUID): Unique identifier for the workout.
         created_at (datetime): Timestamp when the workout was created.
         user_workout_id (UUID): Foreign key referencing the user who performed the workout.
+        archived (bool): Whether its exercises were moved to the archive (archive.py);
+            archived workouts are read-only.
+        updated_at (datetime): Timestamp of the last modification.
 
     Relationships:
         user (User): Links the workout to the user who performed it.
@@ -102,15 +406,36 @@ class Workout(db.Model):
     """
 
     __tablename__ = "workouts"
-    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    user_workout_id = db.Column(
-        UUID(as_uuid=True), db.ForeignKey("users.id"), nullable=False
+    # The (created_at, id) index backs keyset pagination; the per-user index
+    # also serves lookups on user_workout_id alone
+    __table_args__ = (
+        db.Index("ix_workouts_created_at_id", "created_at", "id"),
+        db.Index(
+            "ix_workouts_user_workout_id_created_at", "user_workout_id", "created_at"
+        ),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+    id = db.Column(GUID(), primary_key=True, default=uuid4)
+    created_at = db.Column(
+        db.DateTime, default=datetime.utcnow, primary_key=True, nullable=False
+    )
+    user_workout_id = db.Column(GUID(), db.ForeignKey("users.id"), nullable=False)
+    archived = db.Column(db.Boolean, default=False, nullable=False)
+    updated_at = db.Column(
+        db.DateTime,
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow,
+        nullable=False,
+        index=True,
     )
 
     # Relationships
     user = db.relationship("User", back_populates="workouts")
-    workout_exercises = db.relationship("WorkoutExercise", back_populates="workout")
+    workout_exercises = db.relationship(
+        "WorkoutExercise", back_populates="workout", cascade="all, delete-orphan"
+    )
+
+    __mapper_args__ = {"primary_key": [id]}
 
     def make_json(self):
         """Returns a dictionary representation of the workout."""
@@ -129,14 +454,20 @@ class WorkoutExercise(db.Model):
     This is a junction table implementing a many-to-many relationship between
     Workout and Exercise, allowing additional attributes such as sets, repetitions, weights, and duration.
 
+    Rows carry the creation time of their workout, which the composite foreign key
+    keeps equal to it, so that on PostgreSQL the table is partitioned by the same
+    months as workouts.
+
     Attributes:
         id (UUID): Unique identifier for the relationship.
         workout_id (UUID): Foreign key referencing the workout.
+        workout_created_at (datetime): Creation time of the workout.
         exercise_id (UUID): Foreign key referencing the exercise.
         sets (int): Number of sets for this exercise in the workout.
         repetitions (int, optional): Number of repetitions per set.
         weights (float, optional): Weight used in the exercise (if applicable).
         duration (float, optional): Duration of the exercise in minutes.
+        updated_at (datetime): Timestamp of the last modification.
 
     Relationships:
         workout (Workout): Links the record to the associated workout.
@@ -144,22 +475,38 @@ class WorkoutExercise(db.Model):
     """
 
     __tablename__ = "workout_exercises"
-    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
-    workout_id = db.Column(
-        UUID(as_uuid=True), db.ForeignKey("workouts.id"), nullable=False
+    __table_args__ = (
+        db.ForeignKeyConstraint(
+            ["workout_id", "workout_created_at"],
+            ["workouts.id", "workouts.created_at"],
+            onupdate="CASCADE",
+        ),
+        {"postgresql_partition_by": "RANGE (workout_created_at)"},
     )
+    id = db.Column(GUID(), primary_key=True, default=uuid4)
+    workout_id = db.Column(GUID(), nullable=False, index=True)
+    workout_created_at = db.Column(db.DateTime, primary_key=True, nullable=False)
     exercise_id = db.Column(
-        UUID(as_uuid=True), db.ForeignKey("exercises.id"), nullable=False
+        GUID(), db.ForeignKey("exercises.id"), nullable=False, index=True
     )
     sets = db.Column(db.Integer, nullable=False)
     repetitions = db.Column(db.Integer)
     weights = db.Column(db.Float)
     duration = db.Column(db.Float)
+    updated_at = db.Column(
+        db.DateTime,
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow,
+        nullable=False,
+        index=True,
+    )
 
     # Relationships
     workout = db.relationship("Workout", back_populates="workout_exercises")  # FIXED
     exercise = db.relationship("Exercise", back_populates="workouts")
 
+    __mapper_args__ = {"primary_key": [id]}
+
     def make_json(self):
         """Returns a dictionary representation of the workout-exercise association."""
         return {
@@ -171,3 +518,286 @@ class WorkoutExercise(db.Model):
             "weights": self.weights,
             "duration": self.duration,
         }
+
+
+class WorkoutTemplate(db.Model):
+    """
+    Represents a named list of exercises a user starts workouts from.
+
+    Attributes:
+        id (UUID): Unique identifier for the template.
+        user_id (UUID): Foreign key referencing the user owning the template.
+        name (str): Name of the template, e.g. "Leg day".
+        created_at (datetime): Timestamp when the template was created.
+        updated_at (datetime): Timestamp of the last modification.
+
+    Relationships:
+        user (User): The user owning the template.
+        exercises (TemplateExercise): The exercises a workout started from it gets.
+    """
+
+    __tablename__ = "workout_templates"
+    id = db.Column(GUID(), primary_key=True, default=uuid4)
+    user_id = db.Column(GUID(), db.ForeignKey("users.id"), nullable=False, index=True)
+    name = db.Column(db.String(255), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(
+        db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False
+    )
+
+    # Relationships
+    user = db.relationship("User")
+    exercises = db.relationship(
+        "TemplateExercise", back_populates="template", cascade="all, delete-orphan"
+    )
+
+    def make_json(self):
+        """Returns a dictionary representation of the template."""
+        return {
+            "id": str(self.id),
+            "name": self.name,
+            "user_id": str(self.user_id),
+            "created_at": self.created_at.isoformat(),
+            "exercises": [exercise.make_json() for exercise in self.exercises],
+        }
+
+
+class TemplateExercise(db.Model):
+    """
+    Represents an exercise of a workout template, with the same attributes as a
+    WorkoutExercise.
+
+    Attributes:
+        id (UUID): Unique identifier for the template exercise.
+        template_id (UUID): Foreign key referencing the template.
+        exercise_id (UUID): Foreign key referencing the exercise.
+        sets (int): Number of sets.
+        repetitions (int, optional): Number of repetitions per set.
+        weights (float, optional): Weight used in the exercise (if applicable).
+        duration (float, optional): Duration of the exercise in minutes.
+    """
+
+    __tablename__ = "template_exercises"
+    id = db.Column(GUID(), primary_key=True, default=uuid4)
+    template_id = db.Column(
+        GUID(), db.ForeignKey("workout_templates.id"), nullable=False, index=True
+    )
+    exercise_id = db.Column(GUID(), db.ForeignKey("exercises.id"), nullable=False)
+    sets = db.Column(db.Integer, nullable=False)
+    repetitions = db.Column(db.Integer)
+    weights = db.Column(db.Float)
+    duration = db.Column(db.Float)
+
+    # Relationships
+    template = db.relationship("WorkoutTemplate", back_populates="exercises")
+
+    def make_json(self):
+        """Returns a dictionary representation of the template exercise."""
+        return {
+            "id": str(self.id),
+            "exercise_id": str(self.exercise_id),
+            "sets": self.sets,
+            "repetitions": self.repetitions,
+            "weights": self.weights,
+            "duration": self.duration,
+        }
+
+
+class UserVolume(db.Model):
+    """
+    Pre-aggregated training volume of a user per day, week or month.
+
+    Rows are maintained incrementally by summary.py whenever workout exercises are
+    written, so statistics read O(periods) rows instead of the whole history.
+
+    Attributes:
+        user_id (UUID): Foreign key referencing the user.
+        bucket (str): Period length, one of "day", "week" or "month".
+        period (date): First day of the period (weeks start on Monday).
+        sets (int): Total number of sets.
+        repetitions (int): Total number of repetitions (sets x repetitions).
+        tonnage (float): Total weight lifted (sets x repetitions x weights).
+        duration (float): Total duration in minutes.
+        workouts (int): Number of workouts with at least one exercise.
+    """
+
+    __tablename__ = "user_volumes"
+    user_id = db.Column(GUID(), db.ForeignKey("users.id"), primary_key=True)
+    bucket = db.Column(db.String(5), primary_key=True)
+    period = db.Column(db.Date, primary_key=True)
+    sets = db.Column(db.Integer, default=0, nullable=False)
+    repetitions = db.Column(db.Integer, default=0, nullable=False)
+    tonnage = db.Column(db.Float, default=0, nullable=False)
+    duration = db.Column(db.Float, default=0, nullable=False)
+    workouts = db.Column(db.Integer, default=0, nullable=False)
+
+
+class ExerciseVolume(db.Model):
+    """
+    Pre-aggregated training volume of a user on one exercise per day, week or month.
+
+    Maintained together with UserVolume; `workouts` counts the workouts in which
+    the exercise appears.
+
+    Attributes:
+        user_id (UUID): Foreign key referencing the user.
+        bucket (str): Period length, one of "day", "week" or "month".
+        period (date): First day of the period (weeks start on Monday).
+        exercise_id (UUID): Foreign key referencing the exercise.
+        sets (int): Total number of sets.
+        repetitions (int): Total number of repetitions (sets x repetitions).
+        tonnage (float): Total weight lifted (sets x repetitions x weights).
+        duration (float): Total duration in minutes.
+        workouts (int): Number of workouts including the exercise.
+    """
+
+    __tablename__ = "exercise_volumes"
+    user_id = db.Column(GUID(), db.ForeignKey("users.id"), primary_key=True)
+    bucket = db.Column(db.String(5), primary_key=True)
+    period = db.Column(db.Date, primary_key=True)
+    exercise_id = db.Column(GUID(), db.ForeignKey("exercises.id"), primary_key=True)
+    sets = db.Column(db.Integer, default=0, nullable=False)
+    repetitions = db.Column(db.Integer, default=0, nullable=False)
+    tonnage = db.Column(db.Float, default=0, nullable=False)
+    duration = db.Column(db.Float, default=0, nullable=False)
+    workouts = db.Column(db.Integer, default=0, nullable=False)
+
+
+class IdempotencyKey(db.Model):
+    """
+    Response to a POST sent with an Idempotency-Key header, replayed to its retries.
+
+    The row is written in the same transaction as the changes of the request and its
+    response, so a retry can never apply them a second time. Keys are scoped by
+    client. Rows are deleted after a TTL by `flask idempotency purge`.
+
+    Attributes:
+        client (str): Hash of the client's identity, as the rate limiter tells
+            clients apart.
+        key (str): Value of the Idempotency-Key header.
+        fingerprint (str): Hash of the method, path and body of the first request.
+        status (int, optional): Status of the stored response; None until the first
+            request commits.
+        body (bytes, optional): Body of the stored response.
+        created_at (datetime): When the key was first seen.
+    """
+
+    __tablename__ = "idempotency_keys"
+    client = db.Column(db.String(40), primary_key=True)
+    key = db.Column(db.String(255), primary_key=True)
+    fingerprint = db.Column(db.String(40), nullable=False)
+    status = db.Column(db.Integer)
+    body = db.Column(db.LargeBinary)
+    created_at = db.Column(
+        db.DateTime, default=datetime.utcnow, nullable=False, index=True
+    )
+
+
+class Change(db.Model):
+    """
+    Entry of the change log served by GET /changes, written by changes.py.
+
+    Every transaction appends one entry per exercise, user, workout or workout
+    exercise it wrote. Sequence numbers are assigned in commit order, so a client
+    that has read up to `seq` never misses an entry committed later.
+
+    Attributes:
+        seq (int): Position in the log.
+        entity (str): "exercise", "user", "workout" or "workout_exercise".
+        entity_id (UUID): Identifier of the written row.
+        deleted (bool): Whether the row was deleted (a tombstone).
+        changed_at (datetime): Commit time of the change.
+    """
+
+    __tablename__ = "changes"
+    # Compaction looks for newer entries of the same entity
+    __table_args__ = (
+        db.Index("ix_changes_entity_id_seq", "entity", "entity_id", "seq"),
+    )
+    seq = db.Column(
+        db.BigInteger().with_variant(db.Integer, "sqlite"),
+        primary_key=True,
+        autoincrement=True,
+    )
+    entity = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(GUID(), nullable=False)
+    deleted = db.Column(db.Boolean, default=False, nullable=False)
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+class ArchivedMonth(db.Model):
+    """
+    Archive file holding the exercises of one user's workouts in one month.
+
+    Files are immutable: archiving more workouts of the month writes the next
+    version, and readers only open the version committed here. See archive.py.
+
+    Attributes:
+        user_id (UUID): Foreign key referencing the user.
+        month (date): First day of the month.
+        version (int): Version of the file.
+        rows (int): Number of workout exercises in the file.
+        archived_at (datetime): When the version was written.
+    """
+
+    __tablename__ = "archived_months"
+    user_id = db.Column(GUID(), db.ForeignKey("users.id"), primary_key=True)
+    month = db.Column(db.Date, primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+    rows = db.Column(db.Integer, nullable=False)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+class Job(db.Model):
+    """
+    Background job run by `flask jobs work`, see jobs.py.
+
+    Attributes:
+        id (UUID): Unique identifier for the job.
+        kind (str): Name of the handler, e.g. "delete_user".
+        params (dict): Arguments of the handler.
+        key (str, optional): Identifies the work, so it is queued only once at a time.
+        status (str): "queued", "running", "succeeded" or "failed".
+        attempts (int): How often a worker started it.
+        progress (int): Rows processed so far.
+        result (dict, optional): What the handler returned.
+        error (str, optional): Why the last attempt failed.
+        worker (str, optional): Worker that ran the last attempt.
+        locked_until (datetime, optional): End of the running worker's lease; an
+            expired lease lets another worker take the job over.
+        created_at (datetime): When the job was queued.
+        started_at (datetime, optional): When the last attempt started.
+        finished_at (datetime, optional): When the job succeeded or failed.
+    """
+
+    __tablename__ = "jobs"
+    __table_args__ = (db.Index("ix_jobs_status_created_at", "status", "created_at"),)
+    id = db.Column(GUID(), primary_key=True, default=uuid4)
+    kind = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.JSON, nullable=False, default=dict)
+    key = db.Column(db.String(255), index=True)
+    status = db.Column(db.String(10), nullable=False, default="queued")
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    worker = db.Column(db.String(100))
+    locked_until = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def make_json(self):
+        """Returns a dictionary representation of the job."""
+        return {
+            "id": str(self.id),
+            "kind": self.kind,
+            "status": self.status,
+            "attempts": self.attempts,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at and self.started_at.isoformat(),
+            "finished_at": self.finished_at and self.finished_at.isoformat(),
+        }
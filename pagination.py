@@ -0,0 +1,39 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from uuid import UUID
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class InvalidPageRequest(ValueError):
+    """Raised when the `limit` or `after` query parameters cannot be used."""
+
+
+def encode_cursor(created_at, id):
+    """Returns an opaque cursor pointing right after the given `(created_at, id)` key."""
+    raw = f"{created_at.isoformat()}|{id}".encode()
+    return urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Returns the `(created_at, id)` key encoded by `encode_cursor`."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, id = urlsafe_b64decode(padded.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), UUID(id)
+    except ValueError as e:
+        raise InvalidPageRequest(f"invalid cursor: {cursor}") from e
+
+
+def parse_limit(value):
+    """Returns the requested page size, falling back to the default and capped at the maximum."""
+    if value is None:
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(value)
+    except ValueError as e:
+        raise InvalidPageRequest(f"invalid limit: {value}") from e
+    if limit < 1:
+        raise InvalidPageRequest("limit must be a positive integer")
+    return min(limit, MAX_PAGE_SIZE)
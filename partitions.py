@@ -0,0 +1,255 @@
+import re
+from contextlib import contextmanager
+from datetime import date, datetime
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, text
+
+from models import Workout, WorkoutExercise, db
+
+# The co-partitioned tables and their partition keys, referenced table first: a
+# month of workout exercises is attached after its workouts and detached before
+TABLES = [
+    (Workout.__table__.name, "created_at"),
+    (WorkoutExercise.__table__.name, "workout_created_at"),
+]
+MONTHS_AHEAD = 3
+ARCHIVE_SCHEMA = "archive"
+MONTH_SUFFIX = re.compile(r"_p(\d{4})_(\d{2})$")
+
+partitions_cli = AppGroup(
+    "partitions", help="Manage the monthly partitions of workouts (PostgreSQL)."
+)
+
+
+def first_of_month(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def months(start, end):
+    """Yields the first days of the months from `start` up to, not including, `end`."""
+    month = first_of_month(start)
+    while month < end:
+        yield month
+        month = add_months(month, 1)
+
+
+def partition_name(table, month):
+    return f"{table}_p{month:%Y_%m}"
+
+
+def is_partitioned(connection):
+    """Whether the workout tables were created partitioned, i.e. on PostgreSQL."""
+    if connection.dialect.name != "postgresql":
+        return False
+    statement = text(
+        "SELECT count(*) FROM pg_partitioned_table "
+        "WHERE partrelid = to_regclass(:table)"
+    )
+    return connection.scalar(statement, {"table": TABLES[0][0]}) > 0
+
+
+def monthly_partitions(connection, table):
+    """Returns `{month: name}` of the monthly partitions attached to `table`."""
+    names = connection.scalars(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = to_regclass(:table)"
+        ),
+        {"table": table},
+    )
+    partitions = {}
+    for name in names:
+        match = MONTH_SUFFIX.search(name)
+        if match:
+            partitions[date(int(match[1]), int(match[2]), 1)] = name
+    return partitions
+
+
+def create_partitions(connection, start, end):
+    """
+    Creates the monthly partitions of both tables from `start` up to `end`.
+
+    Each partition is filled with the rows of its month held by the default
+    partition, if any, and attached afterwards. A CHECK constraint matching the
+    bounds spares the attach a scan of the rows, and is dropped once it is done.
+    Attaching only locks the parent tables against other DDL, while writes to the
+    default partitions wait until the transaction ends. Returns the months created.
+    """
+    existing = monthly_partitions(connection, TABLES[0][0])
+    missing = [month for month in months(start, end) if month not in existing]
+    if not missing:
+        return []
+    defaults = ", ".join(f"{table}_default" for table, _ in TABLES)
+    connection.execute(text(f"LOCK TABLE {defaults} IN EXCLUSIVE MODE"))
+    for month in missing:
+        bounds = {"start": month, "end": add_months(month, 1)}
+        for table, key in TABLES:
+            name = partition_name(table, month)
+            connection.execute(
+                text(
+                    f"CREATE TABLE {name} "
+                    f"(LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+                )
+            )
+            connection.execute(
+                text(
+                    f"ALTER TABLE {name} ADD CONSTRAINT {name}_bounds "
+                    f"CHECK ({key} >= '{bounds['start']}' AND {key} < '{bounds['end']}')"
+                )
+            )
+        # Referencing rows leave the default partition before the referenced ones
+        for table, key in reversed(TABLES):
+            connection.execute(
+                text(
+                    f"WITH moved AS (DELETE FROM {table}_default "
+                    f"WHERE {key} >= :start AND {key} < :end RETURNING *) "
+                    f"INSERT INTO {partition_name(table, month)} SELECT * FROM moved"
+                ),
+                bounds,
+            )
+        for table, _ in TABLES:
+            name = partition_name(table, month)
+            connection.execute(
+                text(
+                    f"ALTER TABLE {table} ATTACH PARTITION {name} "
+                    f"FOR VALUES FROM ('{bounds['start']}') TO ('{bounds['end']}')"
+                )
+            )
+            connection.execute(
+                text(f"ALTER TABLE {name} DROP CONSTRAINT {name}_bounds")
+            )
+    return missing
+
+
+def detach_partitions(connection, before, drop=False):
+    """
+    Detaches the monthly partitions of both tables older than month `before`.
+
+    Detached partitions lose their foreign keys and are moved to the archive
+    schema, where they can still be queried, or dropped. Returns the months
+    detached.
+    """
+    detached = []
+    partitions = monthly_partitions(connection, TABLES[0][0])
+    for month in sorted(month for month in partitions if month < before):
+        names = []
+        for table, _ in reversed(TABLES):
+            name = partition_name(table, month)
+            connection.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+            foreign_keys = connection.scalars(
+                text(
+                    "SELECT conname FROM pg_constraint "
+                    "WHERE conrelid = to_regclass(:name) AND contype = 'f'"
+                ),
+                {"name": name},
+            ).all()
+            for constraint in foreign_keys:
+                connection.execute(
+                    text(f'ALTER TABLE {name} DROP CONSTRAINT "{constraint}"')
+                )
+            names.append(name)
+        if drop:
+            connection.execute(text(f"DROP TABLE {', '.join(names)}"))
+        else:
+            connection.execute(text(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}"))
+            for name in names:
+                connection.execute(
+                    text(f"ALTER TABLE {name} SET SCHEMA {ARCHIVE_SCHEMA}")
+                )
+        detached.append(month)
+    return detached
+
+
+@event.listens_for(db.metadata, "after_create")
+def create_default_partitions(target, connection, **kw):
+    """Gives the partitioned tables a default partition and the coming months."""
+    if not is_partitioned(connection):
+        return
+    for table, _ in TABLES:
+        connection.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS {table}_default "
+                f"PARTITION OF {table} DEFAULT"
+            )
+        )
+    month = first_of_month(datetime.utcnow())
+    create_partitions(connection, month, add_months(month, MONTHS_AHEAD + 1))
+
+
+@contextmanager
+def partitioned_transaction():
+    with db.engine.begin() as connection:
+        if not is_partitioned(connection):
+            raise click.ClickException(
+                "workouts is not partitioned: partitioning needs PostgreSQL and "
+                "tables created by `flask init-db` of this version"
+            )
+        yield connection
+
+
+@partitions_cli.command("create")
+@click.option(
+    "--ahead",
+    default=MONTHS_AHEAD,
+    show_default=True,
+    help="Number of months to create after the current one.",
+)
+@click.option(
+    "--from",
+    "start",
+    type=click.DateTime(["%Y-%m"]),
+    help="First month to create; rows of older months stay in the default partition.",
+)
+def create_command(ahead, start):
+    """Create the monthly partitions up to some months ahead."""
+    month = first_of_month(datetime.utcnow())
+    start = first_of_month(start) if start else month
+    with partitioned_transaction() as connection:
+        created = create_partitions(connection, start, add_months(month, ahead + 1))
+    click.echo(f"{len(created)} monthly partitions created")
+
+
+@partitions_cli.command("detach")
+@click.option(
+    "--before",
+    required=True,
+    type=click.DateTime(["%Y-%m"]),
+    help="Months before this one, e.g. 2024-01, are detached.",
+)
+@click.option(
+    "--drop",
+    is_flag=True,
+    help=f"Drop the partitions instead of moving them to the {ARCHIVE_SCHEMA} schema.",
+)
+def detach_command(before, drop):
+    """Detach the partitions of old months from the workout tables."""
+    with partitioned_transaction() as connection:
+        detached = detach_partitions(connection, first_of_month(before), drop)
+    click.echo(f"{len(detached)} monthly partitions detached")
+
+
+@partitions_cli.command("list")
+def list_command():
+    """List the partitions with their estimated number of rows."""
+    with partitioned_transaction() as connection:
+        for table, _ in TABLES:
+            rows = connection.execute(
+                text(
+                    "SELECT child.relname, greatest(child.reltuples, 0)::bigint "
+                    "FROM pg_inherits "
+                    "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                    "WHERE pg_inherits.inhparent = to_regclass(:table) "
+                    "ORDER BY child.relname"
+                ),
+                {"table": table},
+            )
+            for name, estimate in rows:
+                click.echo(f"{name:36} ~{estimate} rows")
@@ -0,0 +1,160 @@
+from collections import OrderedDict
+from math import ceil
+from threading import BoundedSemaphore, Lock
+from time import monotonic
+
+from flask import current_app, g, jsonify, make_response, request
+
+# Tokens taken per request by endpoint; unlisted endpoints cost one token and
+# endpoints costing nothing are never limited. List endpoints scan and serialize
+# many rows, so they cost more than single-row reads and writes.
+ROUTE_COSTS = {
+    "api.get_workouts": 5,
+    "api.get_workout_exercises": 5,
+    "api.get_users": 5,
+    "api.get_user_stats": 5,
+    "api.get_exercises": 2,
+    "api.search_exercises": 2,
+    "api.get_changes": 2,
+    "api.add_exercises_to_workouts": 5,
+    "api.sync": 5,
+    "api.hello_world": 0,
+    "metrics": 0,
+}
+
+
+class MemoryBuckets:
+    """
+    In-process token buckets, the least recently used dropped beyond `maxsize` keys.
+
+    Any object providing the same `take` method can be used as the backend instead,
+    e.g. a Redis script, so that all server processes share one budget per client.
+    """
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = Lock()
+
+    def take(self, key, cost, rate, burst):
+        """
+        Takes `cost` tokens from the bucket of `key`, refilled at `rate` tokens per
+        second up to `burst`. Returns 0 when they were taken, or else the number of
+        seconds until enough tokens will be available.
+        """
+        now = monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            wait = 0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+def client_key(headers, remote_addr, key_header="X-API-Key"):
+    """Identifies the client by its API key header, or else by its address."""
+    api_key = headers.get(key_header)
+    return f"key:{api_key}" if api_key else f"ip:{remote_addr}"
+
+
+class Limits:
+    """
+    Admission control of one app, built from its RATELIMIT_* settings.
+
+    Attributes:
+        backend: Store of the token buckets, a MemoryBuckets by default.
+        slots (BoundedSemaphore): Requests allowed to run at once in this process,
+            or None when RATELIMIT_MAX_CONCURRENT is 0.
+    """
+
+    def __init__(self, config):
+        self.rate = config["RATELIMIT_RATE"]
+        self.burst = config["RATELIMIT_BURST"]
+        self.costs = {**ROUTE_COSTS, **config["RATELIMIT_COSTS"]}
+        self.key_header = config["RATELIMIT_KEY_HEADER"]
+        self.backend = config["RATELIMIT_BACKEND"] or MemoryBuckets()
+        capacity = config["RATELIMIT_MAX_CONCURRENT"]
+        self.slots = BoundedSemaphore(capacity) if capacity else None
+
+    def key(self, headers, remote_addr):
+        return client_key(headers, remote_addr, self.key_header)
+
+    def admit(self, key, endpoint):
+        """
+        Returns None when the request may run, or else a `(status, message,
+        retry_after)` rejection. Admitted requests hold a concurrency slot that has
+        to be given back with `release`.
+
+        Requests over the cap are refused at once rather than queued, so overload
+        turns into quick 503s instead of ever longer waits. The slot is taken before
+        the tokens, so such a refusal costs the client nothing.
+        """
+        if self.slots is not None and not self.slots.acquire(blocking=False):
+            return 503, "server busy, retry later", 1
+        cost = min(self.costs.get(endpoint, 1), self.burst)
+        if cost:
+            wait = self.backend.take(key, cost, self.rate, self.burst)
+            if wait:
+                self.release()
+                return 429, "rate limit exceeded", max(1, ceil(wait))
+        return None
+
+    def release(self):
+        if self.slots is not None:
+            self.slots.release()
+
+
+class RateLimiter:
+    """
+    Per-client token-bucket rate limiting and a per-process concurrency cap.
+
+    Enabled by RATELIMIT_ENABLED. Clients are refilled RATELIMIT_RATE tokens per
+    second up to RATELIMIT_BURST and every request takes the cost of its endpoint
+    (ROUTE_COSTS, overridden by RATELIMIT_COSTS).
+
+    Off by default: clients without an API key are told apart by their address,
+    and behind a reverse proxy that does not forward theirs, e.g. through
+    werkzeug's ProxyFix, all of them would share one bucket.
+    """
+
+    def init_app(self, app):
+        app.config.setdefault("RATELIMIT_ENABLED", False)
+        app.config.setdefault("RATELIMIT_RATE", 20)
+        app.config.setdefault("RATELIMIT_BURST", 100)
+        app.config.setdefault("RATELIMIT_COSTS", {})
+        app.config.setdefault("RATELIMIT_KEY_HEADER", "X-API-Key")
+        app.config.setdefault("RATELIMIT_MAX_CONCURRENT", 64)
+        app.config.setdefault("RATELIMIT_BACKEND", None)
+        if not app.config["RATELIMIT_ENABLED"]:
+            return
+        app.extensions["rate_limiter"] = Limits(app.config)
+        app.before_request(self.before_request)
+        app.teardown_request(self.teardown_request)
+
+    def before_request(self):
+        limits = current_app.extensions["rate_limiter"]
+        key = limits.key(request.headers, request.remote_addr)
+        rejection = limits.admit(key, request.endpoint)
+        if rejection:
+            return rejection_response(*rejection)
+        g.admitted = True
+
+    def teardown_request(self, exc):
+        if g.pop("admitted", False):
+            current_app.extensions["rate_limiter"].release()
+
+
+def rejection_response(status, message, retry_after):
+    response = make_response(jsonify({"message": message}), status)
+    response.headers["Retry-After"] = str(retry_after)
+    return response
+
+
+rate_limiter = RateLimiter()
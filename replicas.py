@@ -0,0 +1,163 @@
+"""
+Read replicas: the SELECTs of GET and HEAD requests go to PostgreSQL streaming
+replicas, all other statements to the primary.
+
+Replicas are the SQLALCHEMY_BINDS whose key starts with "replica", which
+create_app builds from POSTGRES_REPLICA_HOSTS. Each read-only request takes the
+next healthy one in turn. When none is healthy it reads from the primary.
+
+Replicas lag behind the primary. A client that just wrote something gets a cookie
+that sends its reads to the primary for REPLICA_PIN_SECONDS, so it reads its own
+writes.
+"""
+
+import logging
+from itertools import count
+from threading import Lock
+from time import monotonic, time
+
+from flask import current_app, request
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+
+from models import db
+
+logger = logging.getLogger("fitapp.replicas")
+
+REPLICA_PREFIX = "replica"
+PIN_COOKIE = "fitapp_primary"
+READ_METHODS = ("GET", "HEAD", "OPTIONS")
+# Seconds since the last replayed transaction, 0 when the replica has replayed all
+# it received and NULL on a primary
+LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+class Replicas:
+    """
+    Round-robin over the replicas of one app, skipping the unhealthy ones.
+
+    A replica is checked at most every REPLICA_CHECK_INTERVAL seconds, when a
+    request is about to use it. It is healthy when it answers and lags less than
+    REPLICA_MAX_LAG seconds behind. A connection error marks it unhealthy until
+    the next check.
+
+    Attributes:
+        engines (dict): Engine of every replica bind, by key.
+        status (dict): `(healthy, checked_at)` of every replica, by key.
+    """
+
+    def __init__(self, config, engines):
+        self.check_interval = config["REPLICA_CHECK_INTERVAL"]
+        self.max_lag = config["REPLICA_MAX_LAG"]
+        self.engines = engines
+        self.keys = sorted(engines)
+        self.status = {key: (True, float("-inf")) for key in self.keys}
+        self.turns = count()
+        self._lock = Lock()
+        for key, engine in engines.items():
+            event.listen(engine, "handle_error", self.error_handler(key))
+
+    def choose(self):
+        """Returns the engine of the next healthy replica, or None for the primary."""
+        for _ in self.keys:
+            with self._lock:
+                key = self.keys[next(self.turns) % len(self.keys)]
+            if self.healthy(key):
+                return self.engines[key]
+        return None
+
+    def healthy(self, key):
+        healthy, checked_at = self.status[key]
+        if monotonic() - checked_at < self.check_interval:
+            return healthy
+        # Concurrent requests keep the previous verdict while this one checks
+        self.status[key] = (healthy, monotonic())
+        healthy = self.check(key)
+        self.status[key] = (healthy, monotonic())
+        return healthy
+
+    def check(self, key):
+        engine = self.engines[key]
+        try:
+            with engine.connect() as conn:
+                if engine.dialect.name == "postgresql":
+                    lag = conn.scalar(LAG_QUERY)
+                else:
+                    lag = conn.scalar(text("SELECT 0"))
+        except SQLAlchemyError as e:
+            logger.warning("replica %s unavailable: %s", key, e)
+            return False
+        if lag is not None and lag > self.max_lag:
+            logger.warning("replica %s is %.1f s behind", key, lag)
+            return False
+        return True
+
+    def error_handler(self, key):
+        def handle_error(context):
+            if isinstance(context.sqlalchemy_exception, OperationalError):
+                self.status[key] = (False, monotonic())
+
+        return handle_error
+
+
+class ReplicaRouter:
+    """
+    Routes the reads of read-only requests to replicas, when the app has any.
+
+    Responses to successful writes set a cookie pinning the client's reads to the
+    primary for REPLICA_PIN_SECONDS. Without replica binds no hooks are installed.
+    """
+
+    def init_app(self, app):
+        app.config.setdefault("REPLICA_CHECK_INTERVAL", 5)
+        app.config.setdefault("REPLICA_MAX_LAG", 10)
+        app.config.setdefault("REPLICA_PIN_SECONDS", 10)
+        binds = app.config.get("SQLALCHEMY_BINDS") or {}
+        keys = [key for key in binds if key and key.startswith(REPLICA_PREFIX)]
+        if not keys:
+            return
+        with app.app_context():
+            engines = {key: db.engines[key] for key in keys}
+        for key in keys:
+            # No model is bound to a replica, and create_all must leave them alone:
+            # they receive the schema through replication
+            db.metadatas.pop(key, None)
+        app.extensions["replicas"] = Replicas(app.config, engines)
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        app.teardown_request(self.teardown_request)
+
+    def before_request(self):
+        if request.method in READ_METHODS and not pinned():
+            db.session.info["replicas"] = current_app.extensions["replicas"]
+
+    def after_request(self, response):
+        if request.method not in READ_METHODS and response.status_code < 400:
+            seconds = current_app.config["REPLICA_PIN_SECONDS"]
+            response.set_cookie(
+                PIN_COOKIE,
+                str(int(time() + seconds)),
+                max_age=seconds,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+    def teardown_request(self, exc):
+        # The session outlives the request when the app context was pushed earlier
+        db.session.info.pop("replicas", None)
+        db.session.info.pop("replica", None)
+
+
+def pinned():
+    """Returns True while the client's pin cookie sends its reads to the primary."""
+    try:
+        return int(request.cookies.get(PIN_COOKIE, 0)) > time()
+    except ValueError:
+        return False
+
+
+replica_router = ReplicaRouter()
@@ -0,0 +1,216 @@
+"""
+Ranked search over exercise names, categories and descriptions.
+
+Every word typed is matched as a prefix, and all of them have to match. Name matches
+rank above category matches, which rank above description matches. Only when nothing
+matches are names compared by trigram similarity, so that typos still find something.
+
+PostgreSQL answers from the stored search document and the GIN indexes set up in
+models.py. Other databases, i.e. SQLite test runs, are searched with an in-memory
+index of the whole catalogue that is rebuilt whenever exercises change.
+"""
+
+import re
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from threading import Lock
+
+from flask import current_app
+from sqlalchemy import func, literal, select, text
+
+from conditional import exercise_versions
+from filters import InvalidFilter
+from models import SEARCH_DOCUMENT, TRIGRAMS_INSTALLED, Exercise, db
+from pagination import InvalidPageRequest
+from serialization import exercise_select
+
+# Same weights as ts_rank gives to the A, B and C labels of the document
+FIELD_WEIGHTS = {"name": 1.0, "category": 0.4, "description": 0.2}
+# Lowest word similarity for a typo match, like pg_trgm.word_similarity_threshold
+SIMILARITY = 0.4
+WORD = re.compile(r"\w+")
+
+
+def terms(query):
+    return WORD.findall(query.lower())
+
+
+def trigrams(word):
+    """Returns the trigrams of `word` padded the way pg_trgm pads words."""
+    padded = f"  {word} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def encode_page(mode, offset):
+    """Returns an opaque cursor for the results of `mode` starting at `offset`."""
+    return urlsafe_b64encode(f"{mode}|{offset}".encode()).decode().rstrip("=")
+
+
+def decode_page(cursor):
+    """Returns the `(mode, offset)` pair encoded by `encode_page`."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        mode, offset = urlsafe_b64decode(padded.encode()).decode().split("|")
+        if mode not in ("text", "fuzzy"):
+            raise ValueError(mode)
+        return mode, int(offset)
+    except ValueError as e:
+        raise InvalidPageRequest(f"invalid cursor: {cursor}") from e
+
+
+class MemoryIndex:
+    """
+    Inverted index of exercise words, with trigrams of the words in names.
+
+    Attributes:
+        rows (dict): `exercise_select` rows by exercise ID.
+        postings (dict): Word to `{exercise ID: weight of the best field}`.
+        words (list): Sorted postings keys, for prefix lookups.
+        name_words (dict): Word found in names to the IDs of those exercises.
+        name_trigrams (dict): Trigram to the name words containing it.
+    """
+
+    def __init__(self, rows):
+        self.rows = {}
+        self.postings = defaultdict(dict)
+        self.name_words = defaultdict(set)
+        self.name_trigrams = defaultdict(set)
+        for row in rows:
+            self.rows[row.id] = row
+            for field, weight in FIELD_WEIGHTS.items():
+                for word in terms(getattr(row, field) or ""):
+                    best = self.postings[word].get(row.id, 0)
+                    self.postings[word][row.id] = max(best, weight)
+            for word in terms(row.name):
+                self.name_words[word].add(row.id)
+        for word in self.name_words:
+            for trigram in trigrams(word):
+                self.name_trigrams[trigram].add(word)
+        self.words = sorted(self.postings)
+
+    def prefix_scores(self, term):
+        scores = {}
+        for i in range(bisect_left(self.words, term), len(self.words)):
+            word = self.words[i]
+            if not word.startswith(term):
+                break
+            for id, weight in self.postings[word].items():
+                scores[id] = max(scores.get(id, 0), weight)
+        return scores
+
+    def similar_scores(self, term):
+        wanted = trigrams(term)
+        shared = Counter(
+            word for trigram in wanted for word in self.name_trigrams.get(trigram, ())
+        )
+        scores = {}
+        for word, count in shared.items():
+            similarity = count / len(wanted)
+            if similarity >= SIMILARITY:
+                for id in self.name_words[word]:
+                    scores[id] = max(scores.get(id, 0), similarity)
+        return scores
+
+    def search(self, query, mode, allowed=None):
+        """Returns the matching rows, best first; `allowed` restricts the IDs."""
+        matched = None
+        for term in terms(query):
+            scores = self.prefix_scores(term)
+            if mode == "fuzzy":
+                for id, score in self.similar_scores(term).items():
+                    scores[id] = max(scores.get(id, 0), score)
+            if matched is None:
+                matched = scores
+            else:
+                matched = {
+                    id: total + scores[id]
+                    for id, total in matched.items()
+                    if id in scores
+                }
+        if allowed is not None:
+            matched = {id: score for id, score in matched.items() if id in allowed}
+        ranked = sorted(matched.items(), key=lambda item: (-item[1], item[0]))
+        return [self.rows[id] for id, _ in ranked]
+
+
+def memory_index():
+    """Returns the app's in-memory index, rebuilt when the exercise versions change."""
+    state = current_app.extensions.setdefault(
+        "exercise_search", {"lock": Lock(), "version": None, "index": None}
+    )
+    version = tuple(db.session.execute(exercise_versions([])).one())
+    with state["lock"]:
+        if state["version"] != version:
+            state["index"] = MemoryIndex(db.session.execute(exercise_select()))
+            state["version"] = version
+        return state["index"]
+
+
+def memory_search(query, criteria, mode, offset, limit):
+    allowed = None
+    if criteria:
+        allowed = set(db.session.scalars(select(Exercise.id).where(*criteria)))
+    return memory_index().search(query, mode, allowed)[offset : offset + limit]
+
+
+def trigrams_available():
+    state = current_app.extensions.setdefault("exercise_trigrams", {})
+    if "installed" not in state:
+        state["installed"] = db.session.scalar(TRIGRAMS_INSTALLED) > 0
+    return state["installed"]
+
+
+def postgresql_search(query, criteria, mode, offset, limit):
+    if mode == "text":
+        tsquery = func.to_tsquery(
+            text("'simple'::regconfig"), " & ".join(f"{t}:*" for t in terms(query))
+        )
+        rank = func.ts_rank(SEARCH_DOCUMENT, tsquery)
+        criteria = [*criteria, SEARCH_DOCUMENT.op("@@")(tsquery)]
+    elif trigrams_available():
+        # `<%` is served by the trigram index using this threshold
+        db.session.execute(
+            select(
+                func.set_config(
+                    "pg_trgm.word_similarity_threshold", str(SIMILARITY), True
+                )
+            )
+        )
+        rank = func.word_similarity(query, Exercise.name)
+        criteria = [*criteria, literal(query).op("<%")(Exercise.name)]
+    else:
+        return []
+    statement = (
+        exercise_select()
+        .where(*criteria)
+        .order_by(rank.desc(), Exercise.id)
+        .offset(offset)
+        .limit(limit)
+    )
+    return db.session.execute(statement).all()
+
+
+def find_exercises(query, criteria, limit, cursor=None):
+    """
+    Returns a page of `limit` exercise rows matching `query` and `criteria`, and the
+    cursor of the next page or None.
+
+    Without a cursor the prefix matches are tried first, falling back to similar
+    names when there are none; the cursor keeps later pages in the same mode.
+    """
+    if not terms(query):
+        raise InvalidFilter("q must contain at least one word")
+    mode, offset = decode_page(cursor) if cursor else ("text", 0)
+    find = (
+        postgresql_search if db.engine.dialect.name == "postgresql" else memory_search
+    )
+    rows = find(query, criteria, mode, offset, limit + 1)
+    if not rows and cursor is None:
+        mode = "fuzzy"
+        rows = find(query, criteria, mode, offset, limit + 1)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_page(mode, offset + limit)
+    return rows, next_cursor
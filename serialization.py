@@ -0,0 +1,155 @@
+from collections import defaultdict
+from datetime import date
+from uuid import UUID
+
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import select
+
+from models import Category, Exercise, User, Workout, WorkoutExercise
+
+try:
+    import orjson
+except ImportError:  # the stdlib encoder is used instead
+    orjson = None
+
+COMPACT = {"separators": (",", ":")}
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    JSON provider encoding compact responses with orjson when it is installed.
+
+    The output is byte-identical to Flask's default provider: keys are sorted and
+    payloads containing non-ASCII characters are left to the stdlib encoder, which
+    escapes them. UUIDs and dates are written as strings (ISO 8601 for dates) by
+    both encoders. The one difference is the spelling of floats that need an
+    exponent (below 1e-4 or from 1e16 up): orjson writes `1e16`, not `1e+16`.
+    """
+
+    @staticmethod
+    def default(value):
+        if isinstance(value, UUID):
+            return str(value)
+        if isinstance(value, date):
+            return value.isoformat()
+        return DefaultJSONProvider.default(value)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and kwargs == COMPACT:
+            option = orjson.OPT_SORT_KEYS if self.sort_keys else 0
+            try:
+                encoded = orjson.dumps(obj, default=self.default, option=option)
+            except TypeError:
+                pass
+            else:
+                if encoded.isascii() or not self.ensure_ascii:
+                    return encoded.decode()
+        return super().dumps(obj, **kwargs)
+
+
+# Column-level equivalents of the models' make_json: each select fetches plain
+# tuples and the matching function turns a row into the same dictionary, leaving
+# UUIDs and datetimes for the encoder. Relationships are joined, never loaded.
+
+
+def exercise_select():
+    return (
+        select(
+            Exercise.id,
+            Exercise.name,
+            Exercise.description,
+            Category.name.label("category"),
+            Exercise.custom_made,
+            User.username.label("created_by"),
+        )
+        .join(Exercise.category_ref)
+        .outerjoin(Exercise.creator)
+    )
+
+
+def exercise_json(row):
+    return {
+        "id": row.id,
+        "name": row.name,
+        "description": row.description or "No description available",
+        "category": row.category,
+        "custom_made": row.custom_made,
+        "created_by": row.created_by,
+    }
+
+
+def user_select():
+    return select(User.id, User.username, User.email, User.name, User.created_at)
+
+
+def user_json(row):
+    return {
+        "id": row.id,
+        "username": row.username,
+        "email": row.email,
+        "name": row.name,
+        "created_at": row.created_at,
+    }
+
+
+def workout_exercise_select():
+    return select(
+        WorkoutExercise.id,
+        WorkoutExercise.workout_id,
+        WorkoutExercise.exercise_id,
+        WorkoutExercise.sets,
+        WorkoutExercise.repetitions,
+        WorkoutExercise.weights,
+        WorkoutExercise.duration,
+    )
+
+
+def workout_exercise_json(row):
+    return {
+        "id": row.id,
+        "workout_id": row.workout_id,
+        "exercise_id": row.exercise_id,
+        "sets": row.sets,
+        "repetitions": row.repetitions,
+        "weights": row.weights,
+        "duration": row.duration,
+    }
+
+
+def workout_select():
+    """Also fetches what archive.month_versions needs to find archived exercises."""
+    user = User.username.label("user")
+    return select(
+        Workout.id,
+        Workout.created_at,
+        user,
+        Workout.user_workout_id,
+        Workout.archived,
+    ).join(Workout.user)
+
+
+def workout_json(row):
+    return {"id": row.id, "created_at": row.created_at, "user": row.user}
+
+
+def workout_exercises_of(rows):
+    """
+    Selects the exercises of all workout `rows` at once.
+
+    The dates of the workouts bound the search to the partitions of their months.
+    """
+    criteria = [WorkoutExercise.workout_id.in_([row.id for row in rows])]
+    if rows:
+        created = [row.created_at for row in rows]
+        criteria.append(
+            WorkoutExercise.workout_created_at.between(min(created), max(created))
+        )
+    return workout_exercise_select().where(*criteria)
+
+
+def workouts_json(rows, exercise_rows):
+    """Returns the dictionaries of workout `rows` given the rows of their exercises."""
+    exercises = defaultdict(list)
+    for row in exercise_rows:
+        exercises[row.workout_id].append(workout_exercise_json(row))
+    return [{**workout_json(row), "exercises": exercises[row.id]} for row in rows]
@@ -0,0 +1,362 @@
+from datetime import date, timedelta
+
+from sqlalchemy import Date, func, select
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+
+from archive import archived_history, archived_records, grouped_volumes, with_period
+from filters import InvalidFilter, date_range, parse_uuid_arg
+from models import Exercise, ExerciseVolume, UserVolume, Workout, WorkoutExercise
+
+
+class day_start(FunctionElement):
+    """Truncates a timestamp to its date."""
+
+    type = Date()
+    inherit_cache = True
+
+
+class week_start(FunctionElement):
+    """Truncates a timestamp to the Monday of its week."""
+
+    type = Date()
+    inherit_cache = True
+
+
+class month_start(FunctionElement):
+    """Truncates a timestamp to the first day of its month."""
+
+    type = Date()
+    inherit_cache = True
+
+
+@compiles(day_start)
+@compiles(week_start)
+@compiles(month_start)
+def compile_date_trunc(element, compiler, **kw):
+    unit = type(element).__name__.split("_")[0]
+    column = compiler.process(element.clauses, **kw)
+    return f"CAST(date_trunc('{unit}', {column}) AS DATE)"
+
+
+@compiles(day_start, "sqlite")
+def compile_sqlite_day(element, compiler, **kw):
+    return f"date({compiler.process(element.clauses, **kw)})"
+
+
+@compiles(week_start, "sqlite")
+def compile_sqlite_week(element, compiler, **kw):
+    return f"date({compiler.process(element.clauses, **kw)}, 'weekday 0', '-6 days')"
+
+
+@compiles(month_start, "sqlite")
+def compile_sqlite_month(element, compiler, **kw):
+    return f"date({compiler.process(element.clauses, **kw)}, 'start of month')"
+
+
+BUCKETS = {"day": day_start, "week": week_start, "month": month_start}
+
+
+def period_start(day, bucket):
+    """Returns the first day of the day, week (Monday) or month containing `day`."""
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+
+# Volume of a single workout-exercise row
+repetitions = WorkoutExercise.sets * WorkoutExercise.repetitions
+tonnage = WorkoutExercise.sets * WorkoutExercise.repetitions * WorkoutExercise.weights
+
+
+def volume_columns():
+    """Aggregates shared by the totals, per-exercise and trend queries."""
+    return [
+        func.coalesce(func.sum(WorkoutExercise.sets), 0).label("sets"),
+        func.coalesce(func.sum(repetitions), 0).label("repetitions"),
+        func.coalesce(func.sum(tonnage), 0).label("tonnage"),
+        func.coalesce(func.sum(WorkoutExercise.duration), 0).label("duration"),
+        func.count(func.distinct(Workout.id)).label("workouts"),
+    ]
+
+
+def volume_json(row):
+    return {
+        "sets": row.sets,
+        "repetitions": row.repetitions,
+        "tonnage": row.tonnage,
+        "duration": row.duration,
+        "workouts": row.workouts,
+    }
+
+
+def stats_criteria(user_id, args):
+    """Returns the criteria selecting a user's workout exercises within `from`/`to`."""
+    criteria = [Workout.user_workout_id == user_id]
+    criteria += date_range(Workout.created_at, args)
+    # Repeated on the copy of the date, so both tables skip partitions out of range
+    criteria += date_range(WorkoutExercise.workout_created_at, args)
+    if "exercise_id" in args:
+        exercise_id = parse_uuid_arg(args, "exercise_id")
+        criteria.append(WorkoutExercise.exercise_id == exercise_id)
+    return criteria
+
+
+def volume_totals(criteria):
+    """Returns sets, repetitions, tonnage and duration over the whole range."""
+    return (
+        select(*volume_columns())
+        .select_from(WorkoutExercise)
+        .join(WorkoutExercise.workout)
+        .where(*criteria)
+    )
+
+
+def exercise_totals(criteria):
+    """Returns sets, repetitions, tonnage and duration per exercise."""
+    return (
+        select(WorkoutExercise.exercise_id, Exercise.name, *volume_columns())
+        .select_from(WorkoutExercise)
+        .join(WorkoutExercise.workout)
+        .join(WorkoutExercise.exercise)
+        .where(*criteria)
+        .group_by(WorkoutExercise.exercise_id, Exercise.name)
+        .order_by(Exercise.name)
+    )
+
+
+def personal_records(criteria):
+    """Returns the heaviest set of every exercise, ranked with a window function."""
+    ranked = (
+        select(
+            WorkoutExercise.exercise_id,
+            WorkoutExercise.weights,
+            WorkoutExercise.repetitions,
+            Workout.id.label("workout_id"),
+            Workout.created_at,
+            func.row_number()
+            .over(
+                partition_by=WorkoutExercise.exercise_id,
+                order_by=(WorkoutExercise.weights.desc(), Workout.created_at),
+            )
+            .label("rank"),
+        )
+        .select_from(WorkoutExercise)
+        .join(WorkoutExercise.workout)
+        .where(WorkoutExercise.weights.is_not(None), *criteria)
+        .subquery()
+    )
+    return select(ranked).where(ranked.c.rank == 1)
+
+
+def volume_trend(criteria, bucket):
+    """Returns sets, tonnage and duration per day, week or month."""
+    if bucket not in BUCKETS:
+        raise InvalidFilter(f"bucket must be one of: {', '.join(BUCKETS)}")
+    period = BUCKETS[bucket](Workout.created_at).label("period")
+    return (
+        select(period, *volume_columns())
+        .select_from(WorkoutExercise)
+        .join(WorkoutExercise.workout)
+        .where(*criteria)
+        .group_by(period)
+        .order_by(period)
+    )
+
+
+def summary_range(args, bucket):
+    """
+    Returns the `[start, end)` dates for reading `bucket` rows of the volume tables.
+
+    Returns None when `from`/`to` do not fall on period boundaries of `bucket`, in
+    which case the statistics have to be computed from the workout history.
+    """
+    bounds = []
+    for name in ("from", "to"):
+        if name not in args:
+            bounds.append(None)
+            continue
+        if len(args[name]) != 10:
+            return None
+        try:
+            day = date.fromisoformat(args[name])
+        except ValueError as e:
+            raise InvalidFilter(f"invalid {name} date: {args[name]}") from e
+        if name == "to":
+            day += timedelta(days=1)
+        if period_start(day, bucket) != day:
+            return None
+        bounds.append(day)
+    return bounds
+
+
+def summary_columns(model):
+    """Sums of the stored volume columns of `model`."""
+    return [
+        func.coalesce(func.sum(model.sets), 0).label("sets"),
+        func.coalesce(func.sum(model.repetitions), 0).label("repetitions"),
+        func.coalesce(func.sum(model.tonnage), 0).label("tonnage"),
+        func.coalesce(func.sum(model.duration), 0).label("duration"),
+        func.coalesce(func.sum(model.workouts), 0).label("workouts"),
+    ]
+
+
+def summary_criteria(model, user_id, bucket, bounds, exercise_id):
+    start, end = bounds
+    criteria = [model.user_id == user_id, model.bucket == bucket]
+    if start:
+        criteria.append(model.period >= start)
+    if end:
+        criteria.append(model.period < end)
+    if exercise_id:
+        criteria.append(model.exercise_id == exercise_id)
+    return criteria
+
+
+def summary_totals(user_id, bucket, bounds, exercise_id):
+    """Sums the stored volume of every period in range."""
+    model = ExerciseVolume if exercise_id else UserVolume
+    criteria = summary_criteria(model, user_id, bucket, bounds, exercise_id)
+    return select(*summary_columns(model)).where(*criteria)
+
+
+def summary_exercises(user_id, bucket, bounds, exercise_id):
+    """Sums the stored per-exercise volume of every period in range."""
+    criteria = summary_criteria(ExerciseVolume, user_id, bucket, bounds, exercise_id)
+    return (
+        select(
+            ExerciseVolume.exercise_id, Exercise.name, *summary_columns(ExerciseVolume)
+        )
+        .join(Exercise, Exercise.id == ExerciseVolume.exercise_id)
+        .where(*criteria)
+        .group_by(ExerciseVolume.exercise_id, Exercise.name)
+        .order_by(Exercise.name)
+    )
+
+
+def summary_trend(user_id, bucket, bounds, exercise_id):
+    """Reads the stored volume per period, one row each."""
+    model = ExerciseVolume if exercise_id else UserVolume
+    criteria = summary_criteria(model, user_id, bucket, bounds, exercise_id)
+    return (
+        select(
+            model.period,
+            model.sets,
+            model.repetitions,
+            model.tonnage,
+            model.duration,
+            model.workouts,
+        )
+        .where(*criteria)
+        .order_by(model.period)
+    )
+
+
+def add_volume(volume, extra):
+    for name, value in extra.items():
+        volume[name] += value
+
+
+def record_json(record):
+    return {
+        "weights": record["weights"],
+        "repetitions": record["repetitions"],
+        "workout_id": str(record["workout_id"]),
+        "date": record["created_at"].isoformat(),
+    }
+
+
+def user_stats(session, user_id, args):
+    """
+    Runs the statistics queries for one user and returns them as a dictionary.
+
+    Totals and trends are read from the volume tables whenever the requested range
+    falls on period boundaries; other ranges and personal records are computed
+    from the workout history, adding the archived exercises (archive.py).
+    """
+    bucket = args.get("bucket", "week")
+    if bucket not in BUCKETS:
+        raise InvalidFilter(f"bucket must be one of: {', '.join(BUCKETS)}")
+    criteria = stats_criteria(user_id, args)
+    exercise_id = parse_uuid_arg(args, "exercise_id")
+
+    totals_bucket = next(
+        (name for name in ("month", "day") if summary_range(args, name) is not None),
+        None,
+    )
+    if totals_bucket:
+        bounds = summary_range(args, totals_bucket)
+        totals = summary_totals(user_id, totals_bucket, bounds, exercise_id)
+        exercises = summary_exercises(user_id, totals_bucket, bounds, exercise_id)
+    else:
+        totals = volume_totals(criteria)
+        exercises = exercise_totals(criteria)
+    bounds = summary_range(args, bucket)
+    if bounds is not None:
+        trend = summary_trend(user_id, bucket, bounds, exercise_id)
+    else:
+        trend = volume_trend(criteria, bucket)
+
+    total = volume_json(session.execute(totals).one())
+    per_exercise = {
+        row.exercise_id: {"name": row.name, **volume_json(row)}
+        for row in session.execute(exercises)
+    }
+    periods = {row.period: volume_json(row) for row in session.execute(trend)}
+    records = {
+        row.exercise_id: row._asdict()
+        for row in session.execute(personal_records(criteria))
+    }
+    history = archived_history(session, user_id, args, exercise_id)
+    if history is not None:
+        # The volume tables still count archived exercises, the workout history not
+        if not totals_bucket:
+            for volume in grouped_volumes(history, []).values():
+                add_volume(total, volume)
+            archived = grouped_volumes(history, ["exercise_id"])
+            missing = [key for key, in archived if key not in per_exercise]
+            names = dict(
+                session.execute(
+                    select(Exercise.id, Exercise.name).where(Exercise.id.in_(missing))
+                ).all()
+            )
+            for (key,), volume in archived.items():
+                empty = {"name": names.get(key), **dict.fromkeys(volume, 0)}
+                add_volume(per_exercise.setdefault(key, empty), volume)
+            per_exercise = dict(
+                sorted(
+                    per_exercise.items(),
+                    key=lambda item: (item[1]["name"] or "", item[0]),
+                )
+            )
+        if bounds is None:
+            archived = grouped_volumes(with_period(history, bucket), ["period"])
+            for (period,), volume in archived.items():
+                add_volume(periods.setdefault(period, dict.fromkeys(volume, 0)), volume)
+            periods = dict(sorted(periods.items()))
+        for key, record in archived_records(history).items():
+            current = records.get(key)
+            if current is None or (record["weights"], current["created_at"]) > (
+                current["weights"],
+                record["created_at"],
+            ):
+                records[key] = record
+    return {
+        "totals": total,
+        "exercises": [
+            {
+                "exercise_id": str(key),
+                **volume,
+                "personal_record": (
+                    record_json(records[key]) if key in records else None
+                ),
+            }
+            for key, volume in per_exercise.items()
+        ],
+        "trend": [
+            {"period": period.isoformat(), **volume}
+            for period, volume in periods.items()
+        ],
+    }
@@ -0,0 +1,30 @@
+from flask import Response, current_app, request, stream_with_context
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+# Rows fetched from the server-side cursor per round trip
+STREAM_BATCH_SIZE = 1000
+
+
+def wants_stream(req=None):
+    """Returns True when the client asked for an NDJSON stream instead of a JSON array."""
+    req = req or request
+    if req.args.get("stream", "").lower() in ("1", "true"):
+        return True
+    best = req.accept_mimetypes.best_match(["application/json", NDJSON_MIMETYPE])
+    return best == NDJSON_MIMETYPE
+
+
+def ndjson_response(query, serialize=lambda obj: obj.make_json()):
+    """
+    Streams the rows of an ORM query as newline-delimited JSON.
+
+    Rows are read through a server-side cursor in batches of STREAM_BATCH_SIZE and
+    every record is written out as soon as it is serialized, so memory use does not
+    grow with the size of the result.
+    """
+
+    def generate():
+        for obj in query.yield_per(STREAM_BATCH_SIZE):
+            yield current_app.json.dumps(serialize(obj)) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
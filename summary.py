@@ -0,0 +1,367 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from math import isclose, isfinite
+from uuid import UUID
+
+import click
+from flask.cli import AppGroup
+from flask_sqlalchemy.session import Session
+from sqlalchemy import String, delete, event, func, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import attributes
+from sqlalchemy.orm.util import identity_key
+
+from archive import archive_dir, grouped_volumes, read_months, with_period
+from changes import record
+from models import (
+    ArchivedMonth,
+    ExerciseVolume,
+    UserVolume,
+    Workout,
+    WorkoutExercise,
+    db,
+)
+from stats import BUCKETS, add_volume, period_start, volume_columns
+
+ROW_FIELDS = ["workout_id", "exercise_id", "sets", "repetitions", "weights", "duration"]
+VOLUME_FIELDS = ["sets", "repetitions", "tonnage", "duration", "workouts"]
+AMOUNT_FIELDS = ["sets", "repetitions", "weights", "duration"]
+INTEGER_FIELDS = {"sets", "repetitions"}
+
+
+def as_number(field, value):
+    """
+    Returns `value` as the int or float stored in `field`, or None for None.
+
+    Numbers given as strings are converted, as PostgreSQL casts them on insert.
+    Raises ValueError when `value` is not a number the column accepts.
+    """
+    if value is None:
+        return None
+    try:
+        if isinstance(value, bool):
+            raise TypeError
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be a number") from None
+    if field in INTEGER_FIELDS:
+        if not (number.is_integer() and abs(number) < 2**31):
+            raise ValueError(f"{field} must be an integer")
+        return int(number)
+    if not isfinite(number):
+        raise ValueError(f"{field} must be a finite number")
+    return number
+
+
+def amounts(row):
+    """
+    Returns the sets, repetitions, weights and duration of `row` as numbers.
+
+    Raises ValueError naming the first field that is invalid, or `sets` when missing.
+    """
+    values = {field: as_number(field, row.get(field)) for field in AMOUNT_FIELDS}
+    if values["sets"] is None:
+        raise ValueError("sets must be a number")
+    return values
+
+
+def row_volume(row):
+    """Returns the volume a single workout-exercise row adds to its period."""
+    sets, repetitions, weights = row["sets"], row["repetitions"], row["weights"]
+    return {
+        "sets": sets,
+        "repetitions": sets * repetitions if repetitions is not None else 0,
+        "tonnage": (
+            sets * repetitions * weights
+            if repetitions is not None and weights is not None
+            else 0.0
+        ),
+        "duration": row["duration"] or 0.0,
+    }
+
+
+def workout_keys(session, workout_ids):
+    """Returns `{workout_id: (user_id, date)}`, preferring objects held by the session."""
+    keys = {}
+    pending = {obj.id: obj for obj in session.new if isinstance(obj, Workout)}
+    for workout_id in workout_ids:
+        workout = pending.get(workout_id) or session.identity_map.get(
+            identity_key(Workout, workout_id)
+        )
+        if workout is not None:
+            keys[workout_id] = (workout.user_workout_id, workout.created_at.date())
+    missing = set(workout_ids) - set(keys)
+    if missing:
+        statement = select(
+            Workout.id, Workout.user_workout_id, Workout.created_at
+        ).where(Workout.id.in_(missing))
+        for workout_id, user_id, created_at in session.execute(statement):
+            keys[workout_id] = (user_id, created_at.date())
+    return keys
+
+
+def apply_changes(session, changes):
+    """
+    Folds written workout-exercise rows into the volume tables.
+
+    `changes` holds `(row, sign)` pairs: +1 for inserted rows and -1 for deleted ones;
+    an update is the deletion of the old values plus the insertion of the new ones.
+    Must be called after the rows were written in the current transaction, because
+    workouts are counted by comparing the exercise counts before and after. The
+    workouts are locked until the transaction ends, so concurrent writers to the
+    same workout count one after the other, each seeing the rows of the previous.
+    """
+    if not changes:
+        return
+    changes = [(normalized(row), sign) for row, sign in changes]
+    workouts = workout_keys(session, {row["workout_id"] for row, _ in changes})
+    user_rows = defaultdict(lambda: dict.fromkeys(VOLUME_FIELDS, 0))
+    exercise_rows = defaultdict(lambda: dict.fromkeys(VOLUME_FIELDS, 0))
+    workout_delta = defaultdict(int)
+    pair_delta = defaultdict(int)
+    for row, sign in changes:
+        user_id, day = workouts[row["workout_id"]]
+        volume = row_volume(row)
+        for bucket in BUCKETS:
+            period = period_start(day, bucket)
+            user_key = (user_id, bucket, period)
+            exercise_key = (user_id, bucket, period, row["exercise_id"])
+            for name, value in volume.items():
+                user_rows[user_key][name] += sign * value
+                exercise_rows[exercise_key][name] += sign * value
+        workout_delta[row["workout_id"]] += sign
+        pair_delta[(row["workout_id"], row["exercise_id"])] += sign
+
+    # A workout is counted from its first exercise until its last one is removed
+    workout_counts = defaultdict(int)
+    pair_counts = {}
+    days = [workouts[workout_id][1] for workout_id in workout_delta]
+    # Limits the lock and the count to the partitions of the workouts' months
+    start = datetime.combine(min(days), time())
+    end = datetime.combine(max(days) + timedelta(days=1), time())
+    session.execute(
+        select(Workout.id)
+        .where(
+            Workout.id.in_(workout_delta),
+            Workout.created_at >= start,
+            Workout.created_at < end,
+        )
+        .order_by(Workout.id)
+        .with_for_update()
+    )
+    statement = (
+        select(WorkoutExercise.workout_id, WorkoutExercise.exercise_id, func.count())
+        .where(
+            WorkoutExercise.workout_id.in_(workout_delta),
+            WorkoutExercise.workout_created_at >= start,
+            WorkoutExercise.workout_created_at < end,
+        )
+        .group_by(WorkoutExercise.workout_id, WorkoutExercise.exercise_id)
+    )
+    for workout_id, exercise_id, count in session.execute(statement):
+        pair_counts[(workout_id, exercise_id)] = count
+        workout_counts[workout_id] += count
+    for workout_id, delta in workout_delta.items():
+        after = workout_counts[workout_id]
+        change = (after > 0) - (after - delta > 0)
+        user_id, day = workouts[workout_id]
+        for bucket in BUCKETS:
+            key = (user_id, bucket, period_start(day, bucket))
+            user_rows[key]["workouts"] += change
+    for (workout_id, exercise_id), delta in pair_delta.items():
+        after = pair_counts.get((workout_id, exercise_id), 0)
+        change = (after > 0) - (after - delta > 0)
+        user_id, day = workouts[workout_id]
+        for bucket in BUCKETS:
+            key = (user_id, bucket, period_start(day, bucket), exercise_id)
+            exercise_rows[key]["workouts"] += change
+
+    users = {user_id for user_id, _ in workouts.values()}
+    upsert(session, UserVolume, user_rows, users)
+    upsert(session, ExerciseVolume, exercise_rows, users)
+
+
+def record_core_writes(session, rows, sign):
+    """
+    Books workout-exercise rows inserted (`sign` +1) or deleted (-1) with Core
+    statements, which bypass the session events maintaining the volume tables and
+    the change log. Call it right after the statement, with the rows as mappings.
+    """
+    apply_changes(session, [(row, sign) for row in rows])
+    record(session, "workout_exercise", [row["id"] for row in rows], deleted=sign < 0)
+
+
+def upsert(session, model, rows, users):
+    """Adds the deltas in `rows` to the stored totals and drops rows left empty."""
+    table = model.__table__
+    keys = [column.name for column in table.primary_key]
+    values = [
+        dict(zip(keys, key), **volume)
+        for key, volume in rows.items()
+        if any(volume.values())
+    ]
+    if not values:
+        return
+    dialect = session.get_bind().dialect.name
+    statement = (postgresql if dialect == "postgresql" else sqlite).insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=keys,
+        set_={name: table.c[name] + statement.excluded[name] for name in VOLUME_FIELDS},
+    )
+    session.execute(statement, values)
+    session.execute(
+        delete(table).where(table.c.user_id.in_(users), table.c.workouts <= 0)
+    )
+
+
+def committed_row(obj):
+    """Returns the values of a workout exercise as they were before this flush."""
+    row = {}
+    for field in ROW_FIELDS:
+        history = attributes.get_history(obj, field)
+        row[field] = history.deleted[0] if history.deleted else getattr(obj, field)
+    return row
+
+
+def current_row(obj):
+    return {field: getattr(obj, field) for field in ROW_FIELDS}
+
+
+def normalized(row):
+    """Returns `row` with UUID foreign keys and numeric amounts, whatever was assigned."""
+    return dict(
+        row,
+        **{
+            field: row[field] if isinstance(row[field], UUID) else UUID(str(row[field]))
+            for field in ("workout_id", "exercise_id")
+        },
+        **amounts(row),
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def track_workout_exercises(session, flush_context):
+    """
+    Keeps the volume tables in step with ORM writes of workout exercises.
+
+    Rows written with Core statements bypass this hook and have to be passed to
+    record_core_writes explicitly. Moving a workout to another user or date is not
+    tracked; run `flask summary rebuild` after such edits.
+    """
+    changes = []
+    for obj in session.new:
+        if isinstance(obj, WorkoutExercise):
+            changes.append((current_row(obj), 1))
+    for obj in session.deleted:
+        if isinstance(obj, WorkoutExercise):
+            changes.append((committed_row(obj), -1))
+    for obj in session.dirty:
+        if isinstance(obj, WorkoutExercise) and session.is_modified(obj):
+            old, new = committed_row(obj), current_row(obj)
+            if old != new:
+                changes += [(old, -1), (new, 1)]
+    apply_changes(session, changes)
+
+
+def recomputed(model, bucket):
+    """Returns a SELECT computing the rows of `model` for `bucket` from scratch."""
+    period = BUCKETS[bucket](Workout.created_at)
+    keys = [Workout.user_workout_id, literal(bucket, String), period]
+    groups = [Workout.user_workout_id, period]
+    if model is ExerciseVolume:
+        keys.append(WorkoutExercise.exercise_id)
+        groups.append(WorkoutExercise.exercise_id)
+    return (
+        select(*keys, *volume_columns())
+        .select_from(WorkoutExercise)
+        .join(WorkoutExercise.workout)
+        .group_by(*groups)
+    )
+
+
+def archived_volumes(session, model, bucket):
+    """
+    Returns the volume of the archived workout exercises, which `recomputed` does
+    not see, as `{key: volume}` keyed like the rows of `model`.
+    """
+    keys = ["period", "exercise_id"] if model is ExerciseVolume else ["period"]
+    rows = defaultdict(lambda: dict.fromkeys(VOLUME_FIELDS, 0))
+    entries = session.execute(
+        select(ArchivedMonth.user_id, ArchivedMonth.month, ArchivedMonth.version)
+    ).all()
+    for entry in entries:
+        table = with_period(read_months(archive_dir(), [entry]), bucket)
+        for key, volume in grouped_volumes(table, keys).items():
+            add_volume(rows[(entry.user_id, bucket, *key)], volume)
+    return rows
+
+
+def rebuild(session):
+    """Replaces the contents of the volume tables with a full recompute."""
+    for model in (UserVolume, ExerciseVolume):
+        table = model.__table__
+        columns = [column.name for column in table.primary_key] + VOLUME_FIELDS
+        session.execute(delete(table))
+        for bucket in BUCKETS:
+            session.execute(
+                table.insert().from_select(columns, recomputed(model, bucket))
+            )
+            archived = archived_volumes(session, model, bucket)
+            upsert(session, model, archived, {key[0] for key in archived})
+
+
+def check(session):
+    """Compares the volume tables with a full recompute and returns the differences."""
+    mismatches = []
+    for model in (UserVolume, ExerciseVolume):
+        table = model.__table__
+        keys = [column.name for column in table.primary_key]
+        for bucket in BUCKETS:
+            expected = {
+                tuple(row[: len(keys)]): row[len(keys) :]
+                for row in session.execute(recomputed(model, bucket))
+            }
+            for key, volume in archived_volumes(session, model, bucket).items():
+                want = expected.get(key, (0,) * len(VOLUME_FIELDS))
+                expected[key] = tuple(
+                    value + volume[name] for value, name in zip(want, VOLUME_FIELDS)
+                )
+            stored = select(table).where(table.c.bucket == bucket)
+            actual = {
+                tuple(row[: len(keys)]): row[len(keys) :]
+                for row in session.execute(stored)
+            }
+            for key in expected.keys() | actual.keys():
+                want, got = expected.get(key), actual.get(key)
+                if (
+                    want is None
+                    or got is None
+                    or not all(
+                        isclose(a, b, rel_tol=1e-9, abs_tol=1e-6)
+                        for a, b in zip(want, got)
+                    )
+                ):
+                    mismatches.append(f"{table.name} {key}: expected {want}, got {got}")
+    return mismatches
+
+
+summary_cli = AppGroup("summary", help="Maintain the pre-aggregated volume tables.")
+
+
+@summary_cli.command("rebuild")
+def rebuild_command():
+    """Recompute the volume tables from the workout history."""
+    rebuild(db.session)
+    db.session.commit()
+    click.echo("volume tables rebuilt")
+
+
+@summary_cli.command("check")
+def check_command():
+    """Compare the volume tables with a full recompute."""
+    mismatches = check(db.session)
+    for mismatch in mismatches:
+        click.echo(mismatch)
+    if mismatches:
+        raise click.exceptions.Exit(1)
+    click.echo("volume tables are consistent")
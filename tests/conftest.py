@@ -1,25 +1,126 @@
 import os
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
 import pytest
-from app import app as flask_app
-from models import db
+from sqlalchemy import event
+from app import create_app
+from cache import exercise_cache
+from models import Exercise, User, Workout, WorkoutExercise, db
+
 
 @pytest.fixture(scope="session")
 def testing_app():
-    flask_app.config.update(
+    # TEST_DATABASE_URL runs the suite against a real server instead of SQLite
+    return create_app(
         {
             "TESTING": True,
-            "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:"
+            "SQLALCHEMY_DATABASE_URI": os.environ.get(
+                "TEST_DATABASE_URL", "sqlite:///:memory:"
+            ),
+            "SQLALCHEMY_ENGINE_OPTIONS": {},
+            "RATELIMIT_ENABLED": False,
+            "JOBS_EAGER": True,
         }
     )
-    print(flask_app.config)
-    return flask_app
+
 
 @pytest.fixture
 def client(testing_app):
     # Create tables in test database
     with testing_app.app_context():
         db.create_all()
+        exercise_cache.invalidate()
         yield testing_app.test_client()
         # Clean up after tests
         db.session.remove()
-        db.drop_all()
\ No newline at end of file
+        db.drop_all()
+
+
+@pytest.fixture
+def seed_workouts(client):
+    """Returns a helper creating a user with `count` workouts, each holding a few exercises"""
+
+    def seed(count, exercises_per_workout=2):
+        user = User(username="testuser", name="Test User", email="test@example.com")
+        exercise = Exercise(name="Squat", category="Strength")
+        db.session.add_all([user, exercise])
+        start = datetime(2024, 1, 1)
+        for i in range(count):
+            workout = Workout(user=user, created_at=start + timedelta(days=i))
+            for _ in range(exercises_per_workout):
+                workout.workout_exercises.append(
+                    WorkoutExercise(exercise=exercise, sets=3, repetitions=10)
+                )
+            db.session.add(workout)
+        db.session.commit()
+        db.session.expunge_all()
+
+    return seed
+
+
+@pytest.fixture
+def seed_empty_workout(client):
+    """Returns a helper creating a user, an empty workout and two exercises"""
+
+    def seed():
+        """Returns the IDs of the user, the workout, the squat and the run"""
+        user = User(username="testuser", name="Test User", email="test@example.com")
+        workout = Workout(user=user)
+        squat = Exercise(name="Squat", category="Strength")
+        run = Exercise(name="Run", category="Cardio")
+        db.session.add_all([user, workout, squat, run])
+        db.session.commit()
+        return str(user.id), str(workout.id), str(squat.id), str(run.id)
+
+    return seed
+
+
+@pytest.fixture
+def seed_history():
+    """
+    Returns a helper creating two weeks of squats and runs for one user, in the
+    database of the app whose context is pushed
+    """
+
+    def seed():
+        """Returns the user's ID"""
+        user = User(username="testuser", name="Test User", email="test@example.com")
+        squat = Exercise(name="Squat", category="Strength")
+        run = Exercise(name="Run", category="Cardio")
+        sessions = [
+            (datetime(2024, 3, 4, 18), 100.0, 30),  # Monday, week 10
+            (datetime(2024, 3, 6, 18), 110.0, 20),  # Wednesday, week 10
+            (datetime(2024, 3, 11, 18), 105.0, 25),  # Monday, week 11
+        ]
+        for created_at, weight, minutes in sessions:
+            workout = Workout(user=user, created_at=created_at)
+            workout.workout_exercises = [
+                WorkoutExercise(exercise=squat, sets=5, repetitions=5, weights=weight),
+                WorkoutExercise(exercise=run, sets=1, duration=minutes),
+            ]
+            db.session.add(workout)
+        db.session.commit()
+        return str(user.id)
+
+    return seed
+
+
+@pytest.fixture
+def count_queries(client):
+    """Returns a context manager collecting every SQL statement sent inside the block"""
+
+    @contextmanager
+    def count():
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+
+    return count
@@ -0,0 +1,119 @@
+from datetime import datetime
+
+import pytest
+from flask import current_app
+
+from archive import archive_dir, archive_path
+from models import ArchivedMonth, Exercise, User, Workout, WorkoutExercise, db
+from summary import check, rebuild
+
+pytest.importorskip("pyarrow")
+
+
+@pytest.fixture
+def history(client, tmp_path, monkeypatch):
+    """Creates a user with workouts in May 2023 and in 2024, returning their IDs"""
+    monkeypatch.setitem(current_app.config, "ARCHIVE_DIR", str(tmp_path))
+    user = User(username="testuser", name="Test User", email="test@example.com")
+    squat = Exercise(name="Squat", category="Strength")
+    run = Exercise(name="Run", category="Cardio")
+    workouts = []
+    for day, weights in [(2, 100.0), (30, 120.0), (31, 120.0)]:
+        workout = Workout(user=user, created_at=datetime(2023, 5, day, 18))
+        workout.workout_exercises += [
+            WorkoutExercise(exercise=squat, sets=3, repetitions=5, weights=weights),
+            WorkoutExercise(exercise=run, sets=1, duration=25.5),
+        ]
+        workouts.append(workout)
+    recent = Workout(user=user, created_at=datetime(2024, 2, 1, 7))
+    recent.workout_exercises.append(
+        WorkoutExercise(exercise=squat, sets=5, repetitions=5, weights=110.0)
+    )
+    db.session.add_all([user, *workouts, recent])
+    db.session.commit()
+    return str(user.id), [str(w.id) for w in workouts], str(squat.id)
+
+
+def reads(client, user_id, workout_id):
+    """Returns the responses of the endpoints that show workout exercises"""
+    return [
+        client.get(f"/workouts?user={user_id}").json,
+        client.get(f"/workouts?user={user_id}&stream=1").data,
+        client.get(f"/workouts/{workout_id}").json,
+        client.get(f"/users/{user_id}/stats?bucket=month").json,
+        client.get(f"/users/{user_id}/stats?from=2023-05-02T12:00:00").json,
+        client.get(f"/users/{user_id}/stats?from=2023-05-01&to=2023-05-31").json,
+    ]
+
+
+def test_archived_workouts_read_the_same(client, history):
+    """Test archiving moves exercises to a file without changing any response"""
+    user_id, workout_ids, _ = history
+    before = reads(client, user_id, workout_ids[0])
+
+    result = current_app.test_cli_runner().invoke(
+        args=["archive", "run", "--before", "2024-01"]
+    )
+    assert "6 workout exercises of 1 user months archived" in result.output
+    assert WorkoutExercise.query.count() == 1
+    entry = ArchivedMonth.query.one()
+    assert (entry.month.isoformat(), entry.version, entry.rows) == ("2023-05-01", 1, 6)
+    assert archive_path(archive_dir(), entry.user_id, entry.month, 1).exists()
+
+    db.session.expunge_all()
+    assert reads(client, user_id, workout_ids[0]) == before
+    assert check(db.session) == []
+    rebuild(db.session)
+    assert check(db.session) == []
+
+
+def test_archiving_again_writes_a_new_version(client, history, monkeypatch):
+    """Test late workouts of an archived month land in the next file version"""
+    user_id, _, squat_id = history
+    monkeypatch.setitem(current_app.config, "ARCHIVE_COMPRESSION", "none")
+    runner = current_app.test_cli_runner()
+    runner.invoke(args=["archive", "run", "--before", "2024-01"])
+    operations = [
+        {
+            "op": "create_workout",
+            "data": {
+                "user_workout_id": user_id,
+                "created_at": "2023-05-20T10:00:00",
+                "exercises": [
+                    {
+                        "exercise_id": squat_id,
+                        "sets": 1,
+                        "repetitions": 1,
+                        "weights": 140,
+                    }
+                ],
+            },
+        }
+    ]
+    headers = {"Idempotency-Key": "archive-1"}
+    client.post("/sync", json={"operations": operations}, headers=headers)
+    before = client.get(f"/users/{user_id}/stats?from=2023-05-01T00:00:00").json
+
+    runner.invoke(args=["archive", "run", "--before", "2024-01"])
+    entry = ArchivedMonth.query.one()
+    assert (entry.version, entry.rows) == (2, 7)
+    db.session.expunge_all()
+    after = client.get(f"/users/{user_id}/stats?from=2023-05-01T00:00:00").json
+    assert after == before
+    squat = next(e for e in after["exercises"] if e["name"] == "Squat")
+    assert squat["personal_record"]["weights"] == 140
+    assert check(db.session) == []
+
+
+def test_archived_workouts_are_read_only(client, history):
+    """Test writes to archived workouts are refused with 409"""
+    _, workout_ids, squat_id = history
+    current_app.test_cli_runner().invoke(args=["archive", "run", "--before", "2024-01"])
+    items = [{"workout_id": workout_ids[0], "exercise_id": squat_id, "sets": 1}]
+    response = client.post(
+        "/workouts_exercises/batch", json={"workout_exercises": items}
+    )
+    assert response.status_code == 409
+    assert response.json["results"][0]["message"] == "workout is archived"
+    assert client.delete(f"/workouts/{workout_ids[0]}").status_code == 409
+    assert Workout.query.count() == 4
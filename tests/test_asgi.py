@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiosqlite")
+pytest.importorskip("uvicorn")
+httpx = pytest.importorskip("httpx")
+
+from asgi import create_asgi_app
+from cache import exercise_cache
+from models import db
+
+
+@pytest.fixture
+def asgi_app(tmp_path):
+    """Returns the ASGI app over a file database shared with its Flask app"""
+    app = create_asgi_app(
+        {
+            "TESTING": True,
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'asgi.db'}",
+            "SQLALCHEMY_ENGINE_OPTIONS": {},
+        }
+    )
+    with app.flask_app.app_context():
+        db.create_all()
+        exercise_cache.invalidate()
+        yield app
+        db.session.remove()
+    asyncio.run(app.engine.dispose())
+
+
+def get_all(app, *requests):
+    """Sends the `(path, headers)` requests to the ASGI app one after another"""
+
+    async def send():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            return [await c.get(path, headers=headers) for path, headers in requests]
+
+    return asyncio.run(send())
+
+
+def test_async_endpoints_match_flask(asgi_app, seed_history):
+    """Test the async handlers answer with the same bytes and ETags as Flask"""
+    flask_client = asgi_app.flask_app.test_client()
+    flask_client.post(
+        "/exercises", json={"name": "Row", "category": "Cardio", "custom_made": False}
+    )
+    seed_history()
+    paths = [
+        "/exercises?sort=-name",
+        "/users",
+        "/workouts?limit=2",
+        "/workouts?sort=-created_at&from=2024-03-05",
+        "/workouts_exercises",
+    ]
+    responses = get_all(asgi_app, *[(path, {}) for path in paths])
+    assert len(responses[2].json()["workouts"]) == 2
+    for path, response in zip(paths, responses):
+        expected = flask_client.get(path)
+        assert response.status_code == 200, path
+        assert response.content == expected.data, path
+        assert response.headers["ETag"] == expected.headers["ETag"], path
+
+
+def test_async_conditional_and_errors(asgi_app):
+    """Test 304s, filter errors and delegation of writes to Flask"""
+    first, invalid = get_all(asgi_app, ("/users", {}), ("/workouts?limit=0", {}))
+    assert invalid.status_code == 400
+    (cached,) = get_all(asgi_app, ("/users", {"If-None-Match": first.headers["ETag"]}))
+    assert cached.status_code == 304
+
+    async def create():
+        transport = httpx.ASGITransport(app=asgi_app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            user = {"username": "async", "name": "Async", "email": "a@example.com"}
+            return await c.post("/users", json=user)
+
+    assert asyncio.run(create()).status_code == 201
+    (users,) = get_all(asgi_app, ("/users", {}))
+    assert [user["username"] for user in users.json()] == ["async"]
+
+
+def test_async_rate_limit(tmp_path):
+    """Test the async handlers take tokens from the same buckets as Flask"""
+    app = create_asgi_app(
+        {
+            "TESTING": True,
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'limited.db'}",
+            "SQLALCHEMY_ENGINE_OPTIONS": {},
+            "RATELIMIT_ENABLED": True,
+            "RATELIMIT_RATE": 0.01,
+            "RATELIMIT_BURST": 10,
+        }
+    )
+    with app.flask_app.app_context():
+        db.create_all()
+        assert app.flask_app.test_client().get("/users").status_code == 200
+        ok, limited = get_all(app, ("/users", {}), ("/users", {}))
+        db.session.remove()
+    asyncio.run(app.engine.dispose())
+    assert ok.status_code == 200
+    assert limited.status_code == 429
+    assert limited.json() == {"message": "rate limit exceeded"}
+    assert "Retry-After" in limited.headers
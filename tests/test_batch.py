@@ -0,0 +1,98 @@
+from uuid import uuid4
+
+from models import Workout, WorkoutExercise
+
+
+def test_batch_adds_exercises_in_one_transaction(
+    client, count_queries, seed_empty_workout
+):
+    """Test adding many exercises with two validation queries and one insert"""
+    _, workout_id, squat_id, run_id = seed_empty_workout()
+    items = [
+        {"workout_id": workout_id, "exercise_id": squat_id, "sets": 3},
+        {"workout_id": workout_id, "exercise_id": run_id, "sets": 1, "duration": 20},
+    ] * 10
+
+    with count_queries() as statements:
+        response = client.post(
+            "/workouts_exercises/batch", json={"workout_exercises": items}
+        )
+    assert response.status_code == 201
+    assert [result["status"] for result in response.json["results"]] == [201] * 20
+    inserts = [s for s in statements if s.startswith("INSERT INTO workout_exercises")]
+    assert len(inserts) == 1
+    assert WorkoutExercise.query.count() == 20
+
+
+def test_batch_is_atomic(client, seed_empty_workout):
+    """Test that one unknown exercise rejects the whole batch"""
+    _, workout_id, squat_id, _ = seed_empty_workout()
+    items = [
+        {"workout_id": workout_id, "exercise_id": squat_id, "sets": 3},
+        {"workout_id": workout_id, "exercise_id": str(uuid4()), "sets": 3},
+        {"workout_id": workout_id, "sets": 3},
+    ]
+
+    response = client.post(
+        "/workouts_exercises/batch", json={"workout_exercises": items}
+    )
+    assert response.status_code == 400
+    assert [result["status"] for result in response.json["results"]] == [424, 404, 400]
+    assert WorkoutExercise.query.count() == 0
+
+
+def test_create_workout_with_exercises(client, seed_empty_workout):
+    """Test creating a whole workout together with its exercise list"""
+    user_id, _, squat_id, run_id = seed_empty_workout()
+    payload = {
+        "user_workout_id": user_id,
+        "exercises": [
+            {"exercise_id": squat_id, "sets": 5, "repetitions": 5, "weights": 100},
+            {"exercise_id": run_id, "sets": 1, "duration": 30},
+        ],
+    }
+
+    response = client.post("/workouts", json=payload)
+    assert response.status_code == 201
+    assert len(response.json["workout"]["exercises"]) == 2
+    assert len(response.json["results"]) == 2
+
+    payload["exercises"].append({"exercise_id": str(uuid4()), "sets": 1})
+    response = client.post("/workouts", json=payload)
+    assert response.status_code == 404
+    assert Workout.query.count() == 2
+
+
+def test_amounts_given_as_strings(client, seed_empty_workout):
+    """Test that numeric strings are stored as numbers and other values rejected per item"""
+    _, workout_id, squat_id, _ = seed_empty_workout()
+    item = {"workout_id": workout_id, "exercise_id": squat_id, "sets": 3}
+
+    response = client.post("/workouts_exercises", json={**item, "repetitions": "5"})
+    assert response.status_code == 201
+    assert response.json["workout_exercise"]["repetitions"] == 5
+    response = client.post("/workouts_exercises", json={**item, "sets": "three"})
+    assert response.status_code == 400
+    assert response.json["message"] == "sets must be a number"
+
+    items = [
+        {**item, "sets": "3", "weights": "82.5"},
+        {**item, "repetitions": 2.5},
+        {**item, "sets": True},
+    ]
+    response = client.post(
+        "/workouts_exercises/batch", json={"workout_exercises": items}
+    )
+    assert response.status_code == 400
+    assert [result["message"] for result in response.json["results"]] == [
+        "not applied",
+        "repetitions must be an integer",
+        "sets must be a number",
+    ]
+    response = client.post(
+        "/workouts_exercises/batch", json={"workout_exercises": items[:1]}
+    )
+    assert response.status_code == 201
+    added = response.json["results"][0]["workout_exercise"]
+    assert (added["sets"], added["weights"]) == (3, 82.5)
+    assert WorkoutExercise.query.count() == 2
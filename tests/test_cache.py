@@ -0,0 +1,67 @@
+from cache import MemoryBackend
+from models import Exercise, User, db
+
+
+def test_exercise_list_served_from_cache(client):
+    """Test that repeated reads hit the cache and carry a stable ETag"""
+    client.post("/exercises", json={"name": "Squat", "category": "Strength"})
+    before = client.get("/cache/stats").json["exercises"]
+
+    first = client.get("/exercises")
+    second = client.get("/exercises")
+    assert first.data == second.data
+    assert first.headers["ETag"] == second.headers["ETag"]
+    after = client.get("/cache/stats").json["exercises"]
+    assert after["hits"] - before["hits"] == 1
+    assert after["misses"] - before["misses"] == 1
+
+    # Different filters are cached separately
+    assert client.get("/exercises?category=Cardio").json == []
+
+
+def test_cache_hits_skip_the_database(client, count_queries):
+    """Test that cached reads and their 304s send no SQL, whatever the argument order"""
+    client.post("/exercises", json={"name": "Squat", "category": "Strength"})
+    etag = client.get("/exercises?category=Strength&sort=name").headers["ETag"]
+
+    with count_queries() as statements:
+        response = client.get("/exercises?sort=name&category=Strength")
+        assert response.status_code == 200
+        assert response.headers["ETag"] == etag
+        response = client.get(
+            "/exercises?category=Strength&sort=name", headers={"If-None-Match": etag}
+        )
+        assert response.status_code == 304
+    assert statements == []
+
+
+def test_writes_invalidate_exercise_cache(client):
+    """Test that exercise and user writes are visible on the next read"""
+    user = User(username="testuser", name="Test User", email="test@example.com")
+    db.session.add(user)
+    db.session.add(Exercise(name="Squat", category="Strength", creator=user))
+    db.session.commit()
+    user_id = str(user.id)
+    assert client.get("/exercises").json[0]["created_by"] == "testuser"
+
+    client.put(f"/users/{user_id}", json={"username": "renamed"})
+    assert client.get("/exercises").json[0]["created_by"] == "renamed"
+
+    exercise_id = client.get("/exercises").json[0]["id"]
+    client.put(f"/exercises/{exercise_id}", json={"name": "Front squat"})
+    assert client.get("/exercises").json[0]["name"] == "Front squat"
+
+
+def test_memory_backend_evicts_and_expires():
+    """Test LRU eviction and TTL expiry of the in-process backend"""
+    backend = MemoryBackend(maxsize=2, ttl=60)
+    backend.set("a", 1)
+    backend.set("b", 2)
+    backend.get("a")
+    backend.set("c", 3)
+    assert backend.get("b") is None
+    assert backend.get("a") == 1
+
+    expired = MemoryBackend(ttl=-1)
+    expired.set("a", 1)
+    assert expired.get("a") is None
@@ -0,0 +1,52 @@
+from uuid import UUID
+
+from sqlalchemy import text
+
+from models import Category, Exercise, User, db
+
+
+def test_categories_are_shared_and_created_on_use(client):
+    """Test exercises refer to one row per category, created by the first use"""
+    for name, category in [("Squat", "Strength"), ("Deadlift", "Strength")]:
+        client.post("/exercises", json={"name": name, "category": category})
+    client.post("/exercises", json={"name": "Run", "category": "Cardio"})
+    assert sorted(c.name for c in Category.query) == ["Cardio", "Strength"]
+    assert len({e.category_id for e in Exercise.query}) == 2
+
+    run = Exercise.query.filter_by(name="Run").one()
+    client.put(f"/exercises/{run.id}", json={"category": "Mobility"})
+    assert Category.query.count() == 3
+    response = client.get("/exercises?category=Mobility")
+    assert [(e["name"], e["category"]) for e in response.json] == [("Run", "Mobility")]
+    assert client.get("/exercises?category=Yoga").json == []
+    response = client.get("/exercises?sort=-category")
+    assert [e["category"] for e in response.json] == [
+        "Strength",
+        "Strength",
+        "Mobility",
+    ]
+
+
+def test_categories_of_new_exercises_resolve_on_flush(client):
+    """Test a category named before the exercise has a session is set on flush"""
+    plank = Exercise(name="Plank", category="Core")
+    assert (plank.category, plank.category_ref) == ("Core", None)
+    db.session.add(plank)
+    db.session.commit()
+    assert plank.category_ref.name == plank.category == "Core"
+    assert Category.query.filter_by(name="Core").count() == 1
+
+
+def test_guid_accepts_strings_and_returns_uuids(client):
+    """Test identifiers bind from strings and come back as UUIDs on any database"""
+    user = User(username="testuser", name="Test User", email="test@example.com")
+    db.session.add(user)
+    db.session.commit()
+    user_id = user.id
+    db.session.expunge_all()
+
+    found = db.session.get(User, str(user_id))
+    assert isinstance(found.id, UUID) and found.id == user_id
+    stored = db.session.scalar(text("SELECT id FROM users"))
+    if db.engine.dialect.name != "postgresql":
+        assert stored == user_id.bytes
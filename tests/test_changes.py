@@ -0,0 +1,87 @@
+from changes import backfill, compact
+from models import Change, Exercise, User, Workout, db
+
+
+def feed(client, since=0, limit=None):
+    path = f"/changes?since={since}" + (f"&limit={limit}" if limit else "")
+    response = client.get(path)
+    assert response.status_code == 200
+    return response.json
+
+
+def test_changes_follow_writes(client, seed_empty_workout):
+    """Test ORM and batch writes, updates and deletes all reach the feed"""
+    user_id, workout_id, squat_id, _ = seed_empty_workout()
+    start = feed(client)
+    assert {change["entity"] for change in start["changes"]} == {
+        "user",
+        "workout",
+        "exercise",
+    }
+
+    items = [{"exercise_id": squat_id, "sets": 3}]
+    response = client.post(
+        "/workouts", json={"user_workout_id": user_id, "exercises": items}
+    )
+    new_workout = response.json["workout"]["id"]
+    client.put(f"/exercises/{squat_id}", json={"description": "Back squat"})
+    client.put(f"/exercises/{squat_id}", json={"name": "Back squat"})
+    client.delete(f"/workouts/{workout_id}")
+
+    delta = feed(client, start["since"])
+    assert not delta["has_more"]
+    changes = {(c["entity"], c["id"]): c for c in delta["changes"]}
+    # Two updates of the exercise collapse into its current state
+    assert len(changes) == len(delta["changes"]) == 4
+    assert changes[("exercise", squat_id)]["data"]["name"] == "Back squat"
+    assert changes[("workout", new_workout)]["data"]["user"] == "testuser"
+    assert [c["deleted"] for c in delta["changes"]] == [False, False, False, True]
+    assert changes[("workout", workout_id)]["data"] is None
+
+    assert feed(client, delta["since"]) == {
+        "changes": [],
+        "since": delta["since"],
+        "has_more": False,
+    }
+
+
+def test_changes_pages_and_rollbacks(client):
+    """Test paging through the feed and that failed writes log nothing"""
+    for i in range(5):
+        db.session.add(Exercise(name=f"Exercise {i}", category="Strength"))
+        db.session.commit()
+    db.session.add(User(username="ghost", name="Ghost", email="ghost@example.com"))
+    db.session.flush()
+    db.session.rollback()
+
+    seen, since, has_more = [], 0, True
+    while has_more:
+        page = feed(client, since, limit=2)
+        seen += [change["data"]["name"] for change in page["changes"]]
+        since, has_more = page["since"], page["has_more"]
+    assert seen == [f"Exercise {i}" for i in range(5)]
+
+    assert client.get("/changes?since=-1").status_code == 400
+    assert client.get("/changes?since=latest").status_code == 400
+
+
+def test_compact_and_backfill(client):
+    """Test compaction keeps the newest entry per entity and backfill logs old rows"""
+    exercise = Exercise(name="Run", category="Cardio")
+    db.session.add(exercise)
+    db.session.commit()
+    for name in ("Jog", "Sprint"):
+        exercise.name = name
+        db.session.commit()
+    assert Change.query.count() == 3
+    assert compact(db.session) == 2
+    assert [c.seq for c in Change.query] == [3]
+
+    db.session.execute(Change.__table__.delete())
+    db.session.add(Workout(user=User(username="u", name="U", email="u@example.com")))
+    db.session.commit()
+    db.session.execute(Change.__table__.delete())
+    backfill(db.session)
+    db.session.commit()
+    logged = {change["entity"] for change in feed(client)["changes"]}
+    assert logged == {"exercise", "user", "workout"}
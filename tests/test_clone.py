@@ -0,0 +1,103 @@
+from sqlalchemy import select
+
+from models import Exercise, User, Workout, db
+from summary import check
+
+
+def workout_ids():
+    """Returns the IDs of the workouts, the oldest first"""
+    statement = select(Workout.id).order_by(Workout.created_at)
+    return [str(id) for id in db.session.scalars(statement)]
+
+
+def by_sets(exercises):
+    return sorted(exercises, key=lambda exercise: exercise["sets"])
+
+
+def test_clone_copies_exercises_in_one_insert(client, count_queries, seed_history):
+    """Test cloning applies the overload in SQL with a single INSERT ... SELECT"""
+    seed_history()
+    workout_id = workout_ids()[-1]
+    overload = {"weights_percent": 3, "weights_round": 1.25, "repetitions": 1}
+    body = {"created_at": "2024-03-08T18:00:00", "overload": overload}
+    with count_queries() as statements:
+        response = client.post(f"/workouts/{workout_id}/clone", json=body)
+    assert response.status_code == 201
+    inserts = [s for s in statements if s.startswith("INSERT INTO workout_exercises")]
+    assert len(inserts) == 1 and "SELECT" in inserts[0]
+
+    workout = response.json["workout"]
+    assert (workout["created_at"], workout["user"]) == (
+        "2024-03-08T18:00:00",
+        "testuser",
+    )
+    run, squat = by_sets(workout["exercises"])
+    assert (squat["sets"], squat["repetitions"], squat["weights"]) == (5, 6, 108.75)
+    assert (run["repetitions"], run["weights"], run["duration"]) == (None, None, 25.0)
+    stored = client.get(f"/workouts/{workout['id']}")
+    assert by_sets(stored.json["exercises"]) == [run, squat]
+    assert b'"duration":25.0' in response.data and b'"duration":25.0' in stored.data
+    assert check(db.session) == []
+    changed = {c["id"] for c in client.get("/changes").json["changes"]}
+    assert {workout["id"], run["id"], squat["id"]} <= changed
+
+
+def test_repeat_clones_the_latest_workout(client, seed_history):
+    """Test repeating copies the user's most recent workout as it was"""
+    user_id = seed_history()
+    response = client.post(f"/users/{user_id}/workouts/repeat")
+    assert response.status_code == 201
+    exercises = by_sets(response.json["workout"]["exercises"])
+    assert [(e["sets"], e["weights"]) for e in exercises] == [(1, None), (5, 105.0)]
+    assert Workout.query.count() == 4
+
+    bad = {"overload": {"weights_percent": "more"}}
+    response = client.post(f"/users/{user_id}/workouts/repeat", json=bad)
+    assert response.status_code == 400
+    assert response.json["message"] == "overload weights_percent must be a number"
+    other = User(username="other", name="Other", email="other@example.com")
+    db.session.add(other)
+    db.session.commit()
+    assert client.post(f"/users/{other.id}/workouts/repeat").status_code == 404
+
+
+def test_templates_start_workouts(client, seed_history):
+    """Test templates made from a list or a workout start new workouts"""
+    user_id = seed_history()
+    workout_id = workout_ids()[1]
+    squat_id = str(db.session.scalar(select(Exercise.id).filter_by(name="Squat")))
+    exercises = [{"exercise_id": squat_id, "sets": 5, "repetitions": 5, "weights": 60}]
+    response = client.post(
+        "/templates",
+        json={"user_id": user_id, "name": "Legs", "exercises": exercises},
+    )
+    assert response.status_code == 201
+    legs = response.json["template"]
+    response = client.post(
+        "/templates",
+        json={"user_id": user_id, "name": "Cardio", "workout_id": workout_id},
+    )
+    assert response.status_code == 201
+    listed = client.get(f"/templates?user={user_id}").json
+    assert [t["name"] for t in listed] == ["Cardio", "Legs"]
+    assert {e["duration"] for e in listed[0]["exercises"]} == {None, 20}
+
+    body = {"overload": {"weights_percent": 2.5, "sets": -1}}
+    response = client.post(f"/templates/{legs['id']}/workouts", json=body)
+    assert response.status_code == 201
+    [exercise] = response.json["workout"]["exercises"]
+    assert (exercise["sets"], exercise["weights"]) == (4, 61.5)
+    assert check(db.session) == []
+
+    body = {"overload": {"sets": -10, "repetitions": -20}}
+    response = client.post(f"/templates/{legs['id']}/workouts", json=body)
+    [exercise] = response.json["workout"]["exercises"]
+    assert (exercise["sets"], exercise["repetitions"]) == (1, 0)
+
+    unknown = [{"exercise_id": workout_id, "sets": 1}]
+    response = client.post(
+        "/templates", json={"user_id": user_id, "name": "X", "exercises": unknown}
+    )
+    assert response.status_code == 404
+    assert client.delete(f"/templates/{legs['id']}").status_code == 200
+    assert client.get(f"/templates/{legs['id']}").status_code == 404
@@ -0,0 +1,95 @@
+from models import Exercise, User, Workout, db
+
+
+def create_user():
+    user = User(username="testuser", name="Test User", email="test@example.com")
+    db.session.add(user)
+    db.session.commit()
+    return str(user.id)
+
+
+def test_unchanged_users_answer_304(client):
+    """Test If-None-Match on the user list before and after an update"""
+    user_id = create_user()
+
+    response = client.get("/users")
+    etag = response.headers["ETag"]
+    assert "Last-Modified" not in response.headers
+
+    response = client.get("/users", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+
+    client.put(f"/users/{user_id}", json={"name": "Renamed"})
+    response = client.get("/users", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_if_modified_since(client):
+    """Test If-Modified-Since against the newest updated_at of a workout"""
+    user = User(username="testuser", name="Test User", email="test@example.com")
+    workout = Workout(user=user)
+    db.session.add_all([user, workout])
+    db.session.commit()
+
+    last_modified = client.get(f"/workouts/{workout.id}").headers["Last-Modified"]
+    response = client.get(
+        f"/workouts/{workout.id}", headers={"If-Modified-Since": last_modified}
+    )
+    assert response.status_code == 304
+
+
+def test_if_modified_since_after_delete(client):
+    """Test that a collection never answers 304 to If-Modified-Since alone"""
+    client.post("/exercises", json={"name": "Squat", "category": "Strength"})
+    client.post("/exercises", json={"name": "Run", "category": "Cardio"})
+    exercises = client.get("/exercises").json
+
+    client.delete(f"/exercises/{exercises[0]['id']}")
+    response = client.get(
+        "/exercises", headers={"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"}
+    )
+    assert response.status_code == 200
+    assert [exercise["id"] for exercise in response.json] == [exercises[1]["id"]]
+
+
+def test_workout_etag_follows_its_exercises(client):
+    """Test that adding an exercise to a workout changes the workout's ETag"""
+    user = User(username="testuser", name="Test User", email="test@example.com")
+    workout = Workout(user=user)
+    exercise = Exercise(name="Squat", category="Strength")
+    db.session.add_all([user, workout, exercise])
+    db.session.commit()
+    workout_id, exercise_id = str(workout.id), str(exercise.id)
+
+    etag = client.get(f"/workouts/{workout_id}").headers["ETag"]
+    page_etag = client.get("/workouts").headers["ETag"]
+    assert client.get("/workouts?limit=1").headers["ETag"] != page_etag
+
+    client.post(
+        "/workouts_exercises/batch",
+        json={
+            "workout_exercises": [
+                {"workout_id": workout_id, "exercise_id": exercise_id, "sets": 3}
+            ]
+        },
+    )
+    response = client.get(f"/workouts/{workout_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert len(response.json["exercises"]) == 1
+    response = client.get("/workouts", headers={"If-None-Match": page_etag})
+    assert response.status_code == 200
+
+
+def test_exercise_delete_changes_etag(client):
+    """Test that a deleted exercise invalidates the exercise list validators"""
+    client.post("/exercises", json={"name": "Squat", "category": "Strength"})
+    client.post("/exercises", json={"name": "Run", "category": "Cardio"})
+    response = client.get("/exercises")
+    etag = response.headers["ETag"]
+
+    client.delete(f"/exercises/{response.json[0]['id']}")
+    response = client.get("/exercises", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert len(response.json) == 1
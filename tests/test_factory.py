@@ -0,0 +1,36 @@
+from sqlalchemy import event, inspect
+
+from app import create_app
+from models import db
+
+
+def test_create_app_does_not_connect():
+    """Test the factory builds an app without reaching the database"""
+    app = create_app(
+        {
+            "SQLALCHEMY_DATABASE_URI": "postgresql+psycopg2://nobody@192.0.2.1:1/none",
+            "SQLALCHEMY_ENGINE_OPTIONS": {},
+        }
+    )
+    with app.app_context():
+        assert not db.engine.pool.checkedout()
+        assert db.engine.pool.checkedin() == 0
+
+
+def test_init_db_command(tmp_path):
+    """Test `flask init-db` creates the schema"""
+    app = create_app(
+        {
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'init.db'}",
+            "SQLALCHEMY_ENGINE_OPTIONS": {},
+        }
+    )
+    connections = []
+    with app.app_context():
+        event.listen(db.engine, "connect", lambda *args: connections.append(args))
+    assert connections == []
+
+    result = app.test_cli_runner().invoke(args=["init-db"])
+    assert result.exit_code == 0
+    with app.app_context():
+        assert "workouts" in inspect(db.engine).get_table_names()
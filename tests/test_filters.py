@@ -0,0 +1,66 @@
+from datetime import datetime
+
+from sqlalchemy import inspect
+
+from models import Exercise, User, Workout, db
+
+
+def test_exercises_filtered_and_sorted(client):
+    """Test filtering exercises by category and creator and sorting them"""
+    user = User(username="testuser", name="Test User", email="test@example.com")
+    db.session.add_all(
+        [
+            Exercise(name="Bench press", category="Strength"),
+            Exercise(name="Squat", category="Strength", custom_made=True, creator=user),
+            Exercise(name="Run", category="Cardio"),
+        ]
+    )
+    db.session.commit()
+
+    response = client.get("/exercises?category=Strength&sort=-name")
+    assert [e["name"] for e in response.json] == ["Squat", "Bench press"]
+
+    response = client.get(f"/exercises?created_by={user.id}")
+    assert [e["name"] for e in response.json] == ["Squat"]
+
+    assert client.get("/exercises?sort=description").status_code == 400
+    assert client.get("/exercises?created_by=nobody").status_code == 400
+
+
+def test_workouts_filtered_by_user_and_date(client):
+    """Test narrowing workouts to one user and a date range, newest first"""
+    alice = User(username="alice", name="Alice", email="alice@example.com")
+    bob = User(username="bob", name="Bob", email="bob@example.com")
+    for day in (1, 2, 3, 4):
+        db.session.add(Workout(user=alice, created_at=datetime(2024, 3, day, 18)))
+    db.session.add(Workout(user=bob, created_at=datetime(2024, 3, 2, 18)))
+    db.session.commit()
+
+    response = client.get(
+        f"/workouts?user={alice.id}&from=2024-03-02&to=2024-03-03&sort=-created_at"
+    )
+    assert response.status_code == 200
+    dates = [w["created_at"][:10] for w in response.json["workouts"]]
+    assert dates == ["2024-03-03", "2024-03-02"]
+
+    response = client.get(f"/workouts?user={alice.id}&sort=-created_at&limit=3")
+    cursor = response.json["next_cursor"]
+    response = client.get(f"/workouts?user={alice.id}&sort=-created_at&after={cursor}")
+    assert [w["created_at"][:10] for w in response.json["workouts"]] == ["2024-03-01"]
+
+    assert client.get("/workouts?from=yesterday").status_code == 400
+
+
+def test_filter_columns_are_indexed(client):
+    """Test that the filtered columns are backed by database indexes"""
+    inspector = inspect(db.engine)
+    indexed = {
+        table: [index["column_names"] for index in inspector.get_indexes(table)]
+        for table in ("exercises", "workouts", "workout_exercises")
+    }
+    assert ["category_id"] in indexed["exercises"]
+    assert ["created_by"] in indexed["exercises"]
+    assert ["user_workout_id", "created_at"] in indexed["workouts"]
+    assert ["created_at", "id"] in indexed["workouts"]
+    assert ["workout_id"] in indexed["workout_exercises"]
+    assert ["exercise_id"] in indexed["workout_exercises"]
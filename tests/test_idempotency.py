@@ -0,0 +1,149 @@
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+
+import idempotency
+from idempotency import purge
+from models import (
+    Exercise,
+    IdempotencyKey,
+    User,
+    UserVolume,
+    Workout,
+    WorkoutExercise,
+    db,
+)
+
+
+def test_retries_replay_the_first_response(client):
+    """Test a repeated Idempotency-Key returns the stored response without writing"""
+    user = {"username": "retry", "name": "Retry", "email": "retry@example.com"}
+    headers = {"Idempotency-Key": "user-1"}
+    first = client.post("/users", json=user, headers=headers)
+    again = client.post("/users", json=user, headers=headers)
+    assert first.status_code == again.status_code == 201
+    assert again.data == first.data
+    assert again.headers["Idempotent-Replayed"] == "true"
+    assert User.query.count() == 1
+
+    other = dict(user, username="other")
+    assert client.post("/users", json=other, headers=headers).status_code == 422
+
+
+def test_keys_are_scoped_by_client(client):
+    """Test that clients sending the same key do not replay each other's responses"""
+    exercise = {"name": "Squat", "category": "Strength"}
+    for api_key in ("client-a", "client-b", "client-a"):
+        headers = {"Idempotency-Key": "exercise-1", "X-API-Key": api_key}
+        response = client.post("/exercises", json=exercise, headers=headers)
+        assert response.status_code == 201
+    assert Exercise.query.count() == 2
+    assert IdempotencyKey.query.count() == 2
+
+
+def test_changes_commit_with_the_response(client, monkeypatch):
+    """Test that a crash before the response is stored leaves nothing behind"""
+
+    def crash(*args):
+        raise RuntimeError("worker killed")
+
+    monkeypatch.setattr(idempotency, "store", crash)
+    user = {"username": "retry", "name": "Retry", "email": "retry@example.com"}
+    headers = {"Idempotency-Key": "user-1"}
+    with pytest.raises(RuntimeError):
+        client.post("/users", json=user, headers=headers)
+    db.session.rollback()
+    assert User.query.count() == 0
+    assert IdempotencyKey.query.count() == 0
+
+    monkeypatch.undo()
+    assert client.post("/users", json=user, headers=headers).status_code == 201
+    assert client.post("/users", json=user, headers=headers).status_code == 201
+    assert User.query.count() == 1
+
+
+def test_rejections_are_stored_and_keys_expire(client):
+    """Test client errors are replayed too and old keys are purged"""
+    headers = {"Idempotency-Key": "workout-1"}
+    body = {"user_workout_id": str(uuid4())}
+    assert client.post("/workouts", json=body, headers=headers).status_code == 404
+    replayed = client.post("/workouts", json=body, headers=headers)
+    assert replayed.status_code == 404
+    assert replayed.headers["Idempotent-Replayed"] == "true"
+
+    assert purge(datetime.utcnow() - timedelta(hours=1)) == 0
+    assert purge(datetime.utcnow() + timedelta(seconds=1)) == 1
+    assert IdempotencyKey.query.count() == 0
+
+
+def test_sync_applies_operations_once(client, count_queries, seed_empty_workout):
+    """Test a sync writes each table with one statement and is safe to retry"""
+    user_id, workout_id, squat_id, run_id = seed_empty_workout()
+    offline_id = str(uuid4())
+    operations = [
+        {
+            "op": "create_workout",
+            "data": {
+                "id": offline_id,
+                "user_workout_id": user_id,
+                "created_at": "2024-03-01T18:00:00+01:00",
+                "exercises": [{"exercise_id": squat_id, "sets": 3, "repetitions": 5}],
+            },
+        },
+        {
+            "op": "add_workout_exercise",
+            "data": {"workout_id": offline_id, "exercise_id": run_id, "sets": 1},
+        },
+        {
+            "op": "add_workout_exercise",
+            "data": {"workout_id": workout_id, "exercise_id": run_id, "sets": 2},
+        },
+    ]
+    headers = {"Idempotency-Key": "sync-1"}
+    with count_queries() as statements:
+        response = client.post(
+            "/sync", json={"operations": operations}, headers=headers
+        )
+    assert response.status_code == 201
+    results = response.json["results"]
+    assert [result["status"] for result in results] == [201] * 3
+    assert results[0]["workout"]["created_at"] == "2024-03-01T17:00:00"
+    assert len(results[0]["workout"]["exercises"]) == 1
+    inserts = [s for s in statements if s.startswith("INSERT INTO workout")]
+    assert len(inserts) == 2
+
+    retry = client.post("/sync", json={"operations": operations}, headers=headers)
+    assert retry.data == response.data
+    assert Workout.query.count() == 2
+    assert WorkoutExercise.query.count() == 3
+    monthly = UserVolume.query.filter_by(bucket="month").all()
+    assert sorted(row.workouts for row in monthly) == [1, 1]
+
+
+def test_sync_is_atomic(client, seed_empty_workout):
+    """Test one invalid operation rejects the whole sync, which needs a key"""
+    user_id, _, squat_id, _ = seed_empty_workout()
+    operations = [
+        {"op": "create_workout", "data": {"user_workout_id": user_id}},
+        {
+            "op": "add_workout_exercise",
+            "data": {"workout_id": str(uuid4()), "exercise_id": squat_id, "sets": 1},
+        },
+        {"op": "delete_everything", "data": {}},
+    ]
+    headers = {"Idempotency-Key": "sync-2"}
+    response = client.post("/sync", json={"operations": operations}, headers=headers)
+    assert response.status_code == 400
+    assert [result["status"] for result in response.json["results"]] == [424, 424, 400]
+    assert Workout.query.count() == 1
+
+    operations = operations[:2]
+    headers = {"Idempotency-Key": "sync-3"}
+    response = client.post("/sync", json={"operations": operations}, headers=headers)
+    assert response.status_code == 404
+    assert [result["status"] for result in response.json["results"]] == [424, 404]
+    assert Workout.query.count() == 1
+
+    response = client.post("/sync", json={"operations": operations})
+    assert response.status_code == 400
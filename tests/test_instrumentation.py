@@ -0,0 +1,71 @@
+import logging
+
+import pytest
+
+from app import create_app
+from models import db
+
+
+@pytest.fixture
+def instrumented_client():
+    app = create_app(
+        {
+            "TESTING": True,
+            "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+            "SQLALCHEMY_ENGINE_OPTIONS": {},
+            "INSTRUMENTATION": True,
+        }
+    )
+    with app.app_context():
+        db.create_all()
+        yield app.test_client()
+        db.session.remove()
+        db.drop_all()
+
+
+def test_server_timing_header(instrumented_client):
+    """Test responses report SQL, serialization and total time"""
+    response = instrumented_client.get("/users")
+    assert response.status_code == 200
+    timing = response.headers["Server-Timing"]
+    assert "db;dur=" in timing and 'desc="2 statements"' in timing
+    assert "serialize;dur=" in timing and "total;dur=" in timing
+
+
+def test_metrics_histograms(instrumented_client):
+    """Test /metrics exposes per-endpoint histograms"""
+    instrumented_client.get("/users")
+    instrumented_client.get("/users")
+
+    metrics = instrumented_client.get("/metrics").get_data(as_text=True)
+    labels = 'endpoint="api.get_users",method="GET"'
+    assert f"fitapp_request_duration_seconds_count{{{labels}}} " in metrics
+    assert f'fitapp_request_sql_statements_bucket{{{labels},le="+Inf"}}' in metrics
+
+
+def test_slow_request_log(instrumented_client, caplog):
+    """Test requests over SLOW_REQUEST_MS are logged with their SQL"""
+    instrumented_client.application.config["SLOW_REQUEST_MS"] = 0
+    with caplog.at_level(logging.WARNING, logger="fitapp.slow"):
+        instrumented_client.get("/users")
+    assert "slow request GET /users" in caplog.text
+    assert "FROM users" in caplog.text
+
+
+def test_failed_statements_are_timed(instrumented_client, caplog):
+    """Test a statement raising an error is timed like the others"""
+    user = {"username": "alice", "name": "Alice", "email": "alice@example.com"}
+    instrumented_client.post("/users", json=user)
+    instrumented_client.application.config["SLOW_REQUEST_MS"] = 0
+    with caplog.at_level(logging.WARNING, logger="fitapp.slow"):
+        response = instrumented_client.post("/users", json=user)
+    assert response.status_code == 500
+    assert 'desc="1 statements"' in response.headers["Server-Timing"]
+    assert "INSERT INTO users" in caplog.text
+
+
+def test_disabled_by_default(client):
+    """Test nothing is recorded or exposed unless enabled"""
+    response = client.get("/users")
+    assert "Server-Timing" not in response.headers
+    assert client.get("/metrics").status_code == 404
@@ -0,0 +1,130 @@
+from datetime import datetime, timedelta
+
+import pytest
+from flask import current_app
+
+import jobs
+from jobs import claim, fail_abandoned, run
+from models import (
+    Exercise,
+    Job,
+    TemplateExercise,
+    User,
+    Workout,
+    WorkoutExercise,
+    WorkoutTemplate,
+    db,
+)
+from summary import check
+
+
+@pytest.fixture
+def exports(client, tmp_path, monkeypatch):
+    monkeypatch.setitem(current_app.config, "JOBS_EXPORT_DIR", str(tmp_path))
+    return tmp_path
+
+
+def test_deleting_a_user_runs_a_job(client, seed_workouts):
+    """Test DELETE /users/<id> queues a job removing the user and their workouts"""
+    seed_workouts(3)
+    user = User.query.one()
+    user_id = user.id
+    pistol = Exercise(
+        name="Pistol", category="Strength", custom_made=True, creator=user
+    )
+    db.session.add(pistol)
+    db.session.flush()
+    template = WorkoutTemplate(user=user, name="Legs")
+    template.exercises.append(TemplateExercise(exercise_id=pistol.id, sets=3))
+    db.session.add(template)
+    db.session.commit()
+
+    response = client.delete(f"/users/{user_id}")
+    assert response.status_code == 202
+    assert response.headers["Location"] == f"/jobs/{response.json['id']}"
+    job = client.get(response.headers["Location"]).json
+    assert job["status"] == "succeeded"
+    assert job["result"] == {"workouts": 3, "workout_exercises": 6}
+
+    db.session.expunge_all()
+    assert db.session.get(User, user_id) is None
+    assert Workout.query.count() == WorkoutExercise.query.count() == 0
+    assert WorkoutTemplate.query.count() == TemplateExercise.query.count() == 0
+    assert Exercise.query.filter_by(name="Pistol").one().created_by is None
+    assert check(db.session) == []
+    deleted = {
+        change["entity"]
+        for change in client.get("/changes").json["changes"]
+        if change["deleted"]
+    }
+    assert deleted == {"user", "workout", "workout_exercise"}
+
+
+def test_large_workouts_are_deleted_in_chunks(client, seed_workouts, monkeypatch):
+    """Test workouts above JOBS_INLINE_ROWS exercises are deleted by a job"""
+    monkeypatch.setitem(current_app.config, "JOBS_INLINE_ROWS", 4)
+    monkeypatch.setattr(jobs, "CHUNK", 2)
+    seed_workouts(2, exercises_per_workout=5)
+    small, large = Workout.query.order_by(Workout.created_at).all()
+    small.workout_exercises = small.workout_exercises[:4]
+    db.session.commit()
+
+    assert client.delete(f"/workouts/{small.id}").status_code == 200
+    response = client.delete(f"/workouts/{large.id}")
+    assert response.status_code == 202
+    job = client.get(f"/jobs/{response.json['id']}").json
+    assert (job["status"], job["progress"]) == ("succeeded", 5)
+    assert job["result"] == {"workout_exercises": 5}
+    assert Workout.query.count() == WorkoutExercise.query.count() == 0
+    assert check(db.session) == []
+
+
+def test_export_downloads_the_workouts(client, seed_workouts, exports):
+    """Test an export job writes the user's workouts as GET /workouts lists them"""
+    seed_workouts(3)
+    user_id = User.query.one().id
+    response = client.post(f"/users/{user_id}/export")
+    assert response.status_code == 202
+    download = client.get(f"/jobs/{response.json['id']}/download")
+    assert download.status_code == 200
+    assert download.mimetype == "application/x-ndjson"
+    streamed = client.get(
+        f"/workouts?user={user_id}", headers={"Accept": "application/x-ndjson"}
+    )
+    assert download.data == streamed.data
+    assert client.get(f"/jobs/{response.json['id']}/download").status_code == 200
+
+
+def test_jobs_are_claimed_once_and_taken_over_after_the_lease(client):
+    """Test a running job is only claimed again once its lease expired"""
+    job = Job(kind="rebuild_summary", params={})
+    db.session.add(job)
+    db.session.commit()
+
+    assert claim(db.session, "a") == job.id
+    assert claim(db.session, "b") is None
+    job.locked_until = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    assert claim(db.session, "b") == job.id
+    assert (job.worker, job.attempts) == ("b", 2)
+
+    job.attempts = jobs.MAX_ATTEMPTS
+    job.locked_until = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    assert claim(db.session, "c") is None
+    fail_abandoned(db.session)
+    assert (job.status, job.error) == ("failed", "worker lost")
+
+
+def test_failed_attempts_are_retried(client):
+    """Test a failing job is queued again until it ran MAX_ATTEMPTS times"""
+    job = Job(kind="rebuild_summary", params={"unexpected": 1})
+    db.session.add(job)
+    db.session.commit()
+    for attempt in range(1, jobs.MAX_ATTEMPTS + 1):
+        assert claim(db.session, "a") == job.id
+        run(db.session, job.id)
+        assert job.attempts == attempt
+    assert job.status == "failed"
+    assert "unexpected" in job.error
+    assert claim(db.session, "a") is None
@@ -0,0 +1,39 @@
+def test_workouts_pages_follow_cursor(client, seed_workouts):
+    """Test walking every page of workouts with the returned cursor"""
+    seed_workouts(5)
+
+    response = client.get("/workouts?limit=2")
+    assert response.status_code == 200
+    seen = [workout["id"] for workout in response.json["workouts"]]
+    while response.json["next_cursor"]:
+        response = client.get(f"/workouts?limit=2&after={response.json['next_cursor']}")
+        assert response.status_code == 200
+        seen += [workout["id"] for workout in response.json["workouts"]]
+
+    assert len(seen) == len(set(seen)) == 5
+    assert response.json["next_cursor"] is None
+
+
+def test_workouts_query_count_independent_of_page_size(
+    client, seed_workouts, count_queries
+):
+    """Test that eager loading keeps the number of queries fixed per page"""
+    seed_workouts(10)
+
+    counts = []
+    for limit in (1, 5, 10):
+        with count_queries() as statements:
+            response = client.get(f"/workouts?limit={limit}")
+        assert response.status_code == 200
+        assert len(response.json["workouts"]) == limit
+        assert all(len(w["exercises"]) == 2 for w in response.json["workouts"])
+        counts.append(len(statements))
+
+    assert len(set(counts)) == 1
+
+
+def test_workouts_invalid_pagination(client):
+    """Test that bad limit and cursor values are rejected"""
+    assert client.get("/workouts?limit=0").status_code == 400
+    assert client.get("/workouts?limit=abc").status_code == 400
+    assert client.get("/workouts?after=not-a-cursor").status_code == 400
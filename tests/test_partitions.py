@@ -0,0 +1,154 @@
+from datetime import date, datetime
+from threading import Thread
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import insert, select, text
+from sqlalchemy.orm import Session
+
+from batch import lock_workout_ids
+from models import User, Workout, WorkoutExercise, db
+from partitions import (
+    add_months,
+    create_partitions,
+    detach_partitions,
+    is_partitioned,
+    months,
+)
+
+
+def test_months():
+    assert add_months(date(2024, 11, 1), 3) == date(2025, 2, 1)
+    assert add_months(date(2024, 1, 1), -1) == date(2023, 12, 1)
+    assert list(months(datetime(2024, 11, 20), date(2025, 2, 1))) == [
+        date(2024, 11, 1),
+        date(2024, 12, 1),
+        date(2025, 1, 1),
+    ]
+
+
+def test_workout_exercises_copy_the_workout_date(client, seed_empty_workout):
+    """Test every write path stores the creation time of the workout on its rows"""
+    user_id, workout_id, squat_id, run_id = seed_empty_workout()
+    client.post(
+        "/workouts",
+        json={
+            "user_workout_id": user_id,
+            "exercises": [{"exercise_id": squat_id, "sets": 1}],
+        },
+    )
+    client.post(
+        "/workouts_exercises",
+        json={"workout_id": workout_id, "exercise_id": run_id, "sets": 1},
+    )
+    client.post(
+        "/workouts_exercises/batch",
+        json={
+            "workout_exercises": [
+                {"workout_id": workout_id, "exercise_id": squat_id, "sets": 2}
+            ]
+        },
+    )
+    operations = [
+        {
+            "op": "create_workout",
+            "data": {
+                "user_workout_id": user_id,
+                "created_at": "2023-05-04T10:00:00",
+                "exercises": [{"exercise_id": run_id, "sets": 1}],
+            },
+        }
+    ]
+    headers = {"Idempotency-Key": "partitions-1"}
+    client.post("/sync", json={"operations": operations}, headers=headers)
+
+    rows = db.session.execute(
+        select(WorkoutExercise.workout_created_at, Workout.created_at).join(
+            Workout, Workout.id == WorkoutExercise.workout_id
+        )
+    ).all()
+    assert len(rows) == 4
+    assert all(copied == created for copied, created in rows)
+
+
+def test_old_months_are_split_out_and_detached(client, seed_empty_workout):
+    """Test rows move from the default partition to their month and leave with it"""
+    if not is_partitioned(db.session.connection()):
+        pytest.skip("partitioning needs PostgreSQL")
+    user_id, _, squat_id, _ = seed_empty_workout()
+    operations = [
+        {
+            "op": "create_workout",
+            "data": {
+                "user_workout_id": user_id,
+                "created_at": f"2023-05-{day:02}T18:00:00",
+                "exercises": [{"exercise_id": squat_id, "sets": 3}],
+            },
+        }
+        for day in (1, 31)
+    ]
+    headers = {"Idempotency-Key": "partitions-2"}
+    client.post("/sync", json={"operations": operations}, headers=headers)
+    default = text("SELECT count(*) FROM workout_exercises_default")
+    assert db.session.scalar(default) == 2
+
+    created = create_partitions(
+        db.session.connection(), date(2023, 4, 1), date(2023, 6, 1)
+    )
+    db.session.commit()
+    assert created == [date(2023, 4, 1), date(2023, 5, 1)]
+    assert db.session.scalar(default) == 0
+    moved = text("SELECT count(*) FROM workout_exercises_p2023_05")
+    assert db.session.scalar(moved) == 2
+    response = client.get(f"/workouts?user={user_id}&from=2023-05-01&to=2023-05-31")
+    assert [len(w["exercises"]) for w in response.json["workouts"]] == [1, 1]
+
+    detached = detach_partitions(db.session.connection(), date(2023, 6, 1), drop=True)
+    db.session.commit()
+    assert detached == [date(2023, 4, 1), date(2023, 5, 1)]
+    assert Workout.query.count() == 1
+    assert db.session.get(User, user_id) is not None
+
+
+def test_concurrent_syncs_cannot_reuse_a_workout_id(client, seed_empty_workout):
+    """Test a sync waits for a transaction inserting the same workout ID"""
+    if not is_partitioned(db.session.connection()):
+        pytest.skip("partitioning needs PostgreSQL")
+    user_id, _, _, _ = seed_empty_workout()
+    workout_id = uuid4()
+    operations = [
+        {
+            "op": "create_workout",
+            "data": {
+                "id": str(workout_id),
+                "user_workout_id": user_id,
+                "created_at": "2023-05-04T10:00:00",
+            },
+        }
+    ]
+    headers = {"Idempotency-Key": "partitions-3"}
+    responses = []
+    sync = Thread(
+        target=lambda: responses.append(
+            client.post("/sync", json={"operations": operations}, headers=headers)
+        )
+    )
+    with Session(db.engine) as other:
+        lock_workout_ids(other, [workout_id])
+        now = datetime.utcnow()
+        other.execute(
+            insert(Workout.__table__),
+            {
+                "id": workout_id,
+                "user_workout_id": user_id,
+                "created_at": now,
+                "updated_at": now,
+            },
+        )
+        sync.start()
+        sync.join(timeout=1)
+        assert sync.is_alive()
+        other.commit()
+    sync.join()
+    assert responses[0].status_code == 409
+    assert Workout.query.filter_by(id=workout_id).count() == 1
@@ -0,0 +1,90 @@
+import pytest
+
+from app import create_app
+from models import db
+from ratelimit import MemoryBuckets
+
+
+@pytest.fixture
+def limited_app():
+    app = create_app(
+        {
+            "TESTING": True,
+            "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+            "SQLALCHEMY_ENGINE_OPTIONS": {},
+            "RATELIMIT_ENABLED": True,
+            "RATELIMIT_RATE": 0.01,
+            "RATELIMIT_BURST": 10,
+            "RATELIMIT_MAX_CONCURRENT": 2,
+        }
+    )
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+def test_buckets_refill():
+    """Test tokens are taken until the bucket is empty and the wait is reported"""
+    buckets = MemoryBuckets(maxsize=1)
+    assert buckets.take("a", 4, rate=2, burst=5) == 0
+    assert buckets.take("a", 4, rate=2, burst=5) == pytest.approx(1.5, abs=0.01)
+    # Evicted keys start again with a full bucket
+    assert buckets.take("b", 5, rate=2, burst=5) == 0
+    assert buckets.take("a", 5, rate=2, burst=5) == 0
+
+
+def test_list_endpoints_cost_more(limited_app):
+    """Test lists exhaust the budget faster than single-row requests"""
+    client = limited_app.test_client()
+    assert client.get("/users").status_code == 200
+    assert client.get("/users").status_code == 200
+    limited = client.get("/users")
+    assert limited.status_code == 429
+    assert limited.json == {"message": "rate limit exceeded"}
+    assert int(limited.headers["Retry-After"]) >= 1
+    # Free endpoints and other clients are not affected
+    assert client.get("/").status_code == 200
+    assert client.get("/users", headers={"X-API-Key": "other"}).status_code == 200
+
+    # Single-row requests cost a token each
+    environ = {"REMOTE_ADDR": "10.0.0.2"}
+    for _ in range(10):
+        assert client.get("/cache/stats", environ_base=environ).status_code == 200
+    assert client.get("/cache/stats", environ_base=environ).status_code == 429
+
+
+def test_concurrency_cap_sheds_load(limited_app):
+    """Test requests over the concurrency cap get an immediate 503 costing no tokens"""
+    limits = limited_app.extensions["rate_limiter"]
+    client = limited_app.test_client()
+    assert limits.slots.acquire(blocking=False)
+    assert limits.slots.acquire(blocking=False)
+    try:
+        for _ in range(6):
+            busy = client.get("/exercises")
+            assert busy.status_code == 503
+            assert busy.headers["Retry-After"] == "1"
+    finally:
+        limits.release()
+        limits.release()
+    # Slots held by finished or rate-limited requests are given back
+    for _ in range(5):
+        assert client.get("/exercises").status_code == 200
+    assert client.get("/exercises").status_code == 429
+    assert limits.slots.acquire(blocking=False)
+    assert limits.slots.acquire(blocking=False)
+    limits.release()
+    limits.release()
+
+
+def test_disabled():
+    """Test limits are only registered when RATELIMIT_ENABLED is set"""
+    app = create_app(
+        {
+            "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+            "SQLALCHEMY_ENGINE_OPTIONS": {},
+        }
+    )
+    assert "rate_limiter" not in app.extensions
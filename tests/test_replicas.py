@@ -0,0 +1,81 @@
+import pytest
+
+from app import create_app
+from models import User, db
+from replicas import PIN_COOKIE
+
+
+@pytest.fixture
+def replicated(tmp_path):
+    """Returns a helper creating an app on SQLite files standing in for replicas"""
+    contexts = []
+
+    def create(*replicas):
+        binds = {
+            f"replica_{i}": f"sqlite:///{path}" for i, path in enumerate(replicas, 1)
+        }
+        app = create_app(
+            {
+                "TESTING": True,
+                "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'primary.db'}",
+                "SQLALCHEMY_ENGINE_OPTIONS": {},
+                "SQLALCHEMY_BINDS": binds,
+                "RATELIMIT_ENABLED": False,
+            }
+        )
+        context = app.app_context()
+        context.push()
+        contexts.append(context)
+        db.create_all()
+        for key, path in zip(binds, replicas):
+            if path.parent.exists():
+                db.metadata.create_all(db.engines[key])
+                with db.engines[key].begin() as conn:
+                    conn.execute(
+                        User.__table__.insert().values(
+                            username=key, name=key, email=f"{key}@example.com"
+                        )
+                    )
+        return app.test_client()
+
+    yield create
+    for context in reversed(contexts):
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+        context.pop()
+
+
+def usernames(client):
+    return [user["username"] for user in client.get("/users").json]
+
+
+def test_reads_rotate_over_replicas_until_the_client_writes(replicated, tmp_path):
+    """Test GETs alternate between replicas, and a write pins reads to the primary"""
+    client = replicated(tmp_path / "one.db", tmp_path / "two.db")
+    assert [usernames(client) for _ in range(3)] == [
+        ["replica_1"],
+        ["replica_2"],
+        ["replica_1"],
+    ]
+
+    user = {"username": "alice", "name": "Alice", "email": "alice@example.com"}
+    response = client.post("/users", json=user)
+    assert response.status_code == 201
+    assert PIN_COOKIE in response.headers["Set-Cookie"]
+    assert usernames(client) == ["alice"]
+
+    client.delete_cookie(PIN_COOKIE)
+    assert usernames(client) == ["replica_2"]
+    assert client.get("/users/nobody").status_code == 404
+    assert client.get_cookie(PIN_COOKIE) is None
+
+
+def test_unhealthy_replicas_are_skipped(replicated, tmp_path):
+    """Test reads avoid replicas failing their health check, down to the primary"""
+    missing = tmp_path / "missing" / "replica.db"
+    client = replicated(missing, tmp_path / "two.db")
+    assert [usernames(client) for _ in range(3)] == [["replica_2"]] * 3
+
+    client = replicated(missing)
+    assert usernames(client) == []
@@ -0,0 +1,70 @@
+import pytest
+
+from models import TRIGRAMS_INSTALLED, Exercise, db
+
+
+@pytest.fixture
+def catalogue(client):
+    db.session.add_all(
+        [
+            Exercise(name="Bench press", category="Strength"),
+            Exercise(name="Incline bench press", category="Strength"),
+            Exercise(
+                name="Push-up",
+                category="Strength",
+                description="Like a bench press on the floor",
+            ),
+            Exercise(name="Rowing", category="Cardio", description="Indoor rower"),
+        ]
+    )
+    db.session.commit()
+    return client
+
+
+def names(response):
+    return [exercise["name"] for exercise in response.json["exercises"]]
+
+
+def test_search_ranks_prefix_matches(catalogue):
+    """Test every word matches as a prefix and names rank above descriptions"""
+    response = catalogue.get("/exercises/search?q=Bench+pr")
+    assert response.status_code == 200
+    found = names(response)
+    assert sorted(found[:2]) == ["Bench press", "Incline bench press"]
+    assert found[2:] == ["Push-up"]
+
+    assert names(catalogue.get("/exercises/search?q=cardio")) == ["Rowing"]
+    assert names(catalogue.get("/exercises/search?q=row&category=Strength")) == []
+    assert names(catalogue.get("/exercises/search?q=bench+row")) == []
+
+
+def test_search_tolerates_typos(catalogue):
+    """Test names are matched by similarity when no word matches as a prefix"""
+    if db.engine.dialect.name == "postgresql":
+        if not db.session.scalar(TRIGRAMS_INSTALLED):
+            pytest.skip("pg_trgm is not installed")
+    found = names(catalogue.get("/exercises/search?q=benhc"))
+    assert sorted(found) == ["Bench press", "Incline bench press"]
+
+
+def test_search_pages(catalogue):
+    """Test following the cursor returns every match once"""
+    seen = []
+    response = catalogue.get("/exercises/search?q=press&limit=1")
+    while True:
+        seen += names(response)
+        cursor = response.json["next_cursor"]
+        if cursor is None:
+            break
+        response = catalogue.get(f"/exercises/search?q=press&limit=1&after={cursor}")
+    assert sorted(seen) == ["Bench press", "Incline bench press", "Push-up"]
+
+
+def test_search_sees_writes_and_rejects_bad_requests(catalogue):
+    catalogue.get("/exercises/search?q=squat")
+    catalogue.post("/exercises", json={"name": "Front squat", "category": "Strength"})
+    assert names(catalogue.get("/exercises/search?q=squat")) == ["Front squat"]
+
+    assert catalogue.get("/exercises/search").status_code == 400
+    assert catalogue.get("/exercises/search?q=-").status_code == 400
+    assert catalogue.get("/exercises/search?q=row&after=junk").status_code == 400
@@ -0,0 +1,60 @@
+from flask.json.provider import DefaultJSONProvider
+
+import serialization
+from models import Exercise, User, Workout, WorkoutExercise, db
+
+
+def reference(app, obj):
+    """Encodes `obj` the way Flask's default provider answers a request"""
+    return DefaultJSONProvider(app).response(obj).get_data()
+
+
+def seed(client):
+    user = User(username="zoe", name="Zoe Unal", email="zoe@example.com")
+    exercises = [
+        Exercise(name="Squat", category="Strength", creator=user, custom_made=True),
+        Exercise(name="Run", category="Cardio", description="Easy pace"),
+    ]
+    workout = Workout(user=user)
+    workout.workout_exercises = [
+        WorkoutExercise(exercise=exercises[0], sets=5, repetitions=5, weights=102.5),
+        WorkoutExercise(exercise=exercises[1], sets=1, duration=30.25),
+    ]
+    db.session.add_all([user, *exercises, workout])
+    db.session.commit()
+
+
+def test_list_endpoints_match_make_json(client):
+    """Test the column-level path returns the bytes make_json + jsonify produced"""
+    seed(client)
+    app = client.application
+    expected = {
+        "/exercises": [
+            e.make_json() for e in Exercise.query.order_by(Exercise.name, Exercise.id)
+        ],
+        "/users": [u.make_json() for u in User.query],
+        "/workouts": {
+            "workouts": [w.make_json() for w in Workout.query],
+            "next_cursor": None,
+        },
+        "/workouts_exercises": [
+            we.make_json() for we in WorkoutExercise.query.order_by(WorkoutExercise.id)
+        ],
+    }
+    for path, obj in expected.items():
+        assert client.get(path).data == reference(app, obj), path
+
+
+def test_stdlib_fallback_matches(client, monkeypatch):
+    """Test the output does not change when orjson is not installed"""
+    seed(client)
+    with_orjson = client.get("/workouts_exercises").data
+    monkeypatch.setattr(serialization, "orjson", None)
+    assert client.get("/workouts_exercises").data == with_orjson
+
+
+def test_non_ascii_is_escaped(client):
+    """Test payloads with non-ASCII characters are escaped like the stdlib does"""
+    app = client.application
+    obj = {"name": "Zoë", "weights": [102.5, 0.1]}
+    assert app.json.response(obj).get_data() == reference(app, obj)
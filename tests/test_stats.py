@@ -0,0 +1,41 @@
+def test_user_stats(client, seed_history):
+    """Test totals, personal records and weekly trend computed in SQL"""
+    user_id = seed_history()
+
+    response = client.get(f"/users/{user_id}/stats")
+    assert response.status_code == 200
+    stats = response.json
+    assert stats["totals"]["sets"] == 18
+    assert stats["totals"]["tonnage"] == 25 * (100 + 110 + 105)
+    assert stats["totals"]["duration"] == 75
+    assert stats["totals"]["workouts"] == 3
+
+    squat = next(e for e in stats["exercises"] if e["name"] == "Squat")
+    assert squat["repetitions"] == 75
+    assert squat["personal_record"]["weights"] == 110
+    assert squat["personal_record"]["date"].startswith("2024-03-06")
+    run = next(e for e in stats["exercises"] if e["name"] == "Run")
+    assert run["personal_record"] is None
+
+    assert [week["period"] for week in stats["trend"]] == ["2024-03-04", "2024-03-11"]
+    assert [week["workouts"] for week in stats["trend"]] == [2, 1]
+
+
+def test_user_stats_range_and_bucket(client, seed_history):
+    """Test narrowing the stats to a date range and bucketing by month"""
+    user_id = seed_history()
+
+    response = client.get(f"/users/{user_id}/stats?from=2024-03-05&bucket=month")
+    assert response.json["totals"]["workouts"] == 2
+    assert response.json["trend"] == [
+        {
+            "period": "2024-03-01",
+            "sets": 12,
+            "repetitions": 50,
+            "tonnage": 25 * (110 + 105),
+            "duration": 45,
+            "workouts": 2,
+        }
+    ]
+
+    assert client.get(f"/users/{user_id}/stats?bucket=year").status_code == 400
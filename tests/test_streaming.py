@@ -0,0 +1,41 @@
+import json
+
+
+def read_ndjson(response):
+    return [json.loads(line) for line in response.data.decode().splitlines()]
+
+
+def test_stream_selected_by_query_parameter(client, seed_workouts):
+    """Test that ?stream=1 returns one JSON document per line"""
+    seed_workouts(3)
+
+    response = client.get("/workouts?stream=1")
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    workouts = read_ndjson(response)
+    assert len(workouts) == 3
+    assert all(len(workout["exercises"]) == 2 for workout in workouts)
+
+
+def test_stream_selected_by_accept_header(client, seed_workouts):
+    """Test that the NDJSON mode is negotiated through the Accept header"""
+    seed_workouts(2)
+
+    response = client.get(
+        "/workouts_exercises", headers={"Accept": "application/x-ndjson"}
+    )
+    assert response.mimetype == "application/x-ndjson"
+    assert len(read_ndjson(response)) == 4
+
+    response = client.get("/exercises", headers={"Accept": "*/*"})
+    assert response.mimetype == "application/json"
+    assert response.json[0]["name"] == "Squat"
+
+
+def test_stream_matches_json_listing(client, seed_workouts):
+    """Test that the stream and the JSON array carry the same records"""
+    seed_workouts(2)
+
+    for path in ("/users", "/exercises", "/workouts_exercises"):
+        streamed = read_ndjson(client.get(f"{path}?stream=1"))
+        assert streamed == client.get(path).json
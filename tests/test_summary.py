@@ -0,0 +1,127 @@
+from datetime import date, datetime
+from threading import Thread
+from uuid import UUID, uuid4
+
+import pytest
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from models import (
+    Exercise,
+    ExerciseVolume,
+    User,
+    UserVolume,
+    Workout,
+    WorkoutExercise,
+    db,
+)
+from summary import apply_changes, check, rebuild
+
+
+def volume(user_id, bucket, period):
+    return db.session.scalars(
+        select(UserVolume).where(
+            UserVolume.user_id == UUID(user_id),
+            UserVolume.bucket == bucket,
+            UserVolume.period == period,
+        )
+    ).one_or_none()
+
+
+def test_volumes_follow_orm_writes(client, seed_history):
+    """Test the volume tables are updated when workouts are added and deleted"""
+    user_id = seed_history()
+    with client.application.app_context():
+        week = volume(user_id, "week", date(2024, 3, 4))
+        assert (week.sets, week.workouts, week.tonnage) == (12, 2, 25 * 210)
+        assert check(db.session) == []
+
+        workout = db.session.scalars(
+            select(Workout).where(Workout.created_at >= date(2024, 3, 11))
+        ).one()
+        db.session.delete(workout)
+        db.session.commit()
+        assert volume(user_id, "week", date(2024, 3, 11)) is None
+        assert volume(user_id, "month", date(2024, 3, 1)).workouts == 2
+        assert check(db.session) == []
+
+
+def test_volumes_follow_batch_inserts(client, seed_history):
+    """Test rows inserted with the batch endpoint are folded into the volumes"""
+    user_id = seed_history()
+    with client.application.app_context():
+        workout_id = str(
+            db.session.scalars(select(Workout.id).order_by(Workout.created_at)).first()
+        )
+        exercise_id = str(
+            db.session.scalars(select(ExerciseVolume.exercise_id)).first()
+        )
+    response = client.post(
+        "/workouts_exercises/batch",
+        json={
+            "workout_exercises": [
+                {"workout_id": workout_id, "exercise_id": exercise_id, "sets": 3}
+            ]
+        },
+    )
+    assert response.status_code == 201
+    with client.application.app_context():
+        assert volume(user_id, "day", date(2024, 3, 4)).workouts == 1
+        assert check(db.session) == []
+
+
+def test_rebuild_repairs_volumes(client, seed_history):
+    """Test a rebuild restores volumes that drifted from the history"""
+    user_id = seed_history()
+    with client.application.app_context():
+        volume(user_id, "month", date(2024, 3, 1)).sets = 0
+        db.session.commit()
+        assert len(check(db.session)) == 1
+
+        rebuild(db.session)
+        db.session.commit()
+        assert check(db.session) == []
+        assert volume(user_id, "month", date(2024, 3, 1)).sets == 18
+
+
+def test_concurrent_writers_count_a_workout_once(client):
+    """Test two transactions adding the first exercises of a workout count it once"""
+    if db.engine.dialect.name != "postgresql":
+        pytest.skip("concurrent transactions need PostgreSQL")
+    user = User(username="testuser", name="Test User", email="test@example.com")
+    workout = Workout(user=user, created_at=datetime(2024, 3, 4, 18))
+    exercises = [
+        Exercise(name="Squat", category="Strength"),
+        Exercise(name="Run", category="Cardio"),
+    ]
+    db.session.add_all([user, workout, *exercises])
+    db.session.commit()
+    rows = [
+        {
+            "id": uuid4(),
+            "workout_id": workout.id,
+            "workout_created_at": workout.created_at,
+            "exercise_id": exercise.id,
+            "sets": 3,
+            "repetitions": 5,
+            "weights": 100.0,
+            "duration": None,
+        }
+        for exercise in exercises
+    ]
+
+    def add(session, row):
+        session.execute(insert(WorkoutExercise.__table__), row)
+        apply_changes(session, [(row, 1)])
+
+    with Session(db.engine) as first, Session(db.engine) as second:
+        add(first, rows[0])
+        writer = Thread(target=add, args=(second, rows[1]))
+        writer.start()
+        writer.join(timeout=1)
+        assert writer.is_alive()
+        first.commit()
+        writer.join()
+        second.commit()
+    assert volume(str(user.id), "day", date(2024, 3, 4)).workouts == 1
+    assert check(db.session) == []
@@ -0,0 +1,9 @@
+"""
+Entry point for production WSGI servers:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+from app import create_app
+
+app = create_app()